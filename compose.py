@@ -55,6 +55,7 @@ for p in (up_parser, stop_parser, ps_parser):
 	p.add_argument('--ilias', help='YAML file that specifies an external ILIAS installation to test against')
 	p.add_argument('--port', help='port to run TiltR on', nargs='?', const=1, type=int, default=11150)
 	p.add_argument('--embedded-ilias-port', help='port to run embedded ILIAS on', nargs='?', const=1, type=int, default=11145)
+	p.add_argument('--workers', help='number of concurrent exam sessions per machine container', type=int, default=1)
 
 up_parser.add_argument('n', nargs='?', type=int, default=1)
 up_parser.add_argument('--fork', help='fork up.py', action='store_true')
@@ -220,6 +221,7 @@ def set_argument_environ(args):
 		entrypoint_args.append('--debug')
 
 	entrypoint_args.extend(['--tiltr-port', str(args.port)])
+	entrypoint_args.extend(['--machine-workers', str(args.workers)])
 
 	if args.ilias:
 		embedded_ilias = False
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+import re
+import random as rnd
+
+import pytest
+
+from tiltr.data.implicit import implicit_text_to_number, implicit_text_to_number_xls, normalize_value
+
+
+# randomized checks of the optimized (precompiled, memoized) conversions
+# against the original, unoptimized ones.
+
+
+def _looks_like_a_number(x):
+	return re.match(r'^((\+|\-)?(([0-9]+)|([0-9]+\.)|(\.[0-9]+)|([0-9]+\.[0-9]+)))$', x) is not None
+
+
+def reference_implicit_text_to_number(value: str) -> str:
+	if len(value) >= 2 and value[0] == '+' and _looks_like_a_number(value[1:]):
+		value = value[1:]
+
+	if _looks_like_a_number(value):
+		while value.endswith("0") and value.count('.') == 1 and not value.endswith(".0"):
+			value = value[:-1]
+
+		integer_match = re.match(r'^((\+|\-)?[0-9]+)\.$', value)
+		if integer_match:
+			value = integer_match.group(1)
+		elif len(value) >= 2 and value.startswith("."):
+			value = "0" + value
+		elif value.endswith(".0"):
+			value = value[:-2]
+
+	return value
+
+
+def reference_implicit_text_to_number_xls(value: str) -> str:
+	try:
+		value = str(float(value))
+	except ValueError:
+		pass
+
+	if isinstance(value, str) and _looks_like_a_number(value):
+		while value.endswith("0") and value.count('.') == 1 and not value.endswith(".0"):
+			value = value[:-1]
+
+		if len(value) >= 2 and value[0] == '.' and value[-1] != '0':
+			value += "0"
+
+		if value == "0.0" or value == "-0.0" or value == "-0":
+			value = "0"
+
+	return value
+
+
+def _random_value(random) -> str:
+	# strings that look like numbers (in all the ways that matter here) or not.
+	alphabet = "0123456789.+-eE "
+	if random.random() < 0.2:
+		alphabet += "abcx\t"
+	return "".join(random.choice(alphabet) for _ in range(random.randint(0, 8)))
+
+
+_edge_cases = ["0", "0.0", "-0", "-0.0", "5.00", "5.", ".50", "+.5", "13.", "-.", ".", "+", "3E6", "nan", "inf"]
+
+
+def _values(seed, n=20000):
+	random = rnd.Random(seed)
+	return [_random_value(random) for _ in range(n)] + _edge_cases
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_implicit_text_to_number(seed):
+	for value in _values(seed):
+		assert implicit_text_to_number(value) == reference_implicit_text_to_number(value), value
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_implicit_text_to_number_xls(seed):
+	for value in _values(seed):
+		assert implicit_text_to_number_xls(value) == reference_implicit_text_to_number_xls(value), value
+
+
+@pytest.mark.parametrize("sloppy_whitespace", [False, True])
+def test_normalize_value(sloppy_whitespace):
+	for value in _values(0):
+		expected = reference_implicit_text_to_number_xls(value.strip() if sloppy_whitespace else value)
+		assert normalize_value(value, sloppy_whitespace) == expected, value
+
+
+def test_non_string_values():
+	for value in (0, 5, 0.5, 13.0, -0.0):
+		assert implicit_text_to_number_xls(value) == reference_implicit_text_to_number_xls(value)
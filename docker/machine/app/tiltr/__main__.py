@@ -21,3 +21,12 @@ if sys.argv[1] == "--master":
 elif sys.argv[1] == "--machine":
 	from .http.machine import run_machine
 	run_machine()
+elif sys.argv[1] == "--benchmark":
+	from .driver.benchmark import run_benchmark_cli
+	run_benchmark_cli()
+elif sys.argv[1] == "--benchmark-scoring":
+	from .question.benchmark import run_scoring_benchmark_cli
+	run_scoring_benchmark_cli()
+elif sys.argv[1] == "--fuzz-scoring":
+	from .question.fuzz import run_fuzz_cli
+	run_fuzz_cli()
@@ -5,11 +5,13 @@
 # GPLv3, see LICENSE
 #
 
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
 import re
 import random as rnd
 
+import numpy
+
 from tiltr.question.coverage import Coverage
 
 from ..data.settings import Settings, Workarounds
@@ -51,6 +53,57 @@ def get_random_chars(allow_newlines: bool, allow_dollar: bool, allow_clamps: boo
 	return random_chars
 
 
+class TextGenerator:
+	# draws random texts from an alphabet as returned by get_random_chars(). instead
+	# of one random.choice() per character, we draw whole batches of indices from a
+	# numpy generator. the generator is seeded from a context's random, so texts are
+	# as deterministic (and as replayable) as everything else drawn from it.
+
+	def __init__(self, seed: int):
+		self.generator = numpy.random.Generator(numpy.random.PCG64(seed))
+		self.alphabets = dict()
+
+	def _alphabet(self, random_chars: List[str]):
+		key = tuple(random_chars)
+		alphabet = self.alphabets.get(key)
+		if alphabet is None:
+			lengths = [len(p) for p in random_chars]
+			# components that may start a text that must not look like a number.
+			leading = [not (p.isdigit() or p == '.') for p in random_chars]
+			singles = [p for p in random_chars if len(p) == 1]
+			alphabet = (list(random_chars), lengths, leading, singles, [p for p in singles if not (p.isdigit() or p == '.')])
+			self.alphabets[key] = alphabet
+		return alphabet
+
+	def text(self, n: int, random_chars: List[str], allow_numbers: bool) -> str:
+		# same semantics as picking components one by one: components that do not
+		# fit into the remaining size are skipped, as are number-like first ones.
+		components, lengths, leading, _, _ = self._alphabet(random_chars)
+		parts = []
+		n_chars = 0
+		while n_chars < n:
+			for i in self.generator.integers(0, len(components), size=2 * (n - n_chars) + 8).tolist():
+				if n_chars == 0 and not allow_numbers and not leading[i]:
+					continue
+				if n_chars + lengths[i] <= n:
+					parts.append(components[i])
+					n_chars += lengths[i]
+					if n_chars >= n:
+						break
+		return "".join(parts)
+
+	def chars(self, n: int, random_chars: List[str], allow_numbers: bool, numbers_p: float) -> List[str]:
+		# n texts of size 1 each, i.e. _random_text(1, ...) n times over.
+		_, _, _, singles, leading_singles = self._alphabet(random_chars)
+		pool = singles if allow_numbers else leading_singles
+		picked = self.generator.integers(0, len(pool), size=n).tolist()
+		if not allow_numbers or numbers_p <= 0:
+			return [pool[i] for i in picked]
+		digits = self.generator.integers(0, 10, size=n).tolist()
+		numbers = (self.generator.random(size=n) < numbers_p).tolist()
+		return [str(d) if is_number else pool[i] for i, d, is_number in zip(picked, digits, numbers)]
+
+
 class TestContext:
 	settings: Settings
 	workarounds: Workarounds
@@ -82,25 +135,28 @@ class TestContext:
 		self.language = language
 		self.ilias_version = ilias_version
 
-	def _random_text(self, n: int, random_chars: List[str], allow_numbers: bool=True) -> str:
-		if allow_numbers and self.random.random() < self.settings.numbers_in_text_fields_p:
-			return random_number(self.random, n)
-		else:
-			components = list()
-
-			n_chars = 0
-			while n_chars < n:
-				p = self.random.choice(random_chars)
+	@property
+	def random(self) -> rnd.Random:
+		return self._random
 
-				if n_chars == 0 and not allow_numbers:
-					if p.isdigit() or p == '.':
-						continue
+	@random.setter
+	def random(self, random: rnd.Random):
+		# a new random (e.g. for recording or replaying) means a new text stream.
+		self._random = random
+		self._text_generator = None
 
-				if n_chars + len(p) <= n:
-					components.append(p)
-					n_chars += len(p)
+	@property
+	def text_generator(self) -> TextGenerator:
+		# seeded lazily, so that the seed comes from whatever random is active.
+		if self._text_generator is None:
+			self._text_generator = TextGenerator(self.random.getrandbits(64))
+		return self._text_generator
 
-			return "".join(components)
+	def _random_text(self, n: int, random_chars: List[str], allow_numbers: bool=True) -> str:
+		if allow_numbers and self.random.random() < float(self.settings.numbers_in_text_fields_p):
+			return random_number(self.random, n)
+		else:
+			return self.text_generator.text(n, random_chars, allow_numbers)
 
 	def strip_whitespace(self, value: str) -> str:
 		return self.workarounds.strip_whitespace(value)
@@ -143,6 +199,13 @@ class TestContext:
 
 		return text
 
+	def pregenerate_answers(self, questions: Dict[str, 'Question'], n: int) -> List[Dict]:
+		# n complete sets of random answers for an exam, drawn up front, e.g. for load
+		# tests or offline fuzzing. answers are as returned by get_random_answer().
+		return [dict(
+			(title, question.get_random_answer(self))
+			for title, question in questions.items()) for _ in range(n)]
+
 
 class RegressionContext(TestContext):
 	def __init__(self, seed, *args):
@@ -159,20 +222,27 @@ class RegressionContext(TestContext):
 				special += c
 		if len(special) == 0:
 			return self._random_text(size, random_chars, allow_numbers)
-		s = ""
-		while len(s) < size:
-			if len(s) % len(special) == 0:
-				s += self._random_text(1, random_chars, allow_numbers)
+
+		# every len(special)-th character is random, the others cycle through special.
+		k = len(special)
+		randoms = self.text_generator.chars(
+			(size + k - 1) // k, random_chars, allow_numbers,
+			float(self.settings.numbers_in_text_fields_p))
+		s = []
+		for i in range(size):
+			if i % k == 0:
+				s.append(randoms[i // k])
 			else:
-				s += special[0]
-				special = special[1:] + special[:1]
-		return s
+				s.append(special[(i - i // k - 1) % k])
+		return "".join(s)
 
 
 class RandomContext(TestContext):
 	def __init__(self, *args):
 		super().__init__(*args)
-		self.random = rnd.SystemRandom()
+		# seeded once from the system's entropy source, instead of asking it for
+		# every single draw as SystemRandom does.
+		self.random = rnd.Random(rnd.SystemRandom().getrandbits(128))
 
 	def prefer_text(self) -> bool:
 		return False
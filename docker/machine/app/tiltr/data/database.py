@@ -18,14 +18,15 @@ import pytz
 
 from tiltr.question.coverage import Coverage
 
+from .runlog import expand_files
+
 
 class DB:
-	def __init__(self):
-		pass
+	def __init__(self, path=None):
+		self.path = path or os.path.join("/tiltr/tmp", "results.db")
 
 	def __enter__(self):
-		db_path = os.path.join("/tiltr/tmp", "results.db")
-		self.db = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
+		self.db = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES)
 
 		c = self.db.cursor()
 		c.execute("CREATE TABLE IF NOT EXISTS results (created TIMESTAMP, batch TEXT PRIMARY KEY, success TEXT, files BLOB, nusers INTEGER, elapsed INTEGER)")
@@ -33,7 +34,11 @@ class DB:
 		c.execute("CREATE TABLE IF NOT EXISTS performance (id INTEGER PRIMARY KEY AUTOINCREMENT, dt INTEGER)")
 		c.execute("CREATE TABLE IF NOT EXISTS coverage_cases (id INTEGER PRIMARY KEY AUTOINCREMENT, question VARCHAR(255), name TEXT, UNIQUE(name))")
 		c.execute("CREATE TABLE IF NOT EXISTS coverage_occurrences (id INTEGER PRIMARY KEY AUTOINCREMENT, question VARCHAR(255), name TEXT, UNIQUE(name))")
+		c.execute("CREATE TABLE IF NOT EXISTS retries (id INTEGER PRIMARY KEY AUTOINCREMENT, operation TEXT, reason TEXT, attempt INTEGER, delay INTEGER)")
+		c.execute("CREATE TABLE IF NOT EXISTS spans (batch TEXT PRIMARY KEY, spans TEXT)")
+		c.execute("CREATE TABLE IF NOT EXISTS load_reports (created TIMESTAMP, report TEXT)")
 		c.execute("CREATE TABLE IF NOT EXISTS longterm (created TIMESTAMP, success INTEGER, detail TEXT, nusers INTEGER)")
+		c.execute("CREATE TABLE IF NOT EXISTS checkpoints (created TIMESTAMP, batch TEXT, phase TEXT, data TEXT, PRIMARY KEY(batch, phase))")
 
 		c.execute("CREATE INDEX IF NOT EXISTS index_results_created ON results(created)")
 		c.execute("CREATE INDEX IF NOT EXISTS index_longterm_created ON longterm(created)")
@@ -73,6 +78,27 @@ class DB:
 		self.db.commit()
 		c.close()
 
+	def put_retry_data(self, retries: List[Dict]):
+		c = self.db.cursor()
+		c.executemany("INSERT INTO retries(operation, reason, attempt, delay) VALUES (?, ?, ?, ?)",
+			[(r["operation"], r["reason"], r["attempt"], 1000 * r["delay"]) for r in retries])
+		self.db.commit()
+		c.close()
+
+	def put_spans(self, batch_id: str, spans: List[Dict]):
+		c = self.db.cursor()
+		c.execute("INSERT OR REPLACE INTO spans(batch, spans) VALUES (?, ?)",
+			(batch_id.encode("utf-8"), json.dumps(spans).encode("utf-8")))
+		self.db.commit()
+		c.close()
+
+	def put_load_report(self, report: Dict):
+		c = self.db.cursor()
+		c.execute("INSERT INTO load_reports(created, report) VALUES (?, ?)",
+			(datetime.datetime.now(), json.dumps(report).encode("utf-8")))
+		self.db.commit()
+		c.close()
+
 	def put_coverage_data(self, coverage: Coverage):
 		c = self.db.cursor()
 		c.executemany("INSERT OR IGNORE INTO coverage_cases(question, name) VALUES (?, ?)",
@@ -160,6 +186,66 @@ class DB:
 
 		return [row[0] / 1000.0 for row in rows]
 
+	def get_retry_data(self) -> List[Dict]:
+		c = self.db.cursor()
+		c.execute("SELECT operation, reason, COUNT(*), SUM(delay) FROM retries GROUP BY operation, reason")
+		rows = c.fetchall()
+		c.close()
+
+		return [dict(
+			operation=operation,
+			reason=reason,
+			count=count,
+			delay=(delay or 0) / 1000.0) for operation, reason, count, delay in rows]
+
+	def get_spans(self, batch_id: str) -> List[Dict]:
+		c = self.db.cursor()
+		c.execute("SELECT spans FROM spans WHERE batch=?", (batch_id.encode("utf-8"),))
+		row = c.fetchone()
+		c.close()
+
+		if row is None:
+			return None
+		return json.loads(row[0].decode("utf-8"))
+
+	def put_checkpoint(self, batch_id: str, phase: str, data: str):
+		c = self.db.cursor()
+		c.execute("INSERT OR REPLACE INTO checkpoints(created, batch, phase, data) VALUES (?, ?, ?, ?)",
+			(datetime.datetime.now(), batch_id.encode("utf-8"), phase.encode("utf-8"), data.encode("utf-8")))
+		self.db.commit()
+		c.close()
+
+	def get_checkpoints(self, batch_id: str) -> Dict[str, str]:
+		c = self.db.cursor()
+		c.execute("SELECT phase, data FROM checkpoints WHERE batch=?", (batch_id.encode("utf-8"),))
+		rows = c.fetchall()
+		c.close()
+
+		return dict((phase.decode("utf-8"), data.decode("utf-8")) for phase, data in rows)
+
+	def get_unfinished_batches(self) -> List[str]:
+		# batches with checkpoints, i.e. runs that never got to store their results.
+		c = self.db.cursor()
+		c.execute("SELECT batch, MIN(created) FROM checkpoints GROUP BY batch ORDER BY MIN(created)")
+		rows = c.fetchall()
+		c.close()
+
+		return [row[0].decode("utf-8") for row in rows]
+
+	def delete_checkpoints(self, batch_id: str):
+		c = self.db.cursor()
+		c.execute("DELETE FROM checkpoints WHERE batch=?", (batch_id.encode("utf-8"),))
+		self.db.commit()
+		c.close()
+
+	def get_load_reports(self) -> List[Dict]:
+		c = self.db.cursor()
+		c.execute("SELECT report FROM load_reports ORDER BY created")
+		rows = c.fetchall()
+		c.close()
+
+		return [json.loads(row[0].decode("utf-8")) for row in rows]
+
 	def get_longterm_data(self) -> List[Tuple]:
 		c = self.db.cursor()
 		c.execute("SELECT created, success, nusers FROM longterm ORDER BY created")
@@ -187,10 +273,23 @@ class DB:
 		c.close()
 		return files
 
+	def get_batch_files(self, batch_id: str) -> Dict[str, bytes]:
+		c = self.db.cursor()
+		c.execute("SELECT files FROM results WHERE batch=?", (batch_id.encode("utf-8"),))
+		row = c.fetchone()
+		c.close()
+		if row is None:
+			return dict()
+		files = json.loads(row[0].decode("utf-8"))
+		return expand_files(dict((k, base64.b64decode(v)) for k, v in files.items()))
+
 	def clear(self):
 		c = self.db.cursor()
 		c.execute("DROP TABLE results")
 		c.execute("DROP TABLE performance")
+		c.execute("DROP TABLE retries")
+		c.execute("DROP TABLE spans")
+		c.execute("DROP TABLE load_reports")
 		c.execute("DROP TABLE coverage_cases")
 		c.execute("DROP TABLE coverage_occurrences")
 		self.db.commit()
@@ -201,7 +300,9 @@ class DB:
 		c.execute("SELECT files FROM results WHERE batch=?", (batch_id.encode("utf-8"),))
 		files_json = c.fetchone()[0]
 
+		files = json.loads(files_json.decode("utf-8"))
+		files = expand_files(dict((k, base64.b64decode(v)) for k, v in files.items()))
+
 		with zipfile.ZipFile(file, "w") as z:
-			files = json.loads(files_json.decode("utf-8"))
 			for k, v in files.items():
-				z.writestr('/' + k, base64.b64decode(v))
+				z.writestr('/' + k, v)
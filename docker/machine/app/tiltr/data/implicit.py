@@ -6,24 +6,42 @@
 #
 
 import re
+import functools
+
+# these conversions run for every value we compare, so patterns are compiled
+# once and results are memoized (values repeat a lot: 0, 1, scores, ...).
+
+_number_pattern = re.compile(r'^((\+|\-)?(([0-9]+)|([0-9]+\.)|(\.[0-9]+)|([0-9]+\.[0-9]+)))$')
+_integer_pattern = re.compile(r'^((\+|\-)?[0-9]+)\.$')
+
+_cache_size = 65536
 
 
 def looks_like_a_number(x: str) -> bool:
-	m = re.match(r'^((\+|\-)?(([0-9]+)|([0-9]+\.)|(\.[0-9]+)|([0-9]+\.[0-9]+)))$', x)
-	return m is not None
+	return _number_pattern.match(x) is not None
+
+
+def _strip_trailing_zeros(value: str) -> str:
+	# e.g. 0.637010 -> 0.63701, but keep 5.0
+	if value.count('.') == 1 and not value.endswith(".0"):
+		stripped = value.rstrip("0")
+		if stripped.endswith(".") and value != stripped:
+			# rstrip went one too far, e.g. 5.00 -> 5. should be 5.0
+			stripped += "0"
+		value = stripped
+	return value
 
 
+@functools.lru_cache(maxsize=_cache_size)
 def implicit_text_to_number(value: str) -> str:
 	if len(value) >= 2 and value[0] == '+' and looks_like_a_number(value[1:]):
 		# e.g. +9 -> 9
 		value = value[1:]
 
 	if looks_like_a_number(value):
-		while value.endswith("0") and value.count('.') == 1 and not value.endswith(".0"):
-			# e.g. 0.637010 -> 0.63701
-			value = value[:-1]
+		value = _strip_trailing_zeros(value)
 
-		integer_match = re.match(r'^((\+|\-)?[0-9]+)\.$', value)
+		integer_match = _integer_pattern.match(value)
 		if integer_match:
 			# e.g. 13. -> 13, but do not convert -. -> -
 			value = integer_match.group(1)
@@ -37,21 +55,16 @@ def implicit_text_to_number(value: str) -> str:
 	return value
 
 
-def implicit_text_to_number_xls(value: str) -> str:
-	# there are also several implicit conversions taking place when taking the number
-	# from ILIAS into the XLS, but they are different from the ones inside ILIAS itself,
-	# i.e. from implicit_text_to_number.
-
+@functools.lru_cache(maxsize=_cache_size)
+def _implicit_text_to_number_xls(value: str) -> str:
 	# also catch more esoteric conversions like 3E6 -> 3000000
 	try:
 		value = str(float(value))
 	except ValueError:
 		pass
 
-	if isinstance(value, str) and looks_like_a_number(value):
-		while value.endswith("0") and value.count('.') == 1 and not value.endswith(".0"):
-			# e.g. 0.637010 -> 0.63701
-			value = value[:-1]
+	if looks_like_a_number(value):
+		value = _strip_trailing_zeros(value)
 
 		if len(value) >= 2 and value[0] == '.' and value[-1] != '0':
 			# e.g. .94853 -> .948530
@@ -63,3 +76,26 @@ def implicit_text_to_number_xls(value: str) -> str:
 			value = "0"
 
 	return value
+
+
+def implicit_text_to_number_xls(value: str) -> str:
+	# there are also several implicit conversions taking place when taking the number
+	# from ILIAS into the XLS, but they are different from the ones inside ILIAS itself,
+	# i.e. from implicit_text_to_number.
+	if isinstance(value, str):
+		return _implicit_text_to_number_xls(value)
+
+	try:
+		value = str(float(value))
+	except ValueError:
+		return value
+	return _implicit_text_to_number_xls(value)
+
+
+@functools.lru_cache(maxsize=_cache_size)
+def normalize_value(value: str, sloppy_whitespace: bool) -> str:
+	# the normalization used when comparing exported and recorded values, keyed
+	# by the workarounds it depends on (see Workarounds.normalize).
+	if sloppy_whitespace:
+		value = value.strip()
+	return _implicit_text_to_number_xls(value)
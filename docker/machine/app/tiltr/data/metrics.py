@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+from typing import Dict, List, Tuple
+
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+
+# labelled latency histograms (e.g. by question type, operation, machine, ILIAS
+# version and browser). machines record into their own registry and ship it
+# back inside the Result; the master merges everything into one registry, which
+# gets exposed in Prometheus' text exposition format.
+
+default_buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+	def __init__(self, buckets: Tuple = default_buckets):
+		self.buckets = tuple(buckets)
+		self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+		self.sum = 0
+		self.count = 0
+
+	def observe(self, value: float):
+		self.counts[bisect.bisect_left(self.buckets, value)] += 1
+		self.sum += value
+		self.count += 1
+
+	def merge(self, other: 'Histogram'):
+		assert self.buckets == other.buckets
+		self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+		self.sum += other.sum
+		self.count += other.count
+
+	def to_dict(self) -> Dict:
+		return dict(buckets=list(self.buckets), counts=self.counts, sum=self.sum, count=self.count)
+
+	@staticmethod
+	def from_dict(data: Dict) -> 'Histogram':
+		histogram = Histogram(data["buckets"])
+		histogram.counts = list(data["counts"])
+		histogram.sum = data["sum"]
+		histogram.count = data["count"]
+		return histogram
+
+
+def _escape(value) -> str:
+	return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Tuple, extra: Tuple = ()) -> str:
+	items = list(labels) + list(extra)
+	if not items:
+		return ""
+	return "{%s}" % ",".join('%s="%s"' % (k, _escape(v)) for k, v in items)
+
+
+class MetricsRegistry:
+	def __init__(self):
+		self.histograms = dict()
+		self.descriptions = dict()
+		self.labels = dict()
+		self.mutex = threading.Lock()
+
+	def set_labels(self, **labels):
+		# labels added to all observations of this process from now on.
+		self.labels = labels
+
+	def describe(self, name: str, description: str):
+		self.descriptions[name] = description
+
+	def observe(self, name: str, value: float, **labels):
+		all_labels = dict(self.labels)
+		all_labels.update(labels)
+		key = (name, tuple(sorted((k, str(v)) for k, v in all_labels.items())))
+
+		with self.mutex:
+			histogram = self.histograms.get(key)
+			if histogram is None:
+				histogram = Histogram()
+				self.histograms[key] = histogram
+			histogram.observe(value)
+
+	@contextmanager
+	def measure(self, name: str, **labels):
+		t0 = time.time()
+		try:
+			yield
+		finally:
+			self.observe(name, time.time() - t0, **labels)
+
+	def drain(self) -> List[Dict]:
+		with self.mutex:
+			histograms = self.histograms
+			self.histograms = dict()
+
+		return [dict(name=name, labels=list(labels), **histogram.to_dict())
+			for (name, labels), histogram in histograms.items()]
+
+	def merge(self, data: List[Dict]):
+		with self.mutex:
+			for entry in data:
+				key = (entry["name"], tuple(tuple(label) for label in entry["labels"]))
+				histogram = Histogram.from_dict(entry)
+				if key in self.histograms:
+					self.histograms[key].merge(histogram)
+				else:
+					self.histograms[key] = histogram
+
+	def render(self) -> str:
+		with self.mutex:
+			items = sorted((key, Histogram.from_dict(h.to_dict())) for key, h in self.histograms.items())
+
+		lines = []
+		last_name = None
+		for (name, labels), histogram in items:
+			if name != last_name:
+				if name in self.descriptions:
+					lines.append("# HELP %s %s" % (name, self.descriptions[name]))
+				lines.append("# TYPE %s histogram" % name)
+				last_name = name
+
+			cumulative = 0
+			for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+				cumulative += count
+				lines.append("%s_bucket%s %d" % (name, _format_labels(labels, (("le", bound),)), cumulative))
+			lines.append("%s_sum%s %f" % (name, _format_labels(labels), histogram.sum))
+			lines.append("%s_count%s %d" % (name, _format_labels(labels), histogram.count))
+
+		return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+metrics.describe("tiltr_answer_seconds", "Time spent entering or verifying one answer in the browser.")
+metrics.describe("tiltr_navigation_seconds", "Time spent saving and navigating between questions.")
+metrics.describe("tiltr_export_seconds", "Time spent exporting results from ILIAS.")
@@ -8,10 +8,16 @@
 from typing import Dict
 
 import io
+import os
 import re
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, Future
 from decimal import *
 
-from pdfminer3.layout import LAParams, LTTextBoxHorizontal
+from pdfminer3.layout import LAParams, LTTextBoxHorizontal, LTChar
 from pdfminer3.converter import PDFPageAggregator
 from pdfminer3.pdfparser import PDFParser
 from pdfminer3.pdfdocument import PDFDocument
@@ -20,6 +26,32 @@ from pdfminer3.pdfinterp import PDFResourceManager
 from pdfminer3.pdfinterp import PDFPageInterpreter
 
 
+_order_name = "Reihenfolge"  # FIXME localize
+
+
+class _ResultTableAggregator(PDFPageAggregator):
+	# layout analysis is the expensive part of pdfminer. we only need the results
+	# table, so we drop everything above the table's header before analyzing.
+
+	def end_page(self, page):
+		objs = self.cur_item._objs
+
+		text = []
+		chars = []
+		for obj in objs:
+			if isinstance(obj, LTChar):
+				text.append(obj.get_text())
+				chars.append(obj)
+
+		index = "".join(text).find(_order_name) if all(len(t) == 1 for t in text) else -1
+
+		if index >= 0:
+			header_top = max(c.y1 for c in chars[index:index + len(_order_name)])
+			self.cur_item._objs = [obj for obj in objs if obj.y0 <= header_top]
+
+		super().end_page(page)
+
+
 def _extract_pdf_scores(stream: io.BytesIO) -> Dict[str, Dict[str, Decimal]]:
 	# these laparams seem to work ok with the ILIAS default PDF
 	# formatting as well as with UR custom styling.
@@ -36,7 +68,7 @@ def _extract_pdf_scores(stream: io.BytesIO) -> Dict[str, Dict[str, Decimal]]:
 
 	rsrcmgr = PDFResourceManager()
 
-	device = PDFPageAggregator(rsrcmgr, laparams=laparams)
+	device = _ResultTableAggregator(rsrcmgr, laparams=laparams)
 	interpreter = PDFPageInterpreter(rsrcmgr, device)
 
 	parser = PDFParser(stream)
@@ -50,7 +82,7 @@ def _extract_pdf_scores(stream: io.BytesIO) -> Dict[str, Dict[str, Decimal]]:
 	boxes = []
 	table_head_y = None	 # y position of result table header
 
-	order_name = "Reihenfolge"  # FIXME localize
+	order_name = _order_name
 
 	for element in layout:
 		if isinstance(element, LTTextBoxHorizontal):
@@ -85,10 +117,62 @@ def _extract_pdf_scores(stream: io.BytesIO) -> Dict[str, Dict[str, Decimal]]:
 	return scores
 
 
+def _extract_pdf_scores_from_bytes(data: bytes) -> Dict[str, Dict[str, Decimal]]:
+	return _extract_pdf_scores(io.BytesIO(data))
+
+
+class _ExtractionService:
+	# pdfminer is pure Python and CPU-bound, so we parse PDFs in worker processes
+	# as soon as they arrive. results are cached by content hash, so identical
+	# re-exports are only parsed once.
+
+	def __init__(self, max_cached=256):
+		self.executor = None
+		self.cache = OrderedDict()
+		self.max_cached = max_cached
+		self.mutex = threading.Lock()
+
+	def _discard_failed(self, digest, future):
+		if future.exception() is not None:
+			with self.mutex:
+				if self.cache.get(digest) is future:
+					del self.cache[digest]
+
+	def submit(self, data: bytes) -> Future:
+		digest = hashlib.sha256(data).hexdigest()
+
+		with self.mutex:
+			future = self.cache.get(digest)
+			if future is not None:
+				self.cache.move_to_end(digest)
+				return future
+
+			if self.executor is None:
+				# don't fork the multithreaded master, children might inherit held locks.
+				self.executor = ProcessPoolExecutor(
+					max_workers=min(4, os.cpu_count() or 1),
+					mp_context=multiprocessing.get_context("forkserver"))
+
+			future = self.executor.submit(_extract_pdf_scores_from_bytes, data)
+			self.cache[digest] = future
+			while len(self.cache) > self.max_cached:
+				self.cache.popitem(last=False)
+
+		future.add_done_callback(lambda f: self._discard_failed(digest, f))
+		return future
+
+
+_service = _ExtractionService()
+
+
 class PDF:
 	def __init__(self, data: bytes):
 		self.bytes = data
-		self.scores = _extract_pdf_scores(io.BytesIO(data))
+		self._scores = _service.submit(data)
+
+	@property
+	def scores(self) -> Dict[str, Dict[str, Decimal]]:
+		return self._scores.result()
 
 
 if __name__ == "__main__":
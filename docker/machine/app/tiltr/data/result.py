@@ -5,8 +5,9 @@
 # GPLv3, see LICENSE
 #
 
-from typing import Dict, Any, Callable, Union, Tuple, Iterator
+from typing import Dict, List, Any, Callable, Union, Tuple, Iterator
 
+import sys
 import json
 import base64
 import re
@@ -16,6 +17,7 @@ from decimal import *
 
 from enum import Enum
 from collections import defaultdict
+from collections.abc import MutableMapping
 
 from .exceptions import ErrorDomain, most_severe
 from .settings import Workarounds
@@ -90,6 +92,95 @@ def _normalize_json(s: str) -> str:
 		return '-illegal-json-' + s
 
 
+def _intern_key(key: Tuple) -> Tuple:
+	return tuple(sys.intern(c) if isinstance(c, str) else c for c in key)
+
+
+class PropertyStore(MutableMapping):
+	# the properties of a Result, keyed by tuples such as ("question", title,
+	# "answer", dimension...) or (channel, "question", title, "score_reached").
+	# key components are interned, since the same few strings occur in every
+	# key. besides the flat mapping, we keep answers indexed by question and
+	# reached scores as one column per channel, so that lookups for a question
+	# or channel don't need to scan all properties.
+
+	def __init__(self, items=None):
+		self._data = dict()
+		self._answers = defaultdict(dict)  # question title -> dimensions -> value
+		self._scores = defaultdict(dict)  # channel -> question title -> value
+		self._normalized = None
+		if items is not None:
+			for k, v in items:
+				self[k] = v
+
+	@staticmethod
+	def _is_answer(key: Tuple) -> bool:
+		return len(key) > 3 and key[0] == "question" and key[2] == "answer"
+
+	@staticmethod
+	def _is_score(key: Tuple) -> bool:
+		return len(key) == 4 and key[1] == "question" and key[3] == "score_reached"
+
+	def __getitem__(self, key):
+		return self._data[key]
+
+	def __setitem__(self, key, value):
+		key = _intern_key(key)
+		self._data[key] = value
+		if self._is_answer(key):
+			self._answers[key[1]][key[3:]] = value
+		elif self._is_score(key):
+			self._scores[key[0]][key[2]] = value
+		self._normalized = None
+
+	def __delitem__(self, key):
+		del self._data[key]
+		if self._is_answer(key):
+			answers = self._answers[key[1]]
+			del answers[key[3:]]
+			if not answers:
+				del self._answers[key[1]]
+		elif self._is_score(key):
+			del self._scores[key[0]][key[2]]
+		self._normalized = None
+
+	def __iter__(self):
+		return iter(self._data)
+
+	def __len__(self):
+		return len(self._data)
+
+	def __contains__(self, key):
+		return key in self._data
+
+	def get(self, key, default=None):
+		return self._data.get(key, default)
+
+	def items(self):
+		return self._data.items()
+
+	def keys(self):
+		return self._data.keys()
+
+	def values(self):
+		return self._data.values()
+
+	def answers(self, question_title: str) -> Dict[Tuple, Any]:
+		return self._answers.get(question_title, dict())
+
+	def questions(self) -> Iterator[Tuple[str, Dict[Tuple, Any]]]:
+		return self._answers.items()
+
+	def scores(self, channel: str) -> Dict[str, Any]:
+		return self._scores.get(channel, dict())
+
+	def normalized(self) -> Dict[Tuple, Any]:
+		if self._normalized is None:
+			self._normalized = dict(
+				(tuple(str(k) for k in key), value) for key, value in self._data.items())
+		return self._normalized
+
+
 class Origin(Enum):
 	recorded = 0
 	exported = 1
@@ -149,28 +240,56 @@ class Result:
 		return s
 
 	def scores(self, channel: str = "xls") -> Iterator[MaybeDecimal]:
+		for v in self.properties.scores(channel).values():
+			yield MaybeDecimal(v)
+
+	def _serialized_properties(self) -> Dict:
+		# keys are encoded as indices into a table of their (mostly repeated) string
+		# components; other components are wrapped in a list.
+		strings = []
+		string_index = dict()
+
+		def encode_component(c):
+			if not isinstance(c, str):
+				return [c]
+			i = string_index.get(c)
+			if i is None:
+				i = len(strings)
+				string_index[c] = i
+				strings.append(c)
+			return i
+
+		keys = []
+		values = []
 		for k, v in self.properties.items():
-			if len(k) == 4 and k[0] == channel and k[1] == "question" and k[3] == "score_reached":
-				yield MaybeDecimal(v)
-
-	def _serialized_properties(self) -> Iterator[Tuple]:
-		for k, v in self.properties.items():
+			keys.append([encode_component(c) for c in k])
 			if isinstance(v, MaybeDecimal):
-				yield k, ("MaybeDecimal", v.encode())
+				values.append(("MaybeDecimal", v.encode()))
 			else:
-				yield k, v
+				values.append(v)
+
+		return dict(strings=strings, keys=keys, values=values)
 
 	@staticmethod
-	def _deserialized_properties(items) -> Dict:
-		properties = dict()
+	def _deserialized_value(v):
+		if isinstance(v, list) and v[0] == "MaybeDecimal":
+			return MaybeDecimal.decode(v[1])
+		else:
+			return v
 
-		for k, v in items:
-			if isinstance(v, list) and v[0] == "MaybeDecimal":
-				properties[k] = MaybeDecimal.decode(v[1])
-			else:
-				properties[k] = v
+	@staticmethod
+	def _deserialized_properties(data) -> PropertyStore:
+		if isinstance(data, list):  # older format: a list of (key, value)
+			return PropertyStore((tuple(k), Result._deserialized_value(v)) for k, v in data)
 
-		return properties
+		strings = data["strings"]
+
+		def decode_component(c):
+			return c[0] if isinstance(c, list) else strings[c]
+
+		return PropertyStore(
+			(tuple(decode_component(c) for c in k), Result._deserialized_value(v))
+			for k, v in zip(data["keys"], data["values"]))
 
 	def __init__(self, from_json: str = None, **kwargs):
 		from ..question.coverage import Coverage
@@ -178,31 +297,40 @@ class Result:
 		if from_json:
 			data = json.loads(from_json)
 			self.origin = Origin[data["origin"]]
-			self.properties = self._deserialized_properties((tuple(key), value) for key, value in data["properties"])
+			self.properties = self._deserialized_properties(data["properties"])
 			self.types = dict((tuple(key), value) for key, value in data["types"])
 			self.protocol = data["protocol"]
 			self.files = dict((k, base64.b64decode(v)) for k, v in data["files"].items())
 			self.performance = data["performance"]
+			self.retries = data.get("retries", [])
+			self.spans = data.get("spans", [])
+			self.metrics = data.get("metrics", [])
 			self.errors = data["errors"]
 			self.coverage = Coverage(from_dict=data["coverage"])
 		else:
 			self.origin = kwargs.get('origin', 'unknown')
-			self.properties = dict()
+			self.properties = PropertyStore()
 			self.types = dict()
 			self.protocol = []
 			self.files = kwargs.get('files', dict())
 			self.performance = []
+			self.retries = []
+			self.spans = []
+			self.metrics = []
 			self.errors = dict()
 			self.coverage = Coverage()
 
 	def to_json(self):
 		return json.dumps(dict(
 			origin=self.origin.name,
-			properties=list(self._serialized_properties()),
+			properties=self._serialized_properties(),
 			types=list(self.types.items()),
 			protocol=self.protocol,
 			files=dict((k, base64.b64encode(v).decode('utf8')) for k, v in self.files.items()),
 			performance=self.performance,
+			retries=self.retries,
+			spans=self.spans,
+			metrics=self.metrics,
 			errors=self.errors,
 			coverage=self.coverage.as_dict()))
 
@@ -228,12 +356,19 @@ class Result:
 			del self.properties[key]
 
 	def gather(self, key: Tuple):
+		if len(key) == 3 and key[0] == "question" and key[2] == "answer":
+			return dict(self.properties.answers(key[1]))
+
 		answers = dict()
 		for k, v in self.properties.items():
 			if k[:len(key)] == key:
 				answers[k[len(key):]] = v
 		return answers
 
+	def get_question_answers(self, question_title: str) -> Dict[Tuple, Any]:
+		# answer dimensions (tuples) and values for one question.
+		return self.properties.answers(question_title)
+
 	@staticmethod
 	def from_error(origin, domain, err, files=None):
 		r = Result(origin=origin, files=files or dict())
@@ -255,121 +390,181 @@ class Result:
 	def attach_performance_measurements(self, performance):
 		self.performance = performance
 
+	def attach_retries(self, retries: List[Dict]):
+		self.retries = retries
+
+	def attach_spans(self, spans: List[Dict]):
+		self.spans = spans
+
+	def attach_metrics(self, metrics: List[Dict]):
+		self.metrics = metrics
+
 	def attach_coverage(self, coverage: 'Coverage'):
 		self.coverage = coverage
 
 	def get_normalized_properties(self) -> Dict[Tuple, Any]:
-		return dict((tuple(str(k) for k in key), value) for key, value in self.properties.items())
+		return self.properties.normalized()
 
 	def get_answers(self) -> Dict[str, Dict]:
 		answers = defaultdict(dict)
-		for p, value in self.properties.items():
-			if p[0] == "question" and p[2] == "answer":
-				question_title = p[1]
-				dimension = p[3]
-				answers[question_title][dimension] = value
+		for question_title, dimensions in self.properties.questions():
+			for dimension, value in dimensions.items():
+				answers[question_title][dimension[0]] = value
 		return answers
 
-	def check_against(self, other: 'Result', report: Callable[[str], None], workarounds: Workarounds) -> bool:
-		all_ok = True
+	def diff(self, other: 'Result', workarounds: Workarounds) -> 'ResultDiff':
+		return ResultDiff(self, other, workarounds)
 
-		self_properties = self.get_normalized_properties()
-		other_properties = other.get_normalized_properties()
+	def check_against(
+		self, other: 'Result', report: Callable[[str], None], workarounds: Workarounds,
+		full_table: bool = True) -> bool:
 
-		keys = sorted(list(set(
-			list(self_properties.keys()) + list(other_properties.keys()))))
+		diff = self.diff(other, workarounds)
+		diff.report(report, full_table)
+		return diff.ok
 
-		table = Texttable()
-		table.set_deco(Texttable.HEADER)
-		table.set_cols_dtype(['t', 't', 't', 't'])
-		table.header(['OK?', 'KEY', self.get_origin().name.upper(), other.get_origin().name.upper()])
-		table.set_cols_width([10, 60, 20, 20])
-		table.set_header_align(['l', 'l', 'l', 'l'])
 
-		def ignore_key(k: Tuple) -> bool:
-			return k[0] == "results_tab" and workarounds.ignore_wrong_results_in_results_tab
+def _make_is_close(eps: Decimal = Decimal("0.01")):
+	def is_close(a: Union[str, MaybeDecimal], b: Union[str, MaybeDecimal]) -> bool:
+		a = MaybeDecimal(a)
+		b = MaybeDecimal(b)
 
-		def make_is_close(eps: Decimal = Decimal("0.01")):
-			def is_close(a: Union[str, MaybeDecimal], b: Union[str, MaybeDecimal]) -> bool:
-				a = MaybeDecimal(a)
-				b = MaybeDecimal(b)
+		if not a.valid() or not b.valid():
+			return False
 
-				if not a.valid() or not b.valid():
-					return False
+		try:
+			return abs(a.to_decimal() - b.to_decimal()) <= eps
+		except decimal.InvalidOperation:
+			print("could not compute is_close for (%s, %s)" % (a, b))
+			return False
+	return is_close
 
-				try:
-					return abs(a.to_decimal() - b.to_decimal()) <= eps
-				except decimal.InvalidOperation:
-					print("could not compute is_close for (%s, %s)" % (a, b))
-					return False
-			return is_close
 
-		def is_exactly_equal(a, b) -> bool:
-			return a == b
+class ResultDiff:
+	# compares the properties of two results. we only keep what's needed to
+	# decide (mismatches and counts); the full table of all properties is only
+	# rendered when asked for, as drawing it for every user and every round
+	# used to dominate post processing.
 
-		comparators = dict()
+	def __init__(self, a: Result, b: Result, workarounds: Workarounds):
+		self.origins = (a.get_origin().name.upper(), b.get_origin().name.upper())
 
-		if workarounds.inaccurate_percentage_rounding:
-			comparators[("statistics_tab", "percentage_reached")] = make_is_close()
-			comparators[("results_tab", "percentage_reached")] = make_is_close()
+		a_properties = a.get_normalized_properties()
+		b_properties = b.get_normalized_properties()
 
-		for k in keys:
-			value_self = "%s" % self_properties.get(k, None)
-			value_other = "%s" % other_properties.get(k, None)
+		# values repeat a lot (0, 1, scores), so normalize each distinct one once.
+		normalized = dict()
 
-			type_self = self.types.get(k, None)
-			type_other = self.types.get(k, None)
-			types = tuple(set(t for t in (type_self, type_other) if t is not None))
+		def normalize(value: str) -> str:
+			n = normalized.get(value)
+			if n is None:
+				n = workarounds.normalize(value)
+				normalized[value] = n
+			return n
 
-			value_self = workarounds.normalize(value_self)
-			value_other = workarounds.normalize(value_other)
+		self._normalize = normalize
 
-			if types == ('json',):
-				value_self = _normalize_json(value_self)
-				value_other = _normalize_json(value_other)
-			elif len(types) > 0:
-				raise RuntimeError("incompatible property data types")
+		comparators = dict()
+		if workarounds.inaccurate_percentage_rounding:
+			comparators[("statistics_tab", "percentage_reached")] = _make_is_close()
+			comparators[("results_tab", "percentage_reached")] = _make_is_close()
+
+		ignore_results_tab = workarounds.ignore_wrong_results_in_results_tab
+
+		self.rows = []  # (status, key, value a, value b, normalized); see _row_values().
+		self.mismatches = []
+		self.n_ok = 0
+		self.n_ignored = 0
 
-			is_equal = comparators.get(k, is_exactly_equal)
+		for k in sorted(set(a_properties.keys()) | set(b_properties.keys())):
+			value_a = "%s" % a_properties.get(k, None)
+			value_b = "%s" % b_properties.get(k, None)
 
-			if ignore_key(k):
+			# note that, as before, types only come from a.
+			value_type = a.types.get(k, None)
+			is_equal = comparators.get(k)
+
+			if k[0] == "results_tab" and ignore_results_tab:
 				status = "IGNORED"
-			elif is_equal(value_self, value_other):
-				status = "OK"
+				self.n_ignored += 1
+				self.rows.append((status, k, value_a, value_b, False))
+				continue
+
+			if value_type is None and is_equal is None and value_a == value_b:
+				# equal strings stay equal after normalization.
+				self.n_ok += 1
+				self.rows.append(("OK", k, value_a, value_b, False))
+				continue
+
+			value_a = normalize(value_a)
+			value_b = normalize(value_b)
+
+			if value_type == 'json':
+				value_a = _normalize_json(value_a)
+				value_b = _normalize_json(value_b)
+			elif value_type is not None:
+				raise RuntimeError("incompatible property data types")
+
+			if (is_equal or str.__eq__)(value_a, value_b):
+				self.n_ok += 1
+				self.rows.append(("OK", k, value_a, value_b, True))
 			else:
-				status = "FAIL"
-				all_ok = False
+				self.mismatches.append((k, value_a, value_b))
+				self.rows.append(("FAIL", k, value_a, value_b, True))
+
+		self.errors = []
+		for r in (a, b):
+			for type, err in r.errors.items():
+				self.errors.append("error %s:%s in %s" % (type, err, r.origin))
+
+	@property
+	def ok(self) -> bool:
+		return not self.mismatches and not self.errors
+
+	def _row_values(self, row):
+		status, k, value_a, value_b, normalized = row
+		if not normalized:
+			value_a = self._normalize(value_a)
+			value_b = self._normalize(value_b)
+		return status, k, value_a, value_b
+
+	def render_table(self) -> str:
+		table = Texttable()
+		table.set_deco(Texttable.HEADER)
+		table.set_cols_dtype(['t', 't', 't', 't'])
+		table.header(['OK?', 'KEY', self.origins[0], self.origins[1]])
+		table.set_cols_width([10, 60, 20, 20])
+		table.set_header_align(['l', 'l', 'l', 'l'])
 
+		for row in self.rows:
+			status, k, value_a, value_b = self._row_values(row)
 			table.add_row([
 				status,
 				" / ".join(k),
-				value_self.replace("\n", "\\n"),
-				value_other.replace("\n", "\\n")
+				value_a.replace("\n", "\\n"),
+				value_b.replace("\n", "\\n")
 			])
 
-		for line in table.draw().split("\n"):
-			report(line)
-
-		if False:  # enable for further debugging
-			if not all_ok:
-				report("\n")
-				report("full dump of properties of %s:" % self.get_origin().name.upper())
-				_dump_properties(self.properties, report)
-
-				report("\n")
-				report("full dump of properties of %s:" % other.get_origin().name.upper())
-				_dump_properties(other.properties, report)
-
-		if self.errors:
-			for type, err in self.errors.items():
-				report("error %s:%s in %s" % (type, err, self.origin))
-			all_ok = False
-		if other.errors:
-			for type, err in other.errors.items():
-				report("error %s:%s in %s" % (type, err, other.origin))
-			all_ok = False
-
-		return all_ok
+		return table.draw()
+
+	def report(self, report: Callable[[str], None], full_table: bool = True):
+		if full_table or not self.ok:
+			for line in self.render_table().split("\n"):
+				report(line)
+		else:
+			report("all %d properties match (%d ignored)." % (self.n_ok, self.n_ignored))
+
+		for error in self.errors:
+			report(error)
+
+	def to_json(self) -> Dict:
+		return dict(
+			ok=self.ok,
+			origins=list(self.origins),
+			matched=self.n_ok,
+			ignored=self.n_ignored,
+			mismatches=[dict(key=list(k), values=[a, b]) for k, a, b in self.mismatches],
+			errors=self.errors)
 
 
 def open_results():
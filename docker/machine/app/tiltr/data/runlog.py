@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+from typing import Dict, Iterator, List, Tuple
+
+import os
+import json
+import time
+import zlib
+import datetime
+import tempfile
+import threading
+from collections import defaultdict
+
+from texttable import Texttable
+
+
+# structured protocols for runs. instead of keeping lists of formatted lines
+# in memory, a run appends (timestamp, source, event, fields) records to a
+# compressed log file. sources are the protocol sections (e.g. "log" or
+# "postprocessing/01_verification.txt"); lines, tables and machine protocols
+# get formatted only when the text files are actually asked for, i.e. when a
+# result is downloaded or viewed. the database stores just the log, and the
+# text files (protocol.txt, postprocessing/*, machines/*) are generated from it.
+
+
+class RunLog:
+	filename = "log.jsonl.z"
+
+	# not in /tmp, which gets cleared of old files while runs are still going.
+	directory = "/tiltr/tmp/runs"
+
+	def __init__(self):
+		os.makedirs(RunLog.directory, exist_ok=True)
+		fd, self.path = tempfile.mkstemp(prefix="tiltr-run-", suffix=".jsonl.z", dir=RunLog.directory)
+		self._file = os.fdopen(fd, "w+b")
+		self._compressor = zlib.compressobj(9)
+		self._lock = threading.Lock()
+		self._data = None
+
+	def record(self, source: str, event: str, **fields):
+		line = json.dumps([time.time(), source, event, fields], default=str) + "\n"
+		with self._lock:
+			if self._file is None:
+				return  # closed, i.e. already stored.
+			self._file.write(self._compressor.compress(line.encode("utf8")))
+
+	def close(self) -> bytes:
+		with self._lock:
+			if self._file is not None:
+				self._file.write(self._compressor.flush())
+				self._file.flush()
+				self._file.seek(0)
+				self._data = self._file.read()
+				self._file.close()
+				self._file = None
+				try:
+					os.unlink(self.path)
+				except FileNotFoundError:
+					pass
+		return self._data
+
+
+class ProtocolSection:
+	def __init__(self, log: RunLog, name: str):
+		self.log = log
+		self.name = name
+
+	def __getitem__(self, name: str) -> 'ProtocolSection':
+		return ProtocolSection(self.log, self.name + "/" + name)
+
+	def append(self, text: str):
+		self.log.record(self.name, "line", text=text)
+
+	def extend(self, lines: List[str]):
+		self.log.record(self.name, "lines", lines=list(lines))
+
+	def table(self, rows: List[List], dtypes: List[str]):
+		# a Texttable with a header deco, the first row being the header.
+		self.log.record(self.name, "table", rows=rows, dtypes=dtypes)
+
+	def entries(self, entries: List):
+		# a machine's protocol, see ExamDriver.add_protocol_to_result.
+		self.log.record(self.name, "entries", entries=entries)
+
+
+class Protocols:
+	def __init__(self, log: RunLog):
+		self.log = log
+
+	def __getitem__(self, name: str) -> ProtocolSection:
+		return ProtocolSection(self.log, name)
+
+
+def read_records(data: bytes) -> Iterator[Tuple]:
+	for line in zlib.decompress(data).decode("utf8").split("\n"):
+		if line:
+			yield tuple(json.loads(line))
+
+
+def _format_entry(entry) -> str:
+	if isinstance(entry, str):
+		return entry  # formatted by older machines.
+	t, title, what = entry
+	return "%s [%s] %s" % (datetime.datetime.fromtimestamp(t).strftime('%H:%M:%S'), title, what)
+
+
+def format_record(event: str, fields: Dict) -> List[str]:
+	if event == "line":
+		return [fields["text"]]
+	elif event == "lines":
+		return fields["lines"]
+	elif event == "table":
+		table = Texttable()
+		table.set_deco(Texttable.HEADER)
+		table.set_cols_dtype(fields["dtypes"])
+		for row in fields["rows"]:
+			table.add_row(row)
+		return table.draw().split("\n")
+	elif event == "entries":
+		return [_format_entry(entry) for entry in fields["entries"]]
+	else:
+		return ["%s: %s" % (event, json.dumps(fields))]
+
+
+_protocol_sections = [
+	"header",
+	"log",
+
+	"preferences/workarounds",
+	"preferences/settings",
+	"mark_schema"]
+
+
+def render_protocol_files(data: bytes) -> Dict[str, bytes]:
+	lines = defaultdict(list)
+	for _, source, event, fields in read_records(data):
+		lines[source].extend(format_record(event, fields))
+
+	parts = list()
+	for section in _protocol_sections:
+		part = lines.get(section)
+		if part:
+			if section == "header":
+				parts.extend(part)
+				parts.append("")
+			else:
+				parts.append("# " + section.upper())
+				parts.append("")
+				parts.extend(part)
+				parts.append("")
+
+	files = dict()
+	files["protocol.txt"] = "\n".join(parts).encode("utf8")
+	for source, source_lines in lines.items():
+		if source.startswith("postprocessing/") or source.startswith("machines/"):
+			files[source] = "\n".join(source_lines).encode("utf8")
+	return files
+
+
+def expand_files(files: Dict[str, bytes]) -> Dict[str, bytes]:
+	# adds the text protocols for results that store a run log.
+	data = files.get(RunLog.filename)
+	if data is None:
+		return files
+	expanded = render_protocol_files(data)
+	expanded.update(files)
+	return expanded
@@ -5,7 +5,7 @@
 # GPLv3, see LICENSE
 #
 
-from .implicit import implicit_text_to_number_xls
+from .implicit import implicit_text_to_number_xls, normalize_value
 from texttable import Texttable
 
 
@@ -139,6 +139,82 @@ class Settings(ValueBag):
 				'numbers_in_text_fields_p',
 				"""Probability of entering numeric values in text fields.""",
 				0.05
+			),
+			(
+				'wait_poll_frequency',
+				"""Number of seconds between polls when waiting for conditions in the browser.""",
+				0.25
+			),
+			(
+				'save_modal_timeout',
+				"""Number of seconds to wait for the save-on-navigation modal after navigating.""",
+				1
+			),
+			(
+				'pipelined_looping',
+				"""When looping, prepare the next run on a second master browser while the current run
+				is being verified (1 = on, 0 = off).""",
+				0
+			),
+			(
+				'exam_driver',
+				"""How machines take exams. "browser" drives a real browser through Selenium, "http"
+				posts answers directly (no UI checks, but much cheaper per participant; supports
+				single choice, multiple choice, kprim, cloze and long text questions).""",
+				'browser'
+			),
+			(
+				'full_verification_tables',
+				"""Write the table of all compared properties into the verification protocol for every
+				user (1), or only for users that failed (0).""",
+				0
+			),
+			(
+				'replay_batch',
+				"""Replay the recorded exam sessions of the given batch (e.g. one that failed) instead of
+				generating new answers. Empty means no replay.""",
+				''
+			),
+			(
+				'load_profile',
+				"""When looping, ramp the number of concurrent exam sessions for load testing instead of
+				running with all machines. Must be "off", "step" or "linear".""",
+				'off'
+			),
+			(
+				'load_min_sessions',
+				"""Number of concurrent exam sessions in the first load test stage.""",
+				1
+			),
+			(
+				'load_max_sessions',
+				"""Number of concurrent exam sessions in the last load test stage (0 = all machines).""",
+				0
+			),
+			(
+				'load_steps',
+				"""Number of stages for the "step" load profile.""",
+				4
+			),
+			(
+				'load_runs_per_stage',
+				"""Number of runs to measure in each load test stage.""",
+				1
+			),
+			(
+				'load_skip_verification',
+				"""Skip checking exported results during load tests (1 = on, 0 = off).""",
+				1
+			),
+			(
+				'load_slo_latency',
+				"""Maximum 95th percentile latency of saves (in seconds) during load tests.""",
+				2
+			),
+			(
+				'load_slo_error_rate',
+				"""Maximum percentage of failed exam sessions during load tests.""",
+				1
 			)
 		], **kwargs)
 
@@ -309,4 +385,6 @@ class Workarounds(ValueBag):
 		return value
 
 	def normalize(self, value: str) -> str:
-		return implicit_text_to_number_xls(self.strip_whitespace(value))
+		if isinstance(value, str):
+			return normalize_value(value, bool(self.sloppy_whitespace))
+		return implicit_text_to_number_xls(value)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+from typing import Dict, List
+
+import time
+import itertools
+import threading
+from contextlib import contextmanager
+
+
+# span based tracing of where time goes in a run. a tracer gets activated for
+# the threads working on a run; code anywhere below can then open spans through
+# trace() without passing the tracer around. without an active tracer, trace()
+# does nothing.
+
+_local = threading.local()
+
+
+class Tracer:
+	def __init__(self, origin: str = "master"):
+		self.origin = origin
+		self.spans = []
+		self.ids = itertools.count(1)
+		self.mutex = threading.Lock()
+
+	@contextmanager
+	def activate(self):
+		old_tracer = getattr(_local, "tracer", None)
+		old_stack = getattr(_local, "stack", None)
+		_local.tracer = self
+		_local.stack = []
+		try:
+			yield self
+		finally:
+			_local.tracer = old_tracer
+			_local.stack = old_stack
+
+	@contextmanager
+	def span(self, name: str, parent: int = None):
+		stack = getattr(_local, "stack", None)
+		if stack is None:
+			stack = []
+
+		span = dict(
+			id="%s:%d" % (self.origin, next(self.ids)),
+			parent=stack[-1] if stack else parent,
+			name=name,
+			origin=self.origin,
+			thread=threading.current_thread().name,
+			start=time.time())
+
+		stack.append(span["id"])
+		try:
+			yield span
+		finally:
+			stack.pop()
+			span["end"] = time.time()
+			with self.mutex:
+				self.spans.append(span)
+
+	def current_span(self):
+		stack = getattr(_local, "stack", None)
+		return stack[-1] if stack else None
+
+	def extend(self, spans: List[Dict], origin: str, parent: str = None):
+		# adopt spans recorded elsewhere (e.g. on a machine).
+		with self.mutex:
+			for span in spans:
+				span = dict(span)
+				span["id"] = "%s/%s" % (origin, span["id"])
+				span["parent"] = "%s/%s" % (origin, span["parent"]) if span["parent"] else parent
+				span["origin"] = origin
+				self.spans.append(span)
+
+	def get_spans(self) -> List[Dict]:
+		with self.mutex:
+			return list(self.spans)
+
+
+def current_tracer():
+	return getattr(_local, "tracer", None)
+
+
+@contextmanager
+def trace(name: str):
+	tracer = current_tracer()
+	if tracer is None:
+		yield None
+	else:
+		with tracer.span(name) as span:
+			yield span
+
+
+def waterfall(spans: List[Dict]) -> List[Dict]:
+	# turns spans into rows of a waterfall chart, i.e. sorted by start time with
+	# times relative to the earliest span and a nesting depth.
+	if not spans:
+		return []
+
+	t0 = min(span["start"] for span in spans)
+	by_id = dict((span["id"], span) for span in spans)
+
+	def depth(span):
+		d = 0
+		while span["parent"] in by_id and d < 100:
+			span = by_id[span["parent"]]
+			d += 1
+		return d
+
+	rows = []
+	for span in sorted(spans, key=lambda s: s["start"]):
+		rows.append(dict(
+			id=span["id"],
+			parent=span["parent"],
+			name=span["name"],
+			origin=span["origin"],
+			depth=depth(span),
+			start=span["start"] - t0,
+			duration=span["end"] - span["start"]))
+
+	return rows
@@ -180,7 +180,7 @@ def workbook_to_result(wb: openpyxl.Workbook, username, questions, workarounds,
 			break
 
 		row_index += 1
-		if row_index > 1000:
+		if row_index > main_sheet.max_row:
 			raise IntegrityException("user %s not found in XLS" % username)
 	assert result_row
 
@@ -5,7 +5,7 @@
 # GPLv3, see LICENSE
 #
 
-from typing import Any, DefaultDict, Union
+from typing import Any
 
 import asyncio
 import requests
@@ -21,6 +21,7 @@ import os
 import glob
 import tempfile
 import itertools
+import copy
 from decimal import *
 
 from multiprocessing.dummy import Pool as ThreadPool
@@ -40,18 +41,27 @@ from texttable import Texttable
 from tiltr.data.exceptions import *
 from tiltr.data.result import Result, Origin, MaybeDecimal
 from tiltr.data.result import open_results
+from tiltr.data.runlog import RunLog, Protocols
 from tiltr.data.workbook import workbook_to_result, check_workbook_consistency
 from tiltr.data.context import RandomContext
+from tiltr.data.tracing import Tracer, trace
+from tiltr.data.metrics import metrics
 from tiltr.question.coverage import Coverage
+from tiltr.question.corpus import ScoreCorpus
 
 from tiltr.question import *  # needed for pickling
 from tiltr.driver.exam_configuration import * # needed for pickling
 
 import pandora
 
+from tiltr.http.discovery import machine_url
+
 from .commands import TakeExamCommand
-from .drivers import UsersBackend, UsersFactory, UserDriver, ImportedTest, Marks, ILIASDriver
+from .checkpoint import Checkpoints, pickled, unpickled
+from .replay import SessionTrace
+from .drivers import UsersBackend, UsersFactory, UserDriver, ImportedTest, Marks, ILIASDriver, DefinitionsStore
 from .utils import wait_for_page_load, run_interaction
+from .retry import retries
 
 
 class PostProcessingRound:
@@ -61,6 +71,8 @@ class PostProcessingRound:
 
 
 monitor_mutex = Lock()
+monitor_poll_interval = 1  # seconds
+reattach_timeout = 30  # seconds
 
 
 def encode_success(success):
@@ -79,22 +91,28 @@ def take_exam(args):
 	report("master", "passing take_exam to %s." % machine)
 
 	try:
-		r = requests.post("http://%s:8888/start/%s" % (machine, batch_id),
-			data={"command_json": command.to_json()})
-		if r.status_code != 200:
-			raise InteractionException("start call failed: %s" % r.status_code)
+		if args.get("reattach"):
+			# resuming an interrupted run. the machine might still be running (or have
+			# finished) the exam, so just collect its messages again from the start.
+			report("master", "reattaching to %s." % machine)
+		else:
+			r = requests.post(machine_url(machine, "start", batch_id),
+				data={"command_json": command.to_json()})
+			if r.status_code != 200:
+				raise InteractionException("start call failed: %s" % r.status_code)
 
-		report("master", "test started on %s." % machine)
+			report("master", "test started on %s." % machine)
 
 		index = 0
+		t0 = time.time()
 
 		while result_json is None:
 			# we don't want too much traffic for updating machine states. only check
 			# one at a time.
 			monitor_mutex.acquire()
 			try:
-				time.sleep(1)
-				r = requests.get("http://%s:8888/monitor/%s/%d" % (machine, batch_id, index))
+				time.sleep(monitor_poll_interval)
+				r = requests.get(machine_url(machine, "monitor", batch_id, index))
 			finally:
 				monitor_mutex.release()
 
@@ -103,6 +121,9 @@ def take_exam(args):
 		
 			messages = json.loads(r.text)
 
+			if args.get("reattach") and index == 0 and not messages and time.time() - t0 > reattach_timeout:
+				raise InteractionException("machine %s has no exam for this batch, cannot resume." % machine)
+
 			for command, payload in messages:
 				if command == "ECHO":
 					report(machine, payload)
@@ -236,22 +257,38 @@ def create_temp_test_name():
 
 
 class Run:
-	protocols: DefaultDict[str, Union[list, DefaultDict[str, list]]]
+	protocols: Protocols
 
 	def __init__(self, batch):
 		self.success = ("FAIL", "unknown")
 
 		self.performance_data = []
+		self.retry_data = []
+		self.verification = []  # structured results of all result comparisons
+		self.tracer = Tracer()
+		self.exams_span = None
 		self.coverage = Coverage()
 		self.users = []
 		self.users_factory = batch.users_factory
-		self.protocols = defaultdict(list)
-		self.protocols["postprocessing"] = defaultdict(list)
+		self.log = RunLog()
+		self.protocols = Protocols(self.log)
 		self.files = dict()
-		self.test_version = 1
+		self.test_versions = itertools.count(1)  # shared with concurrent reimport verification.
 		self.test_url = None
 		self.language = None
 
+		self.checkpoints = Checkpoints(batch.batch_id)
+		self.resumed = batch.resumed
+		if self.resumed:
+			self.checkpoints.load()
+
+		self.t0 = None
+		self.temp_test = None  # the temporary copy of the test (deleted soon).
+		self.used_test = None  # the test actually used (copied or not, depends).
+		self.is_prepared = False
+		self.preparation_error = None
+		self.recorded_results = None  # results from machines, if any arrived.
+
 		self.batch = batch
 		self.machines = batch.machines
 		self.settings = batch.settings
@@ -261,33 +298,12 @@ class Run:
 		self.wait_time = batch.wait_time
 
 		self.test = batch.test
-		self.questions = self.test.cache.questions
-		self.exam_configuration = self.test.cache.exam_configuration
-
-	def _make_protocol(self):
-		sections = [
-			"header",
-			"log",
-
-			"preferences/workarounds",
-			"preferences/settings",
-			"mark_schema"]
-
-		parts = list()
-
-		for section in sections:
-			part = self.protocols[section]
-			if part:
-				if section == "header":
-					parts.extend(part)
-					parts.append("")
-				else:
-					parts.append("# " + section.upper())
-					parts.append("")
-					parts.extend(part)
-					parts.append("")
 
-		return "\n".join(parts)
+		# runs overlap with pipelined looping and readjustments modify questions,
+		# so every run works on its own copy of the cached definitions. likewise,
+		# the cache only ever gets copies of a run's definitions (see prepare).
+		self.questions = copy.deepcopy(self.test.cache.questions)
+		self.exam_configuration = copy.deepcopy(self.test.cache.exam_configuration)
 
 	def _check_results(
 		self, processing_round: PostProcessingRound, master, test_driver, workbook, all_recorded_results):
@@ -297,16 +313,26 @@ class Run:
 		usernames = [user.get_username() for user in self.users]
 		tab_stats = dict()
 
-		tab_stats["statistics_tab"] = test_driver.get_results_from_statistics_tab(usernames)
-		if not self.workarounds.ignore_wrong_results_in_results_tab:
-			tab_stats["results_tab"] = test_driver.get_results_from_results_tab(usernames)
-		web_answers = test_driver.get_answers_from_details_view(self.questions)
+		with trace("read results from ui"):
+			tab_stats["statistics_tab"] = test_driver.get_results_from_statistics_tab(usernames)
+			if not self.workarounds.ignore_wrong_results_in_results_tab:
+				tab_stats["results_tab"] = test_driver.get_results_from_results_tab(usernames)
+			web_answers = test_driver.get_answers_from_details_view(self.questions)
 
-		pdfs = test_driver.export_pdf(self.files)
+		with trace("export pdf"), test_driver.measure_export("pdf"):
+			pdfs = test_driver.export_pdf(self.files)
 		prefix = 'reimport/' if processing_round.is_reimport else 'original/'
 
 		protocol = self._get_postprocessing_protocol(processing_round, "verification")
 
+		# the first check sees ILIAS's scores for the answers as given, before any
+		# readjustments. keep them as a corpus for offline scoring checks.
+		corpus = None
+		if processing_round.index == 0 and not processing_round.is_reimport:
+			corpus = ScoreCorpus.create(
+				self.questions, self.exam_configuration, self.settings, self.workarounds,
+				self.language, self.ilias_version.as_tuple())
+
 		for user, recorded_result in zip(self.users, all_recorded_results):
 			master.report("checking results for user %s." % user.get_username())
 
@@ -350,7 +376,15 @@ class Run:
 			protocol.append(protocol_title + ("#" * (80 - len(protocol_title))))
 			protocol.append("")
 
-			if not recorded_result.check_against(ilias_result, report, self.workarounds):
+			diff = recorded_result.diff(ilias_result, self.workarounds)
+			diff.report(report, full_table=bool(int(self.settings.full_verification_tables)))
+
+			verification = diff.to_json()
+			verification.update(
+				user=user.get_username(), round=processing_round.index + 1, reimport=processing_round.is_reimport)
+			self.verification.append(verification)
+
+			if not diff.ok:
 				message = "verification failed for user %s." % user.get_username()
 				master.report(message)
 				self._save_test(test_driver, "verification")
@@ -363,6 +397,15 @@ class Run:
 					question = self.questions[question_title]
 					question.add_export_coverage(self.coverage, answers, self.language)
 
+			if corpus is not None:
+				corpus.add_result(recorded_result, ilias_result)
+
+		if corpus is not None:
+			try:
+				self.files[ScoreCorpus.filename] = corpus.to_bytes()
+			except:
+				traceback.print_exc()
+
 		return all_assertions_ok
 
 	def _propagate_score_changes(self, all_recorded_results, context):
@@ -591,13 +634,9 @@ class Run:
 		for user, result in zip(self.users, all_recorded_results):
 			report("### USER %s" % user.get_username())
 
-			new_scores_table = Texttable()
-			new_scores_table.set_deco(Texttable.HEADER)
-			new_scores_table.set_cols_dtype(['a', 'a'])
-
-			answers_table = Texttable()
-			answers_table.set_deco(Texttable.HEADER)
-			answers_table.set_cols_dtype(['a', 'a'])
+			# tables are only drawn when the protocol is viewed.
+			new_scores_rows = []
+			answers_rows = []
 
 			any_readjusted = False
 
@@ -617,28 +656,25 @@ class Run:
 				for key in Result.maximum_score_keys(question_title):
 					result.update(key, Result.format_score(question.get_maximum_score(context)))
 
-				new_scores_table.add_row([question_title, score])
+				new_scores_rows.append([question_title, score])
 
-				answers_table.add_row(["QUESTION " + question_title, ""])
-				for key, value in result.properties.items():
-					if key[0] == "question" and key[1] == question_title and key[2] == "answer":
-						dimensions = key[3:]
-						if len(dimensions) == 1:
-							dimension = str(dimensions[0])
-						else:
-							dimension = str(list(map(lambda x: '"%s"' % str(x), dimensions)))
-						answers_table.add_row([dimension, value])
-				answers_table.add_row(["", ""])
+				answers_rows.append(["QUESTION " + question_title, ""])
+				for dimensions, value in result.get_question_answers(question_title).items():
+					if len(dimensions) == 1:
+						dimension = str(dimensions[0])
+					else:
+						dimension = str(list(map(lambda x: '"%s"' % str(x), dimensions)))
+					answers_rows.append([dimension, value])
+				answers_rows.append(["", ""])
 
 			if any_readjusted:
-				report("recomputed these scores:")
-				for line in new_scores_table.draw().split("\n"):
-					report(line)
-				report("")
-				report("based on these answers:")
-				for line in answers_table.draw().split("\n"):
-					report(line)
-				report("")
+				report("recomputed %d scores." % len(new_scores_rows))
+				protocol.append("recomputed these scores:")
+				protocol.table(new_scores_rows, ['a', 'a'])
+				protocol.append("")
+				protocol.append("based on these answers:")
+				protocol.table(answers_rows, ['a', 'a'])
+				protocol.append("")
 
 		self._propagate_score_changes(all_recorded_results, context)
 
@@ -678,7 +714,11 @@ class Run:
 		self.protocols["settings"].extend(
 			ilias_driver.verify_admin_settings())
 
-		self.users = self.users_factory.acquire(self._users_backend(master))
+		with trace("acquire users"):
+			self.users = self.users_factory.acquire(self._users_backend(master))
+		self._checkpoint(
+			"users", prefix=self.users_factory.prefix,
+			users=[[user.get_username(), user.get_password()] for user in self.users])
 
 		if not test_driver.goto_or_fail():
 			# if test does not exist, add it first.
@@ -686,42 +726,103 @@ class Run:
 		else:
 			test_driver.delete_all_participants()
 
+		# parsing definitions from the UI is slow, so try our disk cache first.
+		definitions_store = DefinitionsStore(self.test, self.settings, self.ilias_version)
+		if self.exam_configuration is None or self.questions is None:
+			definitions = definitions_store.load()
+			if definitions is not None:
+				master.report("using cached question definitions.")
+				self.questions, self.exam_configuration = definitions
+				self.test.cache.questions = copy.deepcopy(self.questions)
+				self.test.cache.exam_configuration = copy.deepcopy(self.exam_configuration)
+
+		parsed = False
+
 		# grab exam configuration from UI.
 		if self.exam_configuration is None:
-			self.exam_configuration = test_driver.parse_exam_configuration()
-			self.test.cache.exam_configuration = self.exam_configuration
+			with trace("parse exam configuration"):
+				self.exam_configuration = test_driver.parse_exam_configuration()
+			self.test.cache.exam_configuration = copy.deepcopy(self.exam_configuration)
+			parsed = True
 
 		# grab question definitions from UI.
 		if self.questions is None:
-			self.questions = test_driver.parse_question_definitions(self.settings)
-			self.test.cache.questions = self.questions
+			with trace("parse question definitions"):
+				self.questions = test_driver.parse_question_definitions(self.settings)
+			self.test.cache.questions = copy.deepcopy(self.questions)
+			parsed = True
+
+		if parsed:
+			# store now, before readjustments modify our questions.
+			try:
+				definitions_store.save(self.questions, self.exam_configuration)
+			except:
+				traceback.print_exc()
 
 		# now configure test.
-		test_driver.configure_test(self.workarounds, self.exam_configuration)
+		with trace("configure test"):
+			test_driver.configure_test(self.workarounds, self.exam_configuration)
 
 		# print out sorted mark scheme.
-		table = Texttable()
-		table.set_deco(Texttable.HEADER)
-		table.set_cols_dtype(['f', 't', 't'])
-		table.add_row(['percentage', 'grade (short)', 'grade (long)'])
-
+		rows = [['percentage', 'grade (short)', 'grade (long)']]
 		for mark in sorted(self.exam_configuration.marks, key=lambda x: float(x[0])):
-			table.add_row(mark)
-
-		for line in table.draw().split('\n'):
-			self.protocols["mark_schema"].append(line)
+			rows.append(list(mark))
+		self.protocols["mark_schema"].table(rows, ['f', 't', 't'])
 
 		# find URL of test, since this saves us a lot of time in the clients.
 		self.test_url = test_driver.get_test_url()
 
+	def _load_replay_traces(self):
+		replay_batch = self.settings.replay_batch.strip()
+		if not replay_batch:
+			return []
+
+		with open_results() as db:
+			files = db.get_batch_files(replay_batch)
+
+		traces = []
+		for name, data in files.items():
+			if name.endswith("_" + SessionTrace.filename):
+				traces.append(SessionTrace.from_bytes(data))
+		traces.sort(key=lambda t: t.info.get("machine_index", 0))
+
+		if not traces:
+			raise InteractionException("batch %s contains no recorded sessions to replay." % replay_batch)
+
+		self.report("master", "replaying %d recorded sessions from batch %s." % (len(traces), replay_batch))
+		if len(traces) < len(self.users):
+			self.report("master", "%d machines have no recorded session and will run new ones." % (
+				len(self.users) - len(traces)))
+
+		return [base64.b64encode(t.to_bytes()).decode("utf-8") for t in traces]
+
 	def run_exams(self):
+		# compute maximum scores once here, so that the questions we send out
+		# carry them and machines need not recompute them for every answer.
+		context = RandomContext(
+			self.questions, self.settings, self.workarounds, self.language, self.ilias_version.as_tuple())
+		for question in self.questions.values():
+			question.get_maximum_score(context)
+
+		# when resuming, keep the results that already arrived, and reattach to
+		# machines that might still be running their exams.
+		arrived = dict()
+		for i in range(len(self.users)):
+			data = self.checkpoints.get("machine/%d" % (i + 1))
+			if data is not None:
+				arrived[i] = Result(from_json=data["result"])
+		reattach = self.checkpoints.get("exams") is not None
+		self._checkpoint("exams")
+
 		# now run exams.
+		replay_traces = self._load_replay_traces()
 		take_exam_args = []
 		for i, machine, user in zip(range(len(self.users)), self.machines.values(), self.users):
 			take_exam_args.append(
 				dict(
 					batch_id=self.batch_id,
 					report=self.report,
+					reattach=reattach,
 					command=TakeExamCommand(
 						ilias_url=self.batch.ilias_url,
 						verify_ssl=self.batch.verify_ssl,
@@ -737,11 +838,24 @@ class Run:
 						settings=self.settings,
 						workarounds=self.workarounds,
 						wait_time=self.wait_time,
-						admin_lang=self.language)))
+						admin_lang=self.language,
+						trace=replay_traces[i] if i < len(replay_traces) else None)))
+
+		def take_or_restore_exam(args):
+			index = args["command"].machine_index
+			if index - 1 in arrived:
+				self.report("master", "using checkpointed results from %s." % args["command"].machine)
+				return arrived[index - 1]
+			result = take_exam(args)
+			if not result.errors:
+				self._checkpoint("machine/%d" % index, result=result.to_json())
+			return result
 
 		pool = ThreadPool(len(self.users))
 		try:
-			all_recorded_results = pool.map(take_exam, take_exam_args)
+			with trace("run exams") as span:
+				self.exams_span = span["id"] if span else None
+				all_recorded_results = pool.map(take_or_restore_exam, take_exam_args)
 			self.report("master", "waiting for results.")
 			pool.close()
 			pool.join()
@@ -756,8 +870,7 @@ class Run:
 	def _save_test(self, test_driver, *args):
 		names = ", ".join(a for a in args if a)
 		content, filename = test_driver.export_xmlres()
-		self.files["test/v%d [%s]/%s" % (self.test_version, names, filename)] = content
-		self.test_version += 1
+		self.files["test/v%d [%s]/%s" % (next(self.test_versions), names, filename)] = content
 		return content
 
 	def _verify_reimport(self, master, test_driver, all_recorded_results, exported_test_data):
@@ -799,14 +912,77 @@ class Run:
 
 		return verify_result
 
+	def _start_reimport_verification(self, all_recorded_results, exported_test_data):
+		# verify the reimported test on a second admin browser, concurrently with the
+		# remaining rounds on the original test. readjustments and manual scoring modify
+		# questions and expected results, so the reimport gets its own copies of these.
+		# the copy also collects files, verification results and coverage on its own;
+		# these get merged into this run once the reimport verification is joined.
+		# the run log and the tracer are safe to share between threads.
+		run = copy.copy(self)
+		run.questions = copy.deepcopy(self.questions)
+		run.files = dict()
+		run.verification = []
+		run.coverage = Coverage()
+		all_recorded_results = copy.deepcopy(all_recorded_results)
+
+		outcome = dict()
+		parent_span = self.tracer.current_span()
+
+		def verify():
+			try:
+				with self.tracer.activate(), retries.scope(self.batch_id), \
+					self.tracer.span("verify reimport", parent=parent_span):
+					with self.batch.in_master(self.protocol_master) as master:
+						outcome["result"] = run._verify_reimport(
+							master, None, all_recorded_results, exported_test_data)
+			except BaseException as e:
+				traceback.print_exc()
+				outcome["error"] = e
+
+		thread = threading.Thread(target=verify)
+		thread.start()
+
+		return thread, outcome, run
+
+	def _join_reimport_verification(self, reimport):
+		thread, outcome, run = reimport
+		thread.join()
+
+		self.files.update(run.files)
+		self.verification.extend(run.verification)
+		self.coverage.extend(run.coverage)
+
+		if "error" in outcome:
+			raise outcome["error"]
+		return outcome["result"]
+
+	def _resume_rounds(self, prefix, all_recorded_results):
+		# restores the state after the last verification round an interrupted run
+		# completed, and returns that round's index (or -1).
+		last_index, data = self.checkpoints.get_last_round(prefix)
+		if data is not None:
+			self.report("master", "resuming verification after round %d." % (last_index + 1))
+			all_recorded_results[:] = [Result(from_json=r) for r in data["results"]]
+			self.questions = unpickled(data["questions"])
+			self.verification = data["verification"]
+		return last_index
+
 	def _verify_xls(self, master, test_driver, all_recorded_results, is_reimport=False):
 		rounds = list()
 
+		prefix = 'reimport/' if is_reimport else 'original/'
+
+		# the verification of the reimport runs concurrently, so we only checkpoint
+		# (and resume) rounds on the original test.
+		resumed_index = -1 if is_reimport else self._resume_rounds(prefix, all_recorded_results)
+
 		rounds.append("check")
 		if not is_reimport:
 			# ensure test export here, since we might always fail while doing round 0 (we still
 			# want to have one test export then).
-			exported_test_data = self._save_test(test_driver, "initial")
+			if resumed_index < 1:
+				exported_test_data = self._save_test(test_driver, "initial")
 			rounds.append("reimport")
 
 		if not is_reimport:
@@ -830,51 +1006,78 @@ class Run:
 		rounds.append("manual")
 		rounds.append("check")
 
-		prefix = 'reimport/' if is_reimport else 'original/'
+		all_assertions_ok = resumed_index >= 0  # resumed rounds passed their checks.
+		reimport = None
 
-		all_assertions_ok = False
+		try:
+			if not is_reimport and resumed_index >= 1:
+				# the reimport verification of the interrupted run got lost. verify a
+				# reimport of the test as it is now, i.e. after the resumed rounds.
+				self.add_to_protocol(
+					"header", "Resumed run, reimport verified after round %d." % (resumed_index + 1))
+				reimport = self._start_reimport_verification(
+					all_recorded_results, self._save_test(test_driver, "resumed"))
+
+			for round_index, round in enumerate(rounds):
+				if round_index <= resumed_index:
+					continue
 
-		for round_index, round in enumerate(rounds):
-			processing_round = PostProcessingRound(round_index, is_reimport)
+				processing_round = PostProcessingRound(round_index, is_reimport)
 
-			if round == "check":
-				xls = test_driver.export_xls()
-				workbook = load_workbook(filename=io.BytesIO(xls))
+				with trace("round %d: %s%s" % (round_index + 1, round, " (reimport)" if is_reimport else "")):
+					if round == "check":
+						xls = test_driver.export_xls()
+						workbook = load_workbook(filename=io.BytesIO(xls))
 
-				try:
-					check_workbook_consistency(
-						workbook, self.questions, self.workarounds, self.ilias_version, master.report)
-				except:
-					raise IntegrityException("failed to check workbook consistency")
+						try:
+							check_workbook_consistency(
+								workbook, self.questions, self.workarounds, self.ilias_version, master.report)
+						except:
+							raise IntegrityException("failed to check workbook consistency")
 
-				if round_index == 0:
-					self.files[prefix + "exported_r%d.xlsx" % round_index] = xls
+						if round_index == 0:
+							self.files[prefix + "exported_r%d.xlsx" % round_index] = xls
 
-				all_assertions_ok = self._check_results(
-					processing_round, master, test_driver, workbook, all_recorded_results)
-				if not all_assertions_ok:
-					break
+						all_assertions_ok = self._check_results(
+							processing_round, master, test_driver, workbook, all_recorded_results)
+						if not all_assertions_ok:
+							break
 
-			elif round == "reimport":
-				all_assertions_ok = all_assertions_ok and self._verify_reimport(
-					master, test_driver, all_recorded_results, exported_test_data) == "OK"
-				if not all_assertions_ok:
-					break
+					elif round == "reimport":
+						# joined after all other rounds.
+						reimport = self._start_reimport_verification(all_recorded_results, exported_test_data)
 
-			elif round == "readjust":
-				self._apply_readjustment(
-					processing_round, master, test_driver, all_recorded_results)
+					elif round == "readjust":
+						self._apply_readjustment(
+							processing_round, master, test_driver, all_recorded_results)
 
-				self._save_test(test_driver, "reimported" if is_reimport else "", "readjustments")
+						self._save_test(test_driver, "reimported" if is_reimport else "", "readjustments")
 
-			elif round == "manual":
-				self._apply_manual_scoring(
-					processing_round, master, test_driver, all_recorded_results)
+					elif round == "manual":
+						self._apply_manual_scoring(
+							processing_round, master, test_driver, all_recorded_results)
 
-				self._save_test(test_driver, "reimported" if is_reimport else "", "manual scoring")
+						self._save_test(test_driver, "reimported" if is_reimport else "", "manual scoring")
 
-			else:
-				raise RuntimeError("illegal round type %s" % round)
+					else:
+						raise RuntimeError("illegal round type %s" % round)
+
+				if not is_reimport:
+					self._checkpoint(
+						"round/%s%02d" % (prefix, round_index),
+						results=[r.to_json() for r in all_recorded_results],
+						questions=pickled(self.questions),
+						verification=self.verification)
+		except:
+			if reimport is not None:
+				try:
+					self._join_reimport_verification(reimport)
+				except:
+					traceback.print_exc()  # keep the original exception.
+			raise
+
+		if reimport is not None:
+			all_assertions_ok = self._join_reimport_verification(reimport) == "OK" and all_assertions_ok
 
 		return "OK" if all_assertions_ok else "FAIL"
 
@@ -887,15 +1090,19 @@ class Run:
 
 		# copy protocols and files.
 		for user, recorded_result in zip(self.users, all_recorded_results):
-			header = ["# TEST RUN FOR %s" % user.get_username().upper(), ""]
-			self.protocols[user.get_username()] = header + recorded_result.protocol
+			protocol = self.protocols["machines/%s.txt" % user.get_username()]
+			protocol.extend(["# TEST RUN FOR %s" % user.get_username().upper(), ""])
+			protocol.entries(recorded_result.protocol)
 
 			for k, v in recorded_result.files.items():
 				self.files[user.get_username() + '_' + k] = v
 
 		# gather performance data.
-		for recorded_result in all_recorded_results:
+		for user, recorded_result in zip(self.users, all_recorded_results):
 			self.performance_data.extend(recorded_result.performance)
+			self.retry_data.extend(recorded_result.retries)
+			self.tracer.extend(recorded_result.spans, user.get_username(), self.exams_span)
+			metrics.merge(recorded_result.metrics)
 
 		# abort if any errors.
 		worst_domain = get_most_severe_error_domain(all_recorded_results)
@@ -907,6 +1114,11 @@ class Run:
 					break
 			raise TiltrException(worst_domain, err)
 
+		if self.batch.is_load_test and int(self.settings.load_skip_verification):
+			# load tests measure ILIAS under load, checking results would only slow them down.
+			self.success = ("OK",)
+			return
+
 		# detailed integrity checks.
 		if self._verify_xls(master, test_driver, all_recorded_results) == "OK":
 			self.success = ("OK",)
@@ -917,17 +1129,15 @@ class Run:
 		self.protocols[type].append(text)
 
 	def protocol_master(self, text):
-		self.add_to_protocol("master", text)
+		self.add_to_protocol("machines/master.txt", text)
 
 	def store_into_database(self, elapsed_time):
 		files = self.files.copy()
-		files['protocol.txt'] = self._make_protocol().encode('utf8')
-
-		for protocol_name, protocol_text in self.protocols["postprocessing"].items():
-			files['postprocessing/%s' % protocol_name] = ("\n".join(protocol_text)).encode('utf8')
+		if self.verification:
+			files['verification.json'] = json.dumps(self.verification).encode('utf8')
 
-		for part in itertools.chain(["master"], (user.get_username() for user in self.users)):
-			files['machines/%s.txt' % part] = ("\n".join(self.protocols[part])).encode('utf8')
+		# protocol.txt, postprocessing/* and machines/* are generated from this.
+		files[RunLog.filename] = self.log.close()
 
 		try:
 			files_data = dict((k, base64.b64encode(v).decode('utf8')) for k, v in files.items())
@@ -943,7 +1153,10 @@ class Run:
 				num_users=len(self.users),
 				elapsed_time=elapsed_time)
 			db.put_performance_data(self.performance_data)
+			db.put_retry_data(self.retry_data + retries.drain(self.batch_id))
+			db.put_spans(self.batch_id, self.tracer.get_spans())
 			db.put_coverage_data(self.coverage)
+			db.delete_checkpoints(self.batch_id)
 
 	def cleanup(self, master):
 		self.users_factory.release(self._users_backend(master))
@@ -963,63 +1176,181 @@ class Run:
 		except:
 			traceback.print_exc()
 
-	def run(self):
-		t0 = time.time()
+	def _checkpoint(self, phase, **data):
+		# a failing checkpoint only costs us the ability to resume.
+		try:
+			self.checkpoints.put(phase, **data)
+		except:
+			traceback.print_exc()
+
+	def _checkpoint_run(self, temp_test_name):
+		# everything needed to resume this run, or to clean up after it.
+		self._checkpoint(
+			"run",
+			test_id=self.test.get_id(),
+			test_title=temp_test_name,
+			users_prefix=self.users_factory.prefix,
+			n_users=self.users_factory.n,
+			settings=self.settings.to_dict(),
+			workarounds=self.workarounds.to_dict(),
+			wait_time=self.wait_time,
+			ilias_version=self.ilias_version.text,
+			n_machines=len(self.machines))
+
+	def _restore_preparation(self, prepared):
+		self.temp_test = ImportedTest(prepared["test_title"]) if prepared["test_title"] else None
+		self.used_test = self.temp_test or self.test
+		self.users = self.checkpoints.get_users()
+		self.users_factory.prefix = self.checkpoints.get("users")["prefix"]
+		self.users_factory.users = self.users
+		self.test_url = prepared["test_url"]
+		self.language = prepared["language"]
+		self.questions = unpickled(prepared["questions"])
+		self.exam_configuration = unpickled(prepared["exam_configuration"])
 
+		header = self.protocols["header"]
+		header.append("Tested on ILIAS %s." % self.ilias_version.text)
+		header.append('Using test "%s".' % self.test.get_title())
+		header.append("Resumed after an interruption.")
+		self.workarounds.print_status(self.protocols["preferences/workarounds"].append)
+		self.settings.print_status(self.protocols["preferences/settings"].append)
+
+	def _prepare_test(self):
 		# we copy the test for each run, since checking readjustments will
 		# destroy the test and would influence following test runs.
 		copy_test = True
 
-		temp_test = None  # the temporary copy of the test (deleted soon).
-		used_test = None  # the test actually used (copied or not, depends).
+		prepared = self.checkpoints.get("prepared")
+		if prepared is not None:
+			self.report("master", "resuming run, test was already prepared.")
+			self._restore_preparation(prepared)
+			return
 
-		try:
-			with self.batch.in_master(self.protocol_master) as master:
-				try:
-					if copy_test:
-						with tempfile.TemporaryDirectory() as tmpdir:
+		interrupted = self.checkpoints.get("run")
+		if self.checkpoints.get("users") is not None:
+			self.users_factory.prefix = self.checkpoints.get("users")["prefix"]
+			self.users_factory.users = self.checkpoints.get_users()
+		elif interrupted is not None:
+			self.users_factory.prefix = interrupted["users_prefix"]
+
+		with trace("prepare"), self.batch.in_master(self.protocol_master) as master:
+			try:
+				if copy_test:
+					imported = self.checkpoints.get("test_imported")
+					if imported is not None:
+						temp_test_name = imported["test_title"]
+						self.report("master", "resuming run, test was already imported as %s." % temp_test_name)
+					else:
+						if interrupted is not None and interrupted["test_title"]:
+							# an import got interrupted, it might have left a test behind.
+							try:
+								master.user_driver.delete_test(interrupted["test_title"])
+							except:
+								pass
+
+						with tempfile.TemporaryDirectory() as tmpdir, trace("import test"):
 							temp_test_name = create_temp_test_name()
+							self._checkpoint_run(temp_test_name)
 							test_path = _patch_exam_name(
 								self.test.get_path(), temp_test_name, tmpdir)
 							master.user_driver.import_test(test_path)
+						self._checkpoint("test_imported", test_title=temp_test_name)
 
-						temp_test = ImportedTest(temp_test_name)
-						used_test = temp_test
+					self.temp_test = ImportedTest(temp_test_name)
+					self.used_test = self.temp_test
 
-						temp_test.cache.transfer_invariants(self.test.cache)
-					else:
-						used_test = self.test
+					self.temp_test.cache.transfer_invariants(self.test.cache)
+				else:
+					if self.checkpoints.get("run") is None:
+						self._checkpoint_run(None)
+					self.used_test = self.test
+
+				test_driver = master.user_driver.create_test_driver(self.used_test)
+				self.prepare(master, test_driver)
+
+				if self.temp_test:
+					self.test.cache.transfer_invariants(self.temp_test.cache)
+
+				self._checkpoint(
+					"prepared",
+					test_title=self.temp_test.get_title() if self.temp_test else None,
+					test_url=self.test_url,
+					language=self.language,
+					questions=pickled(self.questions),
+					exam_configuration=pickled(self.exam_configuration))
+			except Exception as e:
+				traceback.print_exc()
+				self._save_error_screenshot(master)
+				raise e
+
+	def run_preparation(self):
+		# prepare this run ahead of time (used for pipelined looping). errors are
+		# kept and raised later in run(), so they get reported as usual.
+		self.t0 = time.time()
+		try:
+			with self.tracer.activate(), retries.scope(self.batch_id):
+				self._prepare_test()
+		except BaseException as e:
+			self.preparation_error = e
+		finally:
+			self.is_prepared = True
 
-					test_driver = master.user_driver.create_test_driver(used_test)
-					self.prepare(master, test_driver)
+	def discard(self):
+		# throw away a run that was prepared ahead of time, but never started.
+		try:
+			if self.temp_test or self.users:
+				with self.batch.in_master(self.protocol_master) as master:
+					if self.temp_test:
+						master.user_driver.delete_test(self.temp_test.get_title())
+						self.temp_test = None
+					if self.users:
+						self.cleanup(master)
+			self.checkpoints.clear()
+		except:
+			traceback.print_exc()
+		finally:
+			self.log.close()
 
-					if temp_test:
-						self.test.cache.transfer_invariants(temp_test.cache)
-				except Exception as e:
-					traceback.print_exc()
-					self._save_error_screenshot(master)
-					raise e
+	def run(self):
+		with self.tracer.activate(), retries.scope(self.batch_id):
+			return self._run()
+
+	def _run(self):
+		if self.t0 is None:
+			self.t0 = time.time()
+		t0 = self.t0
+
+		try:
+			if not self.is_prepared:
+				self._prepare_test()
+			elif self.preparation_error is not None:
+				raise self.preparation_error
 
 			try:
 				all_recorded_results = self.run_exams()
+				self.recorded_results = all_recorded_results
 			except Exception as e:
 				# in case of an error, always try to export XLS for later analysis.
 				try:
 					with self.batch.in_master(self.protocol_master) as master:
-						test_driver = master.user_driver.create_test_driver(used_test)
+						test_driver = master.user_driver.create_test_driver(self.used_test)
 						self.files["error/exported.xlsx"] = test_driver.export_xls()
 				except:
 					pass  # ignore
 				raise e  # original exception
+			finally:
+				# machines are free now. a pipelined looper may dispatch the next run.
+				self.batch.release_machines()
 
 			with self.batch.in_master(self.protocol_master) as master:
 				try:
-					test_driver = master.user_driver.create_test_driver(used_test)
-					self.analyze(master, test_driver, all_recorded_results)
+					test_driver = master.user_driver.create_test_driver(self.used_test)
+					with trace("analyze"):
+						self.analyze(master, test_driver, all_recorded_results)
 
-					if temp_test:
-						master.user_driver.delete_test(temp_test.get_title())
-						temp_test = None
+					if self.temp_test:
+						master.user_driver.delete_test(self.temp_test.get_title())
+						self.temp_test = None
 				except Exception as e:
 					self._save_error_screenshot(master)
 					raise e
@@ -1046,18 +1377,20 @@ class Run:
 			self.add_to_protocol("header", "Error: %s" % traceback.format_exc())
 
 		finally:
+			self.batch.release_machines()
+
 			self.add_to_protocol("header", "Finished with status %s." % encode_success(self.success))
 
-			if temp_test:
+			if self.temp_test:
 				try:
 					with self.batch.in_master(self.protocol_master) as master:
-						master.user_driver.delete_test(temp_test.get_title())
+						master.user_driver.delete_test(self.temp_test.get_title())
 				except:
 					traceback.print_exc()
 
 			try:
 				if self.users:
-					with self.batch.in_master(self.protocol_master) as master:
+					with trace("cleanup"), self.batch.in_master(self.protocol_master) as master:
 						self.cleanup(master)
 			except:
 				self.report("error", "cleanup failed")
@@ -1110,6 +1443,12 @@ class Batch(threading.Thread):
 		self._is_done = False
 		self._success = None
 
+		self.current_run = None
+		self.resumed = False
+		self.is_load_test = False
+		self._preparation = None
+		self._machines_released = threading.Event()
+
 		self.debug = False
 		self.ilias_url = None
 		self.ilias_admin_user = None
@@ -1144,9 +1483,27 @@ class Batch(threading.Thread):
 	def get_id(self):
 		return self.batch_id
 
+	def resume(self, batch_id):
+		# continue an interrupted run from its checkpoints, instead of starting a new one.
+		self.batch_id = batch_id
+		self.resumed = True
+
 	def set_recycle_users(self, recycle):
-		#self.users_factory.recycle = recycle
-		pass
+		self.users_factory.recycle = recycle
+
+	def destroy_recycled_users(self):
+		# deletes all accounts kept for recycling, including those this batch took.
+		self.set_recycle_users(False)
+
+		with self.in_master(lambda s: None) as master:
+			ilias_driver = ILIASDriver(
+				master.driver, self.ilias_url, self.ilias_version,
+				self.workarounds, self.settings, master.report)
+			make_backend = lambda: UsersBackend(ilias_driver, master.report)
+
+			if self.users_factory.users:
+				self.users_factory.release(make_backend)
+			UsersFactory.drain(self.test, make_backend)
 
 	def configure(self, args):
 		self.debug = args.debug
@@ -1155,15 +1512,44 @@ class Batch(threading.Thread):
 		self.ilias_admin_password = args.ilias_admin_password
 		self.verify_ssl = True if args.verify_ssl is None else json.loads(args.verify_ssl.lower())
 
+	def prepare_ahead(self):
+		# import the test copy, acquire users and fill the question cache on a
+		# separate master browser, while a previous batch is still being verified.
+		self.current_run = Run(self)
+		self._preparation = threading.Thread(target=self.current_run.run_preparation)
+		self._preparation.start()
+
+	def is_prepared(self):
+		return self._preparation is not None and not self._preparation.is_alive()
+
+	def discard(self):
+		if self._preparation is not None:
+			self._preparation.join()
+			self.current_run.discard()
+
+	def release_machines(self):
+		self._machines_released.set()
+
+	def machines_released(self):
+		return self._machines_released.is_set()
+
 	def run(self):
 		# clear ILIAS temp data (exported pdf and html files). if we don't do this
-		# regularly, GB and GB of data will fill up our disk until it's full.
+		# regularly, GB and GB of data will fill up our disk until it's full. if we
+		# got prepared ahead, a previous batch might still be exporting, so only
+		# remove older files then.
+		too_old = time.time() - (15 * 60 if self._preparation else 0)
 		for f in glob.glob('/tiltr/tmp/iliastemp/*'):
-			if os.path.isdir(f):
-				if len(os.listdir(f)) == 0:
-					os.rmdir(f)
-			else:
-				os.remove(f)
+			try:
+				if os.stat(f).st_mtime > too_old:
+					continue
+				if os.path.isdir(f):
+					if len(os.listdir(f)) == 0:
+						os.rmdir(f)
+				else:
+					os.remove(f)
+			except FileNotFoundError:
+				pass
 
 		if self._profiling:
 			import cProfile
@@ -1176,7 +1562,11 @@ class Batch(threading.Thread):
 
 			self.report("master", "connecting to ILIAS %s." % self.ilias_version.text)
 
-			run = Run(self)
+			if self._preparation is not None:
+				self._preparation.join()
+			else:
+				self.current_run = Run(self)
+			run = self.current_run
 			success = run.run()
 		finally:
 			try:
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+from typing import Dict, List
+
+import io
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import tempfile
+from contextlib import contextmanager
+from multiprocessing.dummy import Pool as ThreadPool
+
+import requests
+from openpyxl import load_workbook
+from texttable import Texttable
+
+from tiltr.data.database import DB
+from tiltr.data.pdf import PDF
+from tiltr.data.settings import Settings, Workarounds
+from tiltr.data.workbook import workbook_to_result, check_workbook_consistency
+from tiltr.http.fake import FakeExam, FakeServer, ilias_version
+
+from . import batch
+from .batch import take_exam, _patch_exam_name
+from .commands import TakeExamCommand
+
+
+# measures master throughput against the fake ILIAS and fake machines from
+# tiltr.http.fake, for a range of synthetic user counts. each stage runs the
+# same code a Run uses for that step:
+#
+# fanout: sending take_exam to all machines and polling until results arrive.
+# exports: downloading XLS, PDF (one per user) and xmlres exports.
+# workbook: checking the XLS and comparing it against every recorded result.
+# pdf: parsing all PDFs.
+# xmlres: patching the test export for a reimport.
+# database: storing all result files and performance data.
+#
+# all browser-driven steps (statistics tabs, readjustments, ...) are out of
+# scope, since they need a real ILIAS.
+
+stages = ("fanout", "exports", "workbook", "pdf", "xmlres", "database")
+
+
+@contextmanager
+def _stage(timings: Dict, name: str):
+	t0 = time.time()
+	try:
+		yield
+	finally:
+		timings[name] = time.time() - t0
+
+
+def _quiet(*args):
+	pass
+
+
+def _run_size(server: FakeServer, exam: FakeExam, db_path: str) -> Dict:
+	settings = Settings()
+	workarounds = Workarounds()
+	batch_id = "bench-%d-%d" % (len(exam.usernames), int(time.time()))
+	timings = dict()
+
+	server.set_exam(exam)
+
+	with _stage(timings, "fanout"):
+		args = []
+		for i, username in enumerate(exam.usernames):
+			args.append(dict(
+				batch_id=batch_id,
+				report=_quiet,
+				command=TakeExamCommand(
+					ilias_url=server.url + "/ilias",
+					verify_ssl=False,
+					ilias_version=ilias_version,
+					machine=server.machine(i),
+					machine_index=i + 1,
+					username=username,
+					password="",
+					test_id="bench",
+					test_url=server.url + "/ilias/participants.html",
+					questions=exam.questions,
+					exam_configuration=None,
+					settings=settings,
+					workarounds=workarounds,
+					wait_time=0,
+					admin_lang="en")))
+
+		pool = ThreadPool(len(args))
+		try:
+			recorded_results = pool.map(take_exam, args)
+		finally:
+			pool.close()
+			pool.join()
+
+	failed = [r for r in recorded_results if r.errors]
+	if failed:
+		raise RuntimeError("fake exams failed: %s" % json.dumps(failed[0].errors))
+
+	with _stage(timings, "exports"):
+		xls = requests.get(server.url + "/ilias/export.xlsx").content
+		pdfs = dict((username, requests.get(
+			server.url + "/ilias/export.pdf", params=dict(user=username)).content)
+			for username in exam.usernames)
+		xmlres = requests.get(server.url + "/ilias/export.zip").content
+
+	with _stage(timings, "workbook"):
+		workbook = load_workbook(filename=io.BytesIO(xls))
+		check_workbook_consistency(workbook, exam.questions, workarounds, ilias_version, None)
+
+		protocol = []
+		for username, recorded_result in zip(exam.usernames, recorded_results):
+			ilias_result = workbook_to_result(
+				workbook, username, exam.questions, workarounds, ilias_version, None)
+			if not recorded_result.check_against(ilias_result, protocol.append, workarounds):
+				raise RuntimeError("fake export did not match recorded result for %s" % username)
+
+	with _stage(timings, "pdf"):
+		parsed = [PDF(data) for data in pdfs.values()]  # parsed in the background
+		for pdf in parsed:
+			pdf.scores
+
+	with _stage(timings, "xmlres"):
+		with tempfile.TemporaryDirectory() as tmpdir:
+			path = os.path.join(tmpdir, "export.zip")
+			with open(path, "wb") as f:
+				f.write(xmlres)
+			_patch_exam_name(path, "bench-reimport", tmpdir)
+
+	with _stage(timings, "database"):
+		files = dict()
+		files["original/exported_r0.xlsx"] = xls
+		for username, recorded_result in zip(exam.usernames, recorded_results):
+			files["%s.pdf" % username] = pdfs[username]
+			for k, v in recorded_result.files.items():
+				files[username + "_" + k] = v
+		files["protocol.txt"] = "\n".join(protocol).encode("utf8")
+
+		performance_data = []
+		for recorded_result in recorded_results:
+			performance_data.extend(recorded_result.performance)
+
+		with DB(db_path) as db:
+			db.put(
+				batch_id=batch_id,
+				success="OK",
+				files=json.dumps(dict((k, base64.b64encode(v).decode("utf8")) for k, v in files.items())),
+				num_users=len(exam.usernames),
+				elapsed_time=0)
+			db.put_performance_data(performance_data)
+
+	total = sum(timings.values())
+	return dict(
+		users=len(exam.usernames),
+		questions=len(exam.questions),
+		stages=timings,
+		total=total,
+		users_per_second=len(exam.usernames) / total if total > 0 else 0,
+		xls_bytes=len(xls),
+		pdf_bytes=sum(len(data) for data in pdfs.values()))
+
+
+def run_benchmark(
+		sizes: List[int], n_questions: int = 10, exam_seconds: float = 0,
+		poll_interval: float = None, port: int = 8890, db_path: str = None) -> List[Dict]:
+
+	if poll_interval is not None:
+		batch.monitor_poll_interval = poll_interval
+
+	server = FakeServer(FakeExam(1, n_questions), port, exam_seconds)
+	server.start()
+
+	try:
+		with tempfile.TemporaryDirectory() as tmpdir:
+			db_path = db_path or os.path.join(tmpdir, "results.db")
+
+			reports = []
+			for n_users in sizes:
+				print("benchmarking %d users..." % n_users)
+				sys.stdout.flush()
+				reports.append(_run_size(server, FakeExam(n_users, n_questions), db_path))
+			return reports
+	finally:
+		server.stop()
+
+
+def print_reports(reports: List[Dict]):
+	table = Texttable()
+	table.set_deco(Texttable.HEADER)
+	table.set_cols_dtype(['i'] + ['f'] * (len(stages) + 2))
+	table.add_row(['users'] + list(stages) + ['total', 'users/s'])
+	for report in reports:
+		table.add_row(
+			[report["users"]] +
+			[report["stages"][stage] for stage in stages] +
+			[report["total"], report["users_per_second"]])
+	print(table.draw())
+
+
+def run_benchmark_cli():
+	parser = argparse.ArgumentParser(description="benchmark the TiltR master against a fake ILIAS.")
+	parser.add_argument('--benchmark', action='store_true')
+	parser.add_argument('--users', default="10,100,1000", help="comma separated user counts")
+	parser.add_argument('--questions', type=int, default=10)
+	parser.add_argument('--exam-seconds', type=float, default=0, help="time each fake exam takes")
+	parser.add_argument('--poll-interval', type=float, help="override the master's monitor poll interval")
+	parser.add_argument('--port', type=int, default=8890)
+	parser.add_argument('--output', help="write the results as JSON to this file")
+	args = parser.parse_args()
+
+	reports = run_benchmark(
+		[int(n) for n in args.users.split(",")],
+		n_questions=args.questions,
+		exam_seconds=args.exam_seconds,
+		poll_interval=args.poll_interval,
+		port=args.port)
+
+	print_reports(reports)
+
+	if args.output:
+		with open(args.output, "w") as f:
+			f.write(json.dumps(reports, indent=2))
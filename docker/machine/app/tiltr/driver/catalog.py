@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+from typing import Dict, List, Tuple
+
+import os
+import re
+import json
+import time
+import threading
+import traceback
+from zipfile import ZipFile
+import xml.etree.ElementTree as ET
+
+
+# an index of all packaged tests in /tiltr/tests. inspecting a test means opening
+# its zip and parsing its xml, which is slow for large libraries. we therefore
+# keep precomputed metadata in memory and on disk, keyed by (path, mtime, size),
+# and only inspect zips that were added or changed.
+
+
+def _find_xml(names: List[str], kind: str):
+	for name in names:
+		if re.match(r"^[^/]*/[^/]+_%s_[^/]+\.xml$" % kind, name):
+			return name
+	return None
+
+
+def _qti_metadata(element, label):
+	for field in element.findall("./qtimetadata/qtimetadatafield"):
+		if field.findtext("fieldlabel") == label:
+			return field.findtext("fieldentry")
+	return None
+
+
+def inspect_test(path: str) -> Dict:
+	with ZipFile(path, 'r') as zf:
+		names = zf.namelist()
+
+		main = _find_xml(names, "tst")
+		if main is None:
+			raise RuntimeError("did not find test xml in zip")
+
+		root = ET.fromstring(zf.read(main))
+		title = root.findall(".//Title")[0].text
+
+		question_types = []
+		export_version = None
+
+		qti = _find_xml(names, "qti")
+		if qti is not None:
+			qti_root = ET.fromstring(zf.read(qti))
+
+			for assessment in qti_root.iter("assessment"):
+				export_version = _qti_metadata(assessment, "ILIAS_VERSION")
+
+			for item in qti_root.iter("item"):
+				question_type = None
+				for metadata in item.findall("./itemmetadata"):
+					question_type = _qti_metadata(metadata, "QUESTIONTYPE")
+				question_types.append(question_type or "unknown")
+
+	return dict(
+		title=title,
+		num_questions=len(question_types),
+		question_types=sorted(set(question_types)),
+		export_version=export_version)
+
+
+class TestCatalog:
+	def __init__(self, tests_path="/tiltr/tests", index_path="/tiltr/tmp/tests_index.json", refresh_interval=5):
+		self.tests_path = tests_path
+		self.index_path = index_path
+		self.refresh_interval = refresh_interval
+
+		self.mutex = threading.Lock()
+		self.entries = None
+		self.refresh_time = 0
+
+	def _load_index(self) -> Dict:
+		try:
+			with open(self.index_path, "r") as f:
+				return json.load(f)
+		except FileNotFoundError:
+			return dict()
+		except:
+			traceback.print_exc()
+			return dict()
+
+	def _save_index(self):
+		try:
+			tmp_path = self.index_path + ".tmp"
+			with open(tmp_path, "w") as f:
+				json.dump(self.entries, f)
+			os.replace(tmp_path, self.index_path)
+		except:
+			traceback.print_exc()
+
+	def _refresh(self):
+		if self.entries is None:
+			self.entries = self._load_index()
+
+		entries = dict()
+		changed = False
+
+		for filename in os.listdir(self.tests_path):
+			if not filename.endswith(".zip"):
+				continue
+
+			test_id = os.path.splitext(filename)[0]
+			path = os.path.join(self.tests_path, filename)
+			try:
+				stat = os.stat(path)
+			except FileNotFoundError:
+				continue  # deleted since we listed it.
+
+			entry = self.entries.get(test_id)
+			if entry and entry["path"] == path and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+				entries[test_id] = entry
+				continue
+
+			try:
+				entry = inspect_test(path)
+			except:
+				print("could not inspect Test %s." % filename)
+				traceback.print_exc()
+				entry = dict(error=True)
+
+			entry.update(dict(path=path, mtime=stat.st_mtime, size=stat.st_size))
+			entries[test_id] = entry
+			changed = True
+
+		if changed or len(entries) != len(self.entries):
+			self.entries = entries
+			self._save_index()
+
+		self.refresh_time = time.time()
+
+	def _get_entries(self) -> Dict:
+		with self.mutex:
+			if self.entries is None or time.time() - self.refresh_time > self.refresh_interval:
+				self._refresh()
+			return self.entries
+
+	def get(self, test_id: str) -> Dict:
+		entry = self._get_entries().get(test_id)
+		if entry is None or entry.get("error"):
+			return None
+		return entry
+
+	def list(self) -> List[Tuple[str, str]]:
+		tests = [(entry["title"], test_id) for test_id, entry in self._get_entries().items() if not entry.get("error")]
+		return sorted(tests, key=lambda t: t[0])
+
+	def details(self) -> List[Dict]:
+		tests = []
+		for test_id, entry in self._get_entries().items():
+			if not entry.get("error"):
+				tests.append(dict(
+					id=test_id,
+					title=entry["title"],
+					num_questions=entry["num_questions"],
+					question_types=entry["question_types"],
+					export_version=entry["export_version"]))
+		return sorted(tests, key=lambda t: t["title"])
+
+
+catalog = TestCatalog()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+from typing import Dict, List, Tuple
+
+import json
+import base64
+import pickle
+import traceback
+
+from tiltr.data.result import open_results
+
+from .drivers import ILIASDriver, UsersBackend, TemporaryUser
+
+
+# durable progress of a run. after each phase (test imported, users created,
+# test prepared, each machine's result, each verification round), a run puts
+# a checkpoint into the results database. checkpoints get deleted as soon as
+# the run's results are stored, so any batch that still has checkpoints on
+# startup got interrupted: the master either resumes it from its last phase
+# or deletes its temporary test and users.
+
+
+def pickled(x) -> str:
+	return base64.b64encode(pickle.dumps(x, pickle.HIGHEST_PROTOCOL)).decode("utf-8")
+
+
+def unpickled(data: str):
+	return pickle.loads(base64.b64decode(data.encode("utf-8")))
+
+
+class Checkpoints:
+	def __init__(self, batch_id: str):
+		self.batch_id = batch_id
+		self.phases = dict()
+
+	def load(self) -> 'Checkpoints':
+		with open_results() as db:
+			self.phases = dict((k, json.loads(v)) for k, v in db.get_checkpoints(self.batch_id).items())
+		return self
+
+	def put(self, phase: str, **data):
+		with open_results() as db:
+			db.put_checkpoint(self.batch_id, phase, json.dumps(data))
+		self.phases[phase] = data
+
+	def get(self, phase: str) -> Dict:
+		return self.phases.get(phase)
+
+	def clear(self):
+		with open_results() as db:
+			db.delete_checkpoints(self.batch_id)
+		self.phases = dict()
+
+	@property
+	def progress(self) -> int:
+		return len(self.phases)
+
+	def get_users(self) -> List[TemporaryUser]:
+		users = []
+		for username, password in self.get("users")["users"]:
+			user = TemporaryUser()
+			user.username = username
+			user.password = password
+			users.append(user)
+		return users
+
+	def get_last_round(self, prefix: str) -> Tuple[int, Dict]:
+		# index and data of the last completed verification round, or (-1, None).
+		rounds = []
+		for phase, data in self.phases.items():
+			if phase.startswith("round/" + prefix):
+				rounds.append((int(phase.split("/")[-1]), data))
+		return max(rounds, key=lambda x: x[0]) if rounds else (-1, None)
+
+	@staticmethod
+	def unfinished() -> List['Checkpoints']:
+		with open_results() as db:
+			batch_ids = db.get_unfinished_batches()
+		return [Checkpoints(batch_id).load() for batch_id in batch_ids]
+
+
+def collect_orphans(batch, checkpoints: Checkpoints):
+	# deletes what an interrupted run left behind in ILIAS. batch needs to be
+	# configured like the interrupted one.
+	run = checkpoints.get("run")
+
+	if run is not None:
+		with batch.in_master(lambda s: None) as master:
+			if run["test_title"]:
+				try:
+					master.user_driver.delete_test(run["test_title"])
+				except:
+					traceback.print_exc()  # probably never got imported.
+
+			if run["users_prefix"]:
+				ilias_driver = ILIASDriver(
+					master.driver, batch.ilias_url, batch.ilias_version,
+					batch.workarounds, batch.settings, master.report)
+				UsersBackend(ilias_driver, master.report).destroy_all(run["users_prefix"], run["n_users"])
+
+	checkpoints.clear()
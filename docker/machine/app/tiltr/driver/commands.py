@@ -15,10 +15,14 @@ import selenium
 
 from selenium.common.exceptions import WebDriverException
 
-from .utils import get_driver_error_details, run_interaction
-from .drivers import UserDriver, PackagedTest
+from .utils import get_driver_error_details, run_interaction, set_poll_frequency
+from .drivers import UserDriver, PackagedTest, version_label
+from .http_exam import HttpSession, HttpExamDriver
+from .replay import RecordingRandom, SessionTrace, StepLog
 from tiltr.data.result import Result, Origin
 from tiltr.data.context import TestContext, RegressionContext, RandomContext
+from tiltr.data.tracing import Tracer, trace
+from tiltr.data.metrics import metrics
 from tiltr.data.exceptions import ErrorDomain, TiltrException, InteractionException
 from tiltr.data.settings import Settings, Workarounds
 from tiltr.question.answers.answer import Validness
@@ -85,14 +89,15 @@ class ExamRobot:
 		for i, p in enumerate(passes):
 			self.report("entering pass %d." % i)
 
-			if p == 'A':
-				self._run_answer_pass()
-			elif p == 'V':
-				self._run_verify_pass()
-			elif p == 'R':
-				self._run_modify_pass()
-			else:
-				raise RuntimeError("unknown pass type %s" % p)
+			with trace("pass %d: %s" % (i, p)):
+				if p == 'A':
+					self._run_answer_pass()
+				elif p == 'V':
+					self._run_verify_pass()
+				elif p == 'R':
+					self._run_modify_pass()
+				else:
+					raise RuntimeError("unknown pass type %s" % p)
 
 
 class TakeExamCommand:
@@ -122,6 +127,7 @@ class TakeExamCommand:
 		self.test_url = data["test_url"]
 		self.wait_time = data["wait_time"]
 		self.admin_lang = data["admin_lang"]
+		self.trace = data.get("trace")  # a recorded SessionTrace as base64, if replaying
 
 		self.n_deterministic_machines = int(self.settings.num_deterministic_machines)
 
@@ -142,7 +148,8 @@ class TakeExamCommand:
 			settings=self.settings.to_dict(),
 			workarounds=self.workarounds.to_dict(),
 			wait_time=self.wait_time,
-			admin_lang=self.admin_lang))
+			admin_lang=self.admin_lang,
+			trace=self.trace))
 
 	def _create_result_with_details(
 			self, driver: selenium.webdriver.Remote, report: Callable[[str], None], e: Exception, trace: str):
@@ -167,45 +174,158 @@ class TakeExamCommand:
 
 		return Result.from_error(Origin.recorded, e.get_error_domain(), error, files)
 
-	def run(self, browser, master_report: Callable[[str], None]):
-		driver = browser.driver
+	def uses_browser(self):
+		return self.settings.exam_driver != "http"
+
+	def _create_context(self):
+		if self.trace is not None:
+			recorded = SessionTrace.from_bytes(base64.b64decode(self.trace.encode("utf-8")))
+			context = self._create_context_of_kind(recorded.context_kind)
+			context.random = recorded.create_random()
+			return context, recorded
+		else:
+			context = self._create_context_of_kind(
+				"regression" if self.machine_index <= self.n_deterministic_machines else "random")
+			context.random = RecordingRandom(context.random)
+			return context, None
+
+	def _create_context_of_kind(self, kind):
+		if kind == "regression":
+			# some machines can operate deterministically as a well-defined baseline regression test
+			return RegressionContext(
+				self.machine_index * 73939133,
+				self.questions,
+				self.settings,
+				self.workarounds,
+				self.admin_lang,
+				self.ilias_version)
+		else:
+			return RandomContext(
+				self.questions,
+				self.settings,
+				self.workarounds,
+				self.admin_lang,
+				self.ilias_version)
+
+	def _attach_trace(self, result, context, exam_driver):
+		if result is None or exam_driver is None or not isinstance(context.random, RecordingRandom):
+			return
+
+		recorded = SessionTrace(
+			"regression" if isinstance(context, RegressionContext) else "random",
+			context.random.floats,
+			context.random.bits,
+			exam_driver.steps.steps,
+			dict(
+				machine_index=self.machine_index,
+				test_id=self.test_id,
+				ilias_version=list(self.ilias_version),
+				exam_driver=self.settings.exam_driver))
+
+		result.attach_file(SessionTrace.filename, recorded.to_bytes())
+
+	def _start_replay(self, exam_driver, recorded, report):
+		if recorded is not None:
+			exam_driver.steps = StepLog(recorded.steps)
+			report("replaying recorded session of machine #%s." % recorded.info.get("machine_index"))
+
+	def _run_http(self, master_report: Callable[[str], None], machine_info: str, tracer: Tracer):
+		session = HttpSession(self.verify_ssl, master_report)
+
+		try:
+			with tracer.activate():
+				with trace("open test"):
+					session.login(self.ilias_url, self.username, self.password)
+
+				context, recorded = self._create_context()
+
+				with trace("start exam"):
+					session.start_test(self.test_url)
+					exam_driver = HttpExamDriver(
+						session, self.ilias_url, self.username, master_report,
+						context, self.questions, self.exam_configuration)
+
+				try:
+					exam_driver.add_protocol(machine_info)
+					self._start_replay(exam_driver, recorded, exam_driver.add_protocol)
+
+					def report(s):
+						master_report(s)
+						exam_driver.add_protocol(s)
+
+					robot = ExamRobot(exam_driver, context, report, self.questions, self.settings)
+					robot.run(self.settings.test_passes)
+
+					with trace("finish exam"):
+						exam_driver.close()
+				except TiltrException as e:
+					traceback.print_exc()
+					files = dict()
+					files['error/trace.txt'] = traceback.format_exc().encode('utf8')
+					if session.page is not None:
+						files['error/page.html'] = session.page.source.encode('utf8')
+					error = 'test failed on url %s.' % (session.page.url if session.page else None)
+					master_report(error)
+					r = Result.from_error(Origin.recorded, e.get_error_domain(), error, files)
+					exam_driver.add_protocol_to_result(r)
+					self._attach_trace(r, context, exam_driver)
+					return r
+
+				result = exam_driver.get_expected_result(self.workarounds, self.admin_lang)
+				result.attach_coverage(context.coverage)
+				result.attach_spans(tracer.get_spans())
+				self._attach_trace(result, context, exam_driver)
+		except TiltrException as e:
+			traceback.print_exc()
+			master_report("test aborted: %s" % traceback.format_exc())
+			return Result.from_error(Origin.recorded, e.get_error_domain(), traceback.format_exc())
+		except:
+			traceback.print_exc()
+			master_report("test aborted with an unexpected error: %s" % traceback.format_exc())
+			return None
+
+		master_report("done running test.")
+		return result
 
+	def run(self, browser, master_report: Callable[[str], None]):
 		machine_info = "running test on machine #%s (%s)." % (self.machine_index, self.machine)
 		master_report(machine_info)
 
+		set_poll_frequency(float(self.settings.wait_poll_frequency))
+
+		metrics.set_labels(
+			machine=self.machine,
+			ilias_version=version_label(self.ilias_version),
+			browser=self.settings.browser if self.uses_browser() else "http")
+
+		tracer = Tracer("machine")
+
+		if not self.uses_browser():
+			return self._run_http(master_report, machine_info, tracer)
+
+		driver = browser.driver
+
 		try:
-			with run_interaction():
+			with run_interaction(), tracer.activate():
 
 				user_driver = UserDriver(
 					driver, self.ilias_url, self.ilias_version, master_report, verify_ssl=self.verify_ssl)
 
 				with user_driver.login(self.username, self.password):
 
-					test_driver = user_driver.create_test_driver(PackagedTest(self.test_id))
-					test_driver.goto(self.test_url)
-
-					if self.machine_index <= self.n_deterministic_machines:
-						# some machines can operate deterministically as a well-defined baseline regression test
-						context = RegressionContext(
-							self.machine_index * 73939133,
-							self.questions,
-							self.settings,
-							self.workarounds,
-							self.admin_lang,
-							self.ilias_version)
-					else:
-						context = RandomContext(
-							self.questions,
-							self.settings,
-							self.workarounds,
-							self.admin_lang,
-							self.ilias_version)
-
-					exam_driver = test_driver.start(
-						self.username, context, self.questions, self.exam_configuration)
+					test_driver = user_driver.create_test_driver(PackagedTest(self.test_id, use_catalog=False))
+					with trace("open test"):
+						test_driver.goto(self.test_url)
+
+					context, recorded = self._create_context()
+
+					with trace("start exam"):
+						exam_driver = test_driver.start(
+							self.username, context, self.questions, self.exam_configuration)
 
 					try:
 						exam_driver.add_protocol(machine_info)
+						self._start_replay(exam_driver, recorded, exam_driver.add_protocol)
 
 						def report(s):
 							master_report(s)
@@ -218,12 +338,16 @@ class TakeExamCommand:
 						traceback.print_exc()
 						r = self._create_result_with_details(driver, master_report, e, traceback.format_exc())
 						exam_driver.add_protocol_to_result(r)
+						self._attach_trace(r, context, exam_driver)
 						return r
 
-					exam_driver.close()
+					with trace("finish exam"):
+						exam_driver.close()
 
 					result = exam_driver.get_expected_result(self.workarounds, self.admin_lang)
 					result.attach_coverage(context.coverage)
+					result.attach_spans(tracer.get_spans())
+					self._attach_trace(result, context, exam_driver)
 
 		except TiltrException as e:
 			traceback.print_exc()
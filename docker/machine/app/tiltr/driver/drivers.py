@@ -5,21 +5,23 @@
 # GPLv3, see LICENSE
 #
 
-from typing import List
+from typing import List, Tuple
 
 import os
 import datetime
+import hashlib
+import pickle
+import uuid
 import io
 import re
 import json
+import threading
 import requests
 import traceback
 from urllib.parse import urlparse, parse_qs
 from decimal import *
 from collections import namedtuple, defaultdict
 
-from zipfile import ZipFile
-import xml.etree.ElementTree as ET
 from xml.etree.ElementTree import Element, SubElement, tostring
 
 import selenium
@@ -32,12 +34,16 @@ from selenium.webdriver.common.by import By
 
 from .utils import *
 from .exam_configuration import *
+from .catalog import catalog, inspect_test
+from .replay import StepLog, answer_state
 
 from tiltr.data.exceptions import *
 from tiltr.question import *
 from tiltr.data.result import *
 from tiltr.question.protocol import AnswerProtocol
 from tiltr.data.pdf import PDF
+from tiltr.data.tracing import trace
+from tiltr.data.metrics import metrics
 
 
 UserStat = namedtuple('UserStat', ['score', 'maximum_score', 'percentage', 'short_mark'])
@@ -344,16 +350,19 @@ class TemporaryUser:
 		return self.password
 
 
-def create_users_xml(base_url, tmp_users):
+def create_users_xml(base_url, tmp_users, action='Update'):
 	users = Element('Users')
 	SubElement(users, 'UDFDefinitions')
 
 	children = []
 	for tmp_user in tmp_users:
-		user = Element('User', Language='de', Action='Update')
+		user = Element('User', Language='de', Action=action)
 		children.append(user)
 
 		SubElement(user, 'Login').text = tmp_user.get_username()
+		if action == 'Delete':
+			continue
+
 		SubElement(user, 'Password', Type='PLAIN').text = tmp_user.get_password()
 
 		SubElement(user, 'Firstname').text = tmp_user.get_username()
@@ -383,25 +392,6 @@ class UsersBackend:
 		self.ilias_driver = ilias_driver
 		self.driver = ilias_driver.driver
 		self.report = report
-		self.batch_limit = 2
-
-	def _add_user(self, driver, username, password):
-		with wait_for_page_load(driver):
-			driver.find_element_by_xpath("//a[contains(@href, 'cmd=addUser')]").click()
-
-		driver.find_element_by_css_selector("input[id='gender_m']").click()
-
-		set_inputs(
-			driver,
-			login=username,
-			passwd=password,
-			passwd_retype=password,
-			firstname=username,
-			lastname="user",
-			email="ilias@localhost")
-
-		with wait_for_page_load(driver):
-			driver.find_element_by_css_selector("input[name='cmd[save]']").click()
 
 	def _delete_users(self, driver, username_prefix, n):
 		n_clicked = 0
@@ -442,22 +432,18 @@ class UsersBackend:
 		return n_clicked
 
 	def create(self, prefix, n):
+		# a single xml import costs the same for 1 and 500 users.
 		self.report("creating %d users." % n)
-		users = []
-		if n >= self.batch_limit:
-			users = self._create_n_users(prefix, n)
-		else:
-			for i in range(n):
-				users.append(self._create_1_user(prefix, i))
+		users = self._create_n_users(prefix, n)
 		self.report("done creating users.")
 		return users
 
 	def destroy(self, prefix, users):
-		if len(users) >= self.batch_limit:
-			self._delete_n_users(prefix, users)
-		else:
-			for user in users:
-				self._delete_1_user(prefix, user)
+		self._delete_n_users(prefix, users)
+
+	def destroy_all(self, prefix, n):
+		# destroys users created by create(prefix, n), without having them at hand.
+		self._delete_n_users(prefix, [self._create_temporary_user(prefix, i) for i in range(n)])
 
 	def _create_temporary_user(self, prefix, unique_id):
 		user = TemporaryUser()
@@ -469,63 +455,58 @@ class UsersBackend:
 
 		return user
 
-	def _create_n_users(self, prefix, n):
+	def _import_users_xml(self, users, action):
 		parsed = urlparse(self.driver.current_url)
 		base_url = parsed.scheme + "://" + parsed.netloc + '/'.join(parsed.path.split('/')[:-1])
 
-		xml_path = os.path.abspath(os.path.join("/tiltr/tmp", "users.xml"))
+		xml_path = os.path.abspath(os.path.join("/tiltr/tmp", "users_%s.xml" % uuid.uuid4()))
 
-		users = []
-		for i in range(n):
-			users.append(self._create_temporary_user(prefix, i))
-		xml = create_users_xml(base_url, users)
+		xml = create_users_xml(base_url, users, action)
 
 		with open(xml_path, "w") as f:
 			f.write(xml)
 
-		self.ilias_driver.goto_user_administration()
+		try:
+			self.ilias_driver.goto_user_administration()
 
-		with wait_for_page_load(self.driver):
-			self.driver.find_element_by_xpath("//a[contains(@href, 'cmd=importUserForm')]").click()
+			with wait_for_page_load(self.driver):
+				self.driver.find_element_by_xpath("//a[contains(@href, 'cmd=importUserForm')]").click()
 
-		self.report("uploading xml user file with %d users." % n)
+			self.report("uploading xml user file with %d users (%s)." % (len(users), action.lower()))
 
-		import_button = self.driver.find_element_by_name('cmd[importUserRoleAssignment]')
+			import_button = self.driver.find_element_by_name('cmd[importUserRoleAssignment]')
 
-		with wait_for_page_load(self.driver):
-			self.driver.find_element_by_css_selector("#il_prop_cont_importFile input").send_keys(xml_path)
-			import_button.click()
+			with wait_for_page_load(self.driver):
+				self.driver.find_element_by_css_selector("#il_prop_cont_importFile input").send_keys(xml_path)
+				import_button.click()
 
-		with wait_for_page_load(self.driver):
-			self.driver.find_element_by_css_selector("option[value='update_on_conflict']").click()
-			import_users_button = self.driver.find_element_by_name('cmd[importUsers]')
-			interact(self.driver, lambda: import_users_button.click())
+			with wait_for_page_load(self.driver):
+				self.driver.find_element_by_css_selector("option[value='update_on_conflict']").click()
+				import_users_button = self.driver.find_element_by_name('cmd[importUsers]')
+				interact(self.driver, lambda: import_users_button.click())
+		finally:
+			os.remove(xml_path)
+
+	def _create_n_users(self, prefix, n):
+		users = []
+		for i in range(n):
+			users.append(self._create_temporary_user(prefix, i))
+
+		self._import_users_xml(users, 'Update')
 
 		return users
 
 	def _delete_n_users(self, prefix, users):
 		try:
-			n = self._delete_users(self.driver, prefix, len(users))
-			self.report("deleted %d user(s)." % n)
+			self._import_users_xml(users, 'Delete')
+			self.report("deleted %d user(s)." % len(users))
+			return
 		except:
-			self.report("deletion of user failed.")
+			self.report("bulk deletion of users failed, deleting via user table.")
 			self.report(traceback.format_exc())
 
-	def _create_1_user(self, prefix, unique_id):
-		user = self._create_temporary_user(prefix, unique_id)
-
-		def perform_action():
-			self.ilias_driver.goto_user_administration()
-			self.report("creating user %s." % user.username)
-			self._add_user(self.driver, user.username, user.password)
-
-		interact(self.driver, perform_action)
-
-		return user
-
-	def _delete_1_user(self, prefix, user):
 		try:
-			n = self._delete_users(self.driver, user.username, 1)
+			n = self._delete_users(self.driver, prefix, len(users))
 			self.report("deleted %d user(s)." % n)
 		except:
 			self.report("deletion of user failed.")
@@ -533,6 +514,12 @@ class UsersBackend:
 
 
 class UsersFactory:
+	# keeps a warm pool of test accounts in the test's cache when recycling. as
+	# every run imports a fresh copy of the test, recycled accounts start without
+	# any test passes and need no reset.
+
+	max_pooled = 2  # enough for pipelined looping.
+
 	def __init__(self, test, n):
 		self.test = test
 		self.n = n
@@ -540,12 +527,15 @@ class UsersFactory:
 		self.prefix = datetime.datetime.today().strftime('tu_%Y%m%d%H%M%S') + '_'
 		self.users = None
 
-		if self.test.cache.recycled_users:
-			prefix, users = self.test.cache.recycled_users
-			if len(users) == n:
-				self.prefix = prefix
-				self.users = users
-				self.test.cache.recycled_users = None
+		cache = self.test.cache
+		with cache.recycled_users_lock:
+			pool = cache.recycled_users
+			for i, (prefix, users) in enumerate(pool):
+				if len(users) == n:
+					self.prefix = prefix
+					self.users = users
+					del pool[i]
+					break
 
 		self.recycle = False
 
@@ -556,14 +546,41 @@ class UsersFactory:
 		return self.users
 
 	def release(self, make_backend):
-		if self.recycle:
-			self.test.cache.recycled_users = (self.prefix, self.users)
-		else:
-			make_backend().destroy(self.prefix, self.users)
+		cache = self.test.cache
+		drained = []
+
+		with cache.recycled_users_lock:
+			pool = cache.recycled_users
+			keep = self.recycle and len(pool) < UsersFactory.max_pooled
+			if keep:
+				pool.append((self.prefix, self.users))
+			elif not self.recycle:
+				# we stopped recycling. drain the pool, so no accounts are left behind.
+				drained = pool[:]
+				del pool[:]
+
+		if not keep:
+			backend = make_backend()
+			backend.destroy(self.prefix, self.users)
+			for prefix, users in drained:
+				backend.destroy(prefix, users)
 
 		self.users = None
 		self.prefix = None
 
+	@staticmethod
+	def drain(test, make_backend):
+		# destroys all accounts still pooled for the given test.
+		cache = test.cache
+		with cache.recycled_users_lock:
+			drained = cache.recycled_users[:]
+			del cache.recycled_users[:]
+
+		if drained:
+			backend = make_backend()
+			for prefix, users in drained:
+				backend.destroy(prefix, users)
+
 
 class MeasureTime:
 	def __init__(self, dts):
@@ -581,6 +598,17 @@ def measure_time(dts):
 	return MeasureTime(dts)
 
 
+def version_label(ilias_version) -> str:
+	# machines know the version as a tuple, the master as an ILIASVersion.
+	if isinstance(ilias_version, ILIASVersion):
+		ilias_version = ilias_version.as_tuple()
+	return ".".join(str(x) for x in ilias_version)
+
+
+def question_type_label(question) -> str:
+	return question.__class__.__name__
+
+
 class ExamDriver:
 	def __init__(self, driver, ilias_url, username, report, context, questions, exam_configuration):
 		self.driver = driver
@@ -598,6 +626,9 @@ class ExamDriver:
 		self.answers = dict()
 		self.protocol = []
 		self.dts = []
+		self.waits = WaitStats()
+		self.steps = StepLog()
+		self.last_answer_changed = True
 		self.protocol.append((time.time(), "test", "entered test."))
 
 	def add_protocol(self, s):
@@ -625,9 +656,24 @@ class ExamDriver:
 
 		self.protocol.append((time.time(), "test", "finished test."))
 
+	def _record_answer(self, answer, state_before):
+		self.last_answer_changed = answer_state(answer) != state_before
+		self.steps.add("answer", question=answer.question.title, changed=self.last_answer_changed)
+
+	def _record_crash(self, answer, wait):
+		# when replaying, the recording tells us if the crashed answer had any unsaved
+		# changes. if not, there is nothing autosave needs to catch, so don't wait.
+		recorded = self.steps.recorded_step()
+		self.steps.add("crash", question=answer.question.title, wait=wait, changed=self.last_answer_changed)
+		if recorded is not None and not recorded.get("changed", True):
+			self.report('replay: skipping wait of %.1f seconds, answer was unchanged.' % wait)
+			return 0
+		return wait
+
 	def simulate_crash(self, wait):
 		sequence_id = self.get_sequence_id()
 		answer = self.answers[sequence_id]
+		wait = self._record_crash(answer, wait)
 
 		# simulate crash or loss of session.
 		answer.protocol.add("starting wait for simulated crash.")
@@ -635,11 +681,7 @@ class ExamDriver:
 		self.report('waiting for %.1f seconds.' % wait)
 
 		t0 = time.time()
-		t1 = t0 + wait
-		while time.time() < t1:
-			time.sleep(0.5)
-			# keep Selenium alive, otherwise we'll get a closed pipe exception.
-			is_driver_alive(self.driver)
+		keep_alive_wait(self.driver, wait, stats=self.waits)
 
 		self.report('edited question "%s" for %.1f seconds, now crashing.' % (
 			answer.question.title, time.time() - t0))
@@ -647,17 +689,18 @@ class ExamDriver:
 
 		answer.protocol.add("simulating crash.")
 
-		with wait_for_page_load(self.driver):
+		with wait_for_page_load(self.driver, stats=self.waits):
 			self.driver.refresh()
 
 		self.verify_answer(after_crash=True)
 
-	def _click_save(self, css, n_tries=5):
+	def _click_save(self, css, operation, n_tries=5):
 		def click_to_save(button):
 			button.click()
 			self.confirm_save()
 
-		with measure_time(self.dts):
+		self.steps.add("navigate", operation=operation)
+		with measure_time(self.dts), metrics.measure("tiltr_navigation_seconds", operation=operation):
 			try_submit(self.driver, css, click_to_save, allow_reload=False, n_tries=n_tries)
 
 	def _has_element(self, get_element):
@@ -681,7 +724,7 @@ class ExamDriver:
 
 		while self._has_element(find_button):
 			self.report("goto previous question.")
-			self._click_save('a[data-nextcmd="previousQuestion"]')
+			self._click_save('a[data-nextcmd="previousQuestion"]', "previous")
 
 	def goto_next_question(self):
 		self.protocol.append((time.time(), "test", "goto next question."))
@@ -692,7 +735,7 @@ class ExamDriver:
 
 		if self._has_element(find_button):
 			self.report("goto next question.")
-			self._click_save('a[data-nextcmd="nextQuestion"]')
+			self._click_save('a[data-nextcmd="nextQuestion"]', "next")
 			return True
 		else:
 			return False
@@ -712,7 +755,7 @@ class ExamDriver:
 
 			if self._has_element(find_button):
 				self.report("goto %s question." % command)
-				self._click_save(css)
+				self._click_save(css, command)
 
 				return True
 
@@ -774,11 +817,9 @@ class ExamDriver:
 
 	def confirm_save(self):
 		for i in range(2):
-			time.sleep(1)
-
-			try:
-				button = self.driver.find_element_by_id("tst_save_on_navigation_button")
-			except NoSuchElementException:
+			button = wait_for_save_on_navigation_modal(
+				self.driver, float(self.context.settings.save_modal_timeout), stats=self.waits)
+			if button is None:
 				return
 
 			try:
@@ -823,7 +864,7 @@ class ExamDriver:
 					if not allow_reload:
 						time.sleep(1)
 					else:
-						with wait_for_page_load(self.driver):
+						with wait_for_page_load(self.driver, stats=self.waits):
 							self.driver.refresh()
 
 		self.report('get_sequence_id failed: %s' % '\n\n'.join(exc))
@@ -862,7 +903,7 @@ class ExamDriver:
 			try:
 				page_title = self.driver.find_element_by_css_selector(".ilc_page_title_PageTitle")
 			except (NoSuchElementException, TimeoutException):
-				with wait_for_page_load(self.driver):
+				with wait_for_page_load(self.driver, stats=self.waits):
 					self.driver.refresh()
 
 		if page_title is None:
@@ -890,8 +931,13 @@ class ExamDriver:
 			self.create_answer()
 		answer = self.answers[sequence_id]
 		self.report('answering question "%s" [%d].' % (answer.question.title, sequence_id))
-		valid = answer.randomize(self.context)
-		answer.verify(self.context, after_crash=False)
+		question_type = question_type_label(answer.question)
+		state_before = answer_state(answer)
+		with metrics.measure("tiltr_answer_seconds", question_type=question_type, operation="randomize"):
+			valid = answer.randomize(self.context)
+		self._record_answer(answer, state_before)
+		with metrics.measure("tiltr_answer_seconds", question_type=question_type, operation="verify"):
+			answer.verify(self.context, after_crash=False)
 		return valid
 
 	def verify_answer(self, after_crash=False):
@@ -902,8 +948,13 @@ class ExamDriver:
 
 		answer = self.answers[sequence_id]
 		self.report('verifying question "%s" [%d].' % (answer.question.title, sequence_id))
+		self.steps.add("verify", question=answer.question.title, after_crash=after_crash)
 
-		interact(self.driver, lambda: answer.verify(self.context, after_crash))
+		with metrics.measure(
+			"tiltr_answer_seconds",
+			question_type=question_type_label(answer.question),
+			operation="verify_after_crash" if after_crash else "verify"):
+			interact(self.driver, lambda: answer.verify(self.context, after_crash))
 
 	def add_protocol_to_result(self, result):
 
@@ -912,11 +963,8 @@ class ExamDriver:
 
 		lines.sort(key=lambda x: x[0])  # by time
 
-		result.attach_protocol([
-			"%s [%s] %s" % (
-				datetime.datetime.fromtimestamp(t).strftime('%H:%M:%S'),
-				title,
-				what) for t, title, what in lines])
+		# formatted by the master, only when the protocol gets viewed.
+		result.attach_protocol([[t, title, what] for t, title, what in lines])
 
 		for answer in self.answers.values():
 			for filename, what in answer.protocol_files.items():
@@ -964,13 +1012,17 @@ class ExamDriver:
 
 		self.add_protocol_to_result(result)
 		result.attach_performance_measurements(self.dts)
+		result.attach_retries(retries.drain())
+		result.attach_metrics(metrics.drain())
+		result.attach_file("waits.json", self.waits.to_json().encode('utf8'))
 		return result
 
 
 class TestCache:
 	def __init__(self):
 		self.cached_link = None
-		self.recycled_users = None
+		self.recycled_users = []
+		self.recycled_users_lock = threading.Lock()
 		self.questions = None
 		self.exam_configuration = None
 
@@ -990,26 +1042,20 @@ class AbstractTest:
 
 
 class PackagedTest(AbstractTest):
-	def __init__(self, test_id: str):
+	def __init__(self, test_id: str, use_catalog: bool = True):
 		super().__init__()
 
 		self.test_id = test_id
 		self.path = os.path.abspath(os.path.join(
 			"/tiltr/tests", test_id + ".zip"))
 
-		with ZipFile(self.path, 'r') as zf:
-			main = None
-			for name in zf.namelist():
-				if re.match(r"^[^/]*/[^/]+_tst_[^/]+\.xml$", name):
-					main = name
-					break
-
-			if main is None:
-				raise RuntimeError("did not find test xml in zip")
-
-			root = ET.fromstring(zf.read(main))
+		# only the master keeps a catalog. machines run each exam in a fresh
+		# process and need just this one test, so they inspect it directly.
+		self.metadata = catalog.get(test_id) if use_catalog else None
+		if self.metadata is None:
+			self.metadata = inspect_test(self.path)
 
-		self.title = root.findall(".//Title")[0].text
+		self.title = self.metadata["title"]
 
 	def get_id(self) -> str:
 		return self.test_id
@@ -1020,20 +1066,54 @@ class PackagedTest(AbstractTest):
 	def get_title(self) -> str:
 		return self.title
 
+	def get_metadata(self) -> dict:
+		return self.metadata
+
 	@staticmethod
 	def list() -> List[AbstractTest]:
-		tests = list()
+		return catalog.list()
 
-		for filename in os.listdir("/tiltr/tests"):
-			if filename.endswith(".zip"):
-				try:
-					test = PackagedTest(os.path.splitext(filename)[0])
-					tests.append((test.get_title(), test.get_id()))
-				except:
-					print("could not inspect Test %s." % filename)
-					traceback.print_exc()
 
-		return sorted(tests, key=lambda t: t[0])
+class DefinitionsStore:
+	# on-disk cache of question definitions and exam configurations parsed from
+	# the ILIAS UI. parsing them takes minutes for larger tests, but they only
+	# depend on the packaged test, the few settings used while parsing and the
+	# ILIAS version. bump version whenever the pickled classes change.
+
+	path = "/tiltr/tmp/definitions"
+	version = 1
+
+	parsing_settings = ("max_long_text_length", )
+
+	def __init__(self, test: PackagedTest, settings, ilias_version: ILIASVersion):
+		with open(test.get_path(), "rb") as f:
+			test_hash = hashlib.sha256(f.read()).hexdigest()
+
+		key = json.dumps([
+			DefinitionsStore.version,
+			test_hash,
+			[str(getattr(settings, name)) for name in DefinitionsStore.parsing_settings],
+			ilias_version.text])
+
+		self.filename = os.path.join(DefinitionsStore.path, "%s-%s.pickle" % (
+			test.get_id(), hashlib.sha1(key.encode('utf8')).hexdigest()))
+
+	def load(self):
+		if not os.path.isfile(self.filename):
+			return None
+		try:
+			with open(self.filename, "rb") as f:
+				return pickle.load(f)
+		except:
+			traceback.print_exc()
+			return None
+
+	def save(self, questions, exam_configuration):
+		os.makedirs(DefinitionsStore.path, exist_ok=True)
+		tmp_filename = self.filename + ".tmp"
+		with open(tmp_filename, "wb") as f:
+			pickle.dump((questions, exam_configuration), f, pickle.HIGHEST_PROTOCOL)
+		os.replace(tmp_filename, self.filename)
 
 
 class ImportedTest(AbstractTest):
@@ -1526,11 +1606,20 @@ class TestDriver:
 		result = requests.get(url, cookies=cookies, verify=self.verify_ssl)
 		return result.content, filename
 
+	def measure_export(self, format):
+		return metrics.measure(
+			"tiltr_export_seconds",
+			format=format,
+			ilias_version=version_label(self.ilias_version),
+			browser=self.driver.capabilities.get("browserName", "unknown"))
+
 	def export_xmlres(self):
-		return self._export("xmlres", "zip")
+		with trace("export xmlres"), self.measure_export("xmlres"):
+			return self._export("xmlres", "zip")
 
 	def export_xls(self):
-		content, _ = self._export("csv", "xlsx")
+		with trace("export xlsx"), self.measure_export("xlsx"):
+			content, _ = self._export("csv", "xlsx")
 		return content
 
 	def export_pdf(self, files):
@@ -1552,14 +1641,18 @@ class TestDriver:
 				cookies = dict((cookie['name'], cookie['value']) for cookie in self.driver.get_cookies())
 				result = requests.get(url, cookies=cookies, verify=self.verify_ssl)
 
-				try:
-					pdfs[user_id] = PDF(result.content)
-				except:
-					files["error/%s.pdf" % user_id] = result.content
-					raise
+				# starts parsing in the background.
+				pdfs[user_id] = PDF(result.content)
 
 		self._iterate_detailed_results(get_pdf)
 
+		for user_id, pdf in pdfs.items():
+			try:
+				pdf.scores
+			except:
+				files["error/%s.pdf" % user_id] = pdf.bytes
+				raise
+
 		return pdfs
 
 	def get_answers_from_details_view(self, questions):
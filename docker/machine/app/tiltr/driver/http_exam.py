@@ -0,0 +1,676 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+from typing import Dict, List, Tuple
+
+import re
+import html
+import json
+import time
+import requests
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+from collections import OrderedDict
+
+from tiltr.data.exceptions import *
+from tiltr.data.metrics import metrics
+from tiltr.question.answers.answer import Validness
+from tiltr.question.protocol import AnswerProtocol
+
+from .drivers import ExamDriver, measure_time, question_type_label
+from .utils import http_get_parameters
+from .retry import retries, policies
+from .replay import answer_state
+
+
+# an exam driver that talks HTTP to ILIAS instead of remote controlling a
+# browser. it fetches the test player's pages through a requests.Session,
+# parses them, and posts the test player's form the same way the browser would
+# on navigation. questions and answers (i.e. everything needed to compute the
+# expected results) are the same as for the browser based ExamDriver; only
+# entering and reading back answers is done on the parsed form, see the
+# _*Form classes below. one machine can run many of these sessions, since
+# they need no browser. for testing the UI itself, use the browser driver.
+
+_void_tags = set([
+	"area", "base", "br", "col", "embed", "hr", "img", "input",
+	"link", "meta", "param", "source", "track", "wbr"])
+
+
+class Node:
+	def __init__(self, tag: str, attrs: Dict, parent: 'Node' = None):
+		self.tag = tag
+		self.attrs = attrs
+		self.parent = parent
+		self.children = []
+
+	def iter(self):
+		yield self
+		for child in self.children:
+			if isinstance(child, Node):
+				yield from child.iter()
+
+	def find_all(self, tag: str = None, **attrs) -> List['Node']:
+		return [node for node in self.iter() if node.matches(tag, **attrs)]
+
+	def find(self, tag: str = None, **attrs) -> 'Node':
+		for node in self.iter():
+			if node.matches(tag, **attrs):
+				return node
+		return None
+
+	def matches(self, tag: str = None, **attrs) -> bool:
+		if tag is not None and self.tag != tag:
+			return False
+		for k, v in attrs.items():
+			k = k.rstrip("_")  # allows class_=...
+			if k == "class":
+				if v not in self.classes:
+					return False
+			elif self.attrs.get(k.replace("_", "-")) != v:
+				return False
+		return True
+
+	@property
+	def classes(self) -> List[str]:
+		return (self.attrs.get("class") or "").split()
+
+	def get(self, name: str, default=None):
+		return self.attrs.get(name, default)
+
+	@property
+	def text(self) -> str:
+		parts = []
+		for child in self.children:
+			if isinstance(child, Node):
+				parts.append(child.text)
+			else:
+				parts.append(child)
+		return "".join(parts)
+
+
+class _TreeBuilder(HTMLParser):
+	def __init__(self):
+		super().__init__(convert_charrefs=True)
+		self.root = Node("document", dict())
+		self.current = self.root
+
+	def handle_starttag(self, tag, attrs):
+		if tag == "option" and self.current.tag == "option":
+			self.current = self.current.parent
+		node = Node(tag, dict((k, v if v is not None else "") for k, v in attrs), self.current)
+		self.current.children.append(node)
+		if tag not in _void_tags:
+			self.current = node
+
+	def handle_startendtag(self, tag, attrs):
+		node = Node(tag, dict((k, v if v is not None else "") for k, v in attrs), self.current)
+		self.current.children.append(node)
+
+	def handle_endtag(self, tag):
+		node = self.current
+		while node is not self.root and node.tag != tag:
+			node = node.parent
+		if node is not self.root:
+			self.current = node.parent
+
+	def handle_data(self, data):
+		self.current.children.append(data)
+
+
+class Page:
+	def __init__(self, url: str, source: str):
+		self.url = url
+		self.source = source
+
+		builder = _TreeBuilder()
+		builder.feed(source)
+		builder.close()
+		self.root = builder.root
+
+		self.labels = dict()
+		for label in self.root.find_all("label"):
+			if label.get("for"):
+				self.labels[label.get("for")] = label.text.strip()
+
+	@property
+	def language(self) -> str:
+		node = self.root.find("html")
+		return node.get("lang") if node else None
+
+	@property
+	def sequence_id(self) -> int:
+		sequence = http_get_parameters(self.url).get("sequence")
+		return int(sequence) if sequence is not None else None
+
+	@property
+	def question_title(self) -> str:
+		node = self.root.find(class_="ilc_page_title_PageTitle")
+		return node.text.strip() if node else None
+
+	def has_error(self) -> bool:
+		return self.root.find("div", class_="alert-danger") is not None
+
+	def find_submit(self, name: str) -> Tuple[Node, Node]:
+		# returns the submit element with the given name and its form.
+		for form in self.root.find_all("form"):
+			for node in form.iter():
+				if node.tag in ("input", "button") and node.get("name") == name:
+					return form, node
+		return None, None
+
+	def find_navigation(self, nextcmd: str) -> Node:
+		return self.root.find("a", data_nextcmd=nextcmd)
+
+	def player_form(self) -> Node:
+		return self.root.find("form", id="taForm") or self.root.find("form")
+
+
+class FormState:
+	# the values a browser would submit for a form, as an ordered mapping from
+	# field names to lists of values.
+
+	def __init__(self, form: Node):
+		self.form = form
+		self.values = OrderedDict()
+
+		if form is None:
+			return
+
+		for node in form.iter():
+			name = node.get("name")
+			if not name or node.get("disabled") is not None:
+				continue
+
+			if node.tag == "input":
+				kind = node.get("type", "text").lower()
+				if kind in ("submit", "button", "image", "reset", "file"):
+					continue
+				if kind in ("checkbox", "radio") and node.get("checked") is None:
+					self.values.setdefault(name, [])
+					continue
+				self.values.setdefault(name, []).append(node.get("value", "on" if kind in ("checkbox", "radio") else ""))
+
+			elif node.tag == "select":
+				options = node.find_all("option")
+				selected = [o for o in options if o.get("selected") is not None] or options[:1]
+				self.values[name] = [o.get("value", o.text.strip()) for o in selected]
+
+			elif node.tag == "textarea":
+				self.values[name] = [node.text]
+
+	def get(self, name: str) -> str:
+		values = self.values.get(name)
+		return values[0] if values else None
+
+	def set(self, name: str, value: str):
+		self.values[name] = [value]
+
+	def set_all(self, name: str, values: List[str]):
+		self.values[name] = list(values)
+
+	def items(self) -> List[Tuple[str, str]]:
+		return [(name, value) for name, values in self.values.items() for value in values]
+
+
+def _question_root(page: Page, css_class: str) -> Node:
+	root = page.root.find(class_=css_class)
+	if root is None:
+		raise InteractionException("no .%s found on page %s." % (css_class, page.url))
+	return root
+
+
+class _SingleChoiceForm:
+	def _choices(self, page):
+		root = _question_root(page, "ilc_question_SingleChoice")
+		for radio in root.find_all("input", type="radio"):
+			yield page.labels.get(radio.get("id"), "").strip(), radio
+
+	def randomize(self, answer, context, page, state):
+		choice, score = answer.question.get_random_answer(context)
+		found = False
+		for label, radio in self._choices(page):
+			answer.protocol.choose(label, label == choice)
+			if label == choice:
+				state.set(radio.get("name"), radio.get("value"))
+				found = True
+		if not found:
+			raise InteractionException("could not find answer '%s'" % choice)
+		answer.current_answer = choice
+		answer.current_score = score
+		return Validness()
+
+	def verify(self, answer, context, page, state, after_crash):
+		for label, radio in self._choices(page):
+			checked = state.get(radio.get("name")) == radio.get("value")
+			answer.protocol.verify(label, label == answer.current_answer, checked, after_crash=after_crash)
+		context.coverage.case_occurred(answer.question, "verify", answer.current_answer)
+
+
+class _MultipleChoiceForm:
+	def _choices(self, page):
+		root = _question_root(page, "ilc_question_MultipleChoice")
+		for checkbox in root.find_all("input", type="checkbox"):
+			yield page.labels.get(checkbox.get("id"), "").strip(), checkbox
+
+	def randomize(self, answer, context, page, state):
+		answers, score = answer.question.get_random_answer(context)
+		for label, checkbox in self._choices(page):
+			answer.protocol.choose(label, answers[label])
+			state.set_all(checkbox.get("name"), [checkbox.get("value", "on")] if answers[label] else [])
+		answer.current_answers = answers
+		answer.current_score = score
+		return Validness()
+
+	def verify(self, answer, context, page, state, after_crash):
+		for label, checkbox in self._choices(page):
+			checked = checkbox.get("value", "on") in state.values.get(checkbox.get("name"), [])
+			answer.protocol.verify(label, answer.current_answers[label], checked, after_crash=after_crash)
+		context.coverage.case_occurred(
+			answer.question, "verify", json.dumps(answer._get_binary_answers()))
+
+
+class _KPrimForm:
+	def randomize(self, answer, context, page, state):
+		_question_root(page, "ilc_question_KprimChoice")
+		answers, score = answer.question.get_random_answer(context)
+		for index, value in enumerate(answers):
+			answer.protocol.choose(index, value)
+			state.set("kprim_choice_result_%d" % index, "1" if value else "0")
+		answer.current_answers = answers
+		answer.current_score = score
+		return Validness()
+
+	def verify(self, answer, context, page, state, after_crash):
+		for index in range(answer.n_rows):
+			answer.protocol.verify(
+				str(index),
+				answer.current_answers[index],
+				state.get("kprim_choice_result_%d" % index) == "1",
+				after_crash=after_crash)
+		context.coverage.case_occurred(
+			answer.question, "verify", json.dumps(answer._get_binary_answers()))
+
+
+class _ClozeForm:
+	def _gaps(self, page):
+		root = _question_root(page, "ilc_question_ClozeTest")
+		gaps = dict()
+		for node in root.iter():
+			m = re.match(r"^gap_([0-9]+)$", node.get("name") or "")
+			if m and node.tag in ("input", "select"):
+				gaps[int(m.group(1))] = node
+		return gaps
+
+	def randomize(self, answer, context, page, state):
+		answers, valid, score = answer.question.get_random_answer(context)
+		gaps = self._gaps(page)
+		if len(gaps) != len(answer.question.gaps):
+			raise InteractionException("expected %d gaps, found %d." % (len(answer.question.gaps), len(gaps)))
+
+		for gap in answer.question.gaps.values():
+			value = answers[gap.index]
+			answer.protocol.choose(gap.get_export_name("de"), value)
+			node = gaps[gap.index]
+			if node.tag == "select":
+				options = dict((o.text.strip(), o.get("value")) for o in node.find_all("option"))
+				if value not in options:
+					raise InteractionException('option "%s" not found in %s.' % (value, list(options.keys())))
+				state.set(node.get("name"), options[value])
+			else:
+				state.set(node.get("name"), value)
+
+		answer.current_answers = answers
+		answer.current_score = score
+
+		if all(valid.values()):
+			return Validness()
+		else:
+			return Validness(((i, answers[i]) for i, v in valid.items() if not v))
+
+	def verify(self, answer, context, page, state, after_crash):
+		gaps = self._gaps(page)
+		for gap in answer.question.gaps.values():
+			node = gaps[gap.index]
+			value = state.get(node.get("name")) or ""
+			if node.tag == "select":
+				texts = dict((o.get("value"), o.text.strip()) for o in node.find_all("option"))
+				value = texts.get(value, "")
+
+			recorded_value = context.strip_whitespace(answer.current_answers[gap.index])
+			answer.protocol.verify(
+				gap.get_export_name("de"),
+				context.implicit_text_to_number(recorded_value),
+				context.implicit_text_to_number(context.strip_whitespace(value)),
+				after_crash=after_crash)
+			gap.add_coverage(answer.question, "verify", context.coverage, recorded_value)
+
+
+class _LongTextForm:
+	def _textarea(self, page):
+		root = _question_root(page, "ilc_question_TextQuestion")
+		textarea = root.find("textarea")
+		if textarea is None:
+			raise InteractionException("could not find long text textarea.")
+		return textarea
+
+	def _encode(self, text, context):
+		# ILIAS expects what TinyMCE would post, i.e. one paragraph per line.
+		return "".join("<p>%s</p>" % html.escape(context.strip_whitespace(line)) for line in text.split("\n"))
+
+	def _decode(self, value, context):
+		paragraphs = re.findall(r"<p[^>]*>(.*?)</p>", value, re.DOTALL) or [value]
+		return "\n".join(context.strip_whitespace(html.unescape(re.sub(r"<[^>]+>", "", p))) for p in paragraphs)
+
+	def randomize(self, answer, context, page, state):
+		text, score = answer.question.get_random_answer(context)
+		answer.protocol.choose("Ergebnis", text)
+
+		state.set(self._textarea(page).get("name"), self._encode(text, context))
+
+		answer.current_answer = text
+		answer.current_score = score
+		return Validness()
+
+	def verify(self, answer, context, page, state, after_crash):
+		text = self._decode(state.get(self._textarea(page).get("name")) or "", context)
+
+		answer.protocol.verify(
+			"Ergebnis",
+			context.collapse_whitespace(context.strip_whitespace(
+				"\n".join(context.strip_whitespace(s) for s in answer.current_answer.split("\n")))),
+			context.collapse_whitespace(context.strip_whitespace(text)),
+			after_crash=after_crash)
+
+		answer.question.add_verify_coverage(context.coverage, dict(Ergebnis=text))
+
+
+class _PlainLongTextForm(_LongTextForm):
+	# a plain textarea, ILIAS stores the text as posted.
+
+	def _encode(self, text, context):
+		return text
+
+	def _decode(self, value, context):
+		return value
+
+
+_forms = dict(
+	SingleChoiceAnswer=_SingleChoiceForm(),
+	MultipleChoiceAnswer=_MultipleChoiceForm(),
+	KPrimAnswer=_KPrimForm(),
+	ClozeAnswer=_ClozeForm(),
+	LongTextAnswerTinyMCE=_LongTextForm(),
+	LongTextAnswerPlainHTML=_PlainLongTextForm())
+
+
+class HttpSession:
+	def __init__(self, verify_ssl: bool, report):
+		self.session = requests.Session()
+		self.session.verify = verify_ssl
+		self.report = report
+		self.page = None
+
+	def _fetch(self, method, url, **kwargs) -> Page:
+		for attempt in retries.attempts(policies["page_load"]):
+			try:
+				r = self.session.request(method, url, timeout=60, **kwargs)
+				r.raise_for_status()
+				attempt.succeeded()
+				self.page = Page(r.url, r.text)
+				return self.page
+			except requests.exceptions.RequestException as e:
+				if not attempt.failed(e):
+					raise InteractionException("%s %s failed: %s" % (method, url, str(e)))
+
+	def get(self, url: str) -> Page:
+		return self._fetch("GET", url)
+
+	def post(self, url: str, data: List[Tuple[str, str]]) -> Page:
+		return self._fetch("POST", urljoin(self.page.url, url), data=data)
+
+	def submit(self, form: Node, data: List[Tuple[str, str]]) -> Page:
+		return self.post(form.get("action") or self.page.url, data)
+
+	def click(self, name: str) -> Page:
+		# submits the form containing the submit button with the given name.
+		form, button = self.page.find_submit(name)
+		if form is None:
+			return None
+		data = FormState(form).items()
+		data.append((name, button.get("value", "")))
+		return self.submit(form, data)
+
+	def login(self, ilias_url: str, username: str, password: str) -> str:
+		self.report("opening login page.")
+		page = self.get(ilias_url)
+
+		form, button = page.find_submit("cmd[doStandardAuthentication]")
+		if form is None:
+			raise InteractionException("no login form found.")
+
+		state = FormState(form)
+		state.set("username", username)
+		state.set("password", password)
+
+		self.report("logging in as " + username + "/" + password + ".")
+		page = self.submit(form, state.items() + [("cmd[doStandardAuthentication]", button.get("value", ""))])
+
+		if page.root.find(id="il_prop_cont_current_password"):
+			self.report("changing password.")
+			form, button = page.find_submit("cmd[savePassword]")
+			state = FormState(form)
+			state.set("current_password", password)
+			state.set("new_password", password + "_")
+			state.set("new_password_retype", password + "_")
+			page = self.submit(form, state.items() + [("cmd[savePassword]", button.get("value", ""))])
+
+		if page.find_submit("cmd[doStandardAuthentication]")[0] is not None:
+			raise InteractionException("login as %s failed." % username)
+
+		return page.language
+
+	def start_test(self, test_url: str, allow_resume: bool = False):
+		self.report("starting test.")
+		page = self.get(test_url)
+
+		if page.find_submit("cmd[resumePlayer]")[0] is not None:
+			if not allow_resume:
+				raise InteractionException("test has already been started by this user. aborting.")
+			self.click("cmd[resumePlayer]")
+		elif self.click("cmd[startPlayer]") is None:
+			raise InteractionException("user does not have rights to start this test. aborting.")
+
+
+class HttpExamDriver(ExamDriver):
+	def __init__(self, session: HttpSession, ilias_url, username, report, context, questions, exam_configuration):
+		super().__init__(None, ilias_url, username, report, context, questions, exam_configuration)
+		self.session = session
+		self.state = FormState(session.page.player_form())
+
+	@property
+	def page(self) -> Page:
+		return self.session.page
+
+	def _load(self, page: Page):
+		if page is None:
+			raise InteractionException("no page received.")
+		self.state = FormState(page.player_form())
+
+	def _navigate(self, nextcmd: str, operation: str) -> bool:
+		link = self.page.find_navigation(nextcmd)
+		if link is None:
+			return False
+
+		self.steps.add("navigate", operation=operation)
+
+		# like the browser, we save the current answer by posting the player form
+		# to the navigation target.
+		with measure_time(self.dts), metrics.measure("tiltr_navigation_seconds", operation=operation):
+			form = self.page.player_form()
+			data = self.state.items()
+			data.extend([("nextcmd", nextcmd), ("nextseq", link.get("data-nextseq", ""))])
+			self._load(self.session.post(link.get("href") or form.get("action"), data))
+
+		return True
+
+	def close(self):
+		self.report("finishing test.")
+
+		if not self._navigate("finishTest", "finish"):
+			raise InteractionException("failed to properly finish test")
+		self.session.click("cmd[confirmFinish]")
+
+		self.protocol.append((time.time(), "test", "finished test."))
+
+	def simulate_crash(self, wait):
+		answer = self.answers[self.get_sequence_id()]
+		wait = self._record_crash(answer, wait)
+
+		answer.protocol.add("starting wait for simulated crash.")
+		self.report('waiting for %.1f seconds.' % wait)
+		time.sleep(wait)
+
+		# answers get saved right after randomizing (see _save_and_reload), so reloading
+		# simulates the loss of the client and checks what ILIAS kept.
+		answer.protocol.add("simulating crash.")
+		self._load(self.session.get(self.page.url))
+
+		self.verify_answer(after_crash=True)
+
+	def goto_first_question(self):
+		while self.page.find_navigation("previousQuestion") is not None:
+			self.report("goto previous question.")
+			self._navigate("previousQuestion", "previous")
+
+	def goto_next_question(self):
+		self.protocol.append((time.time(), "test", "goto next question."))
+		if self.page.find_navigation("nextQuestion") is None:
+			return False
+		self.report("goto next question.")
+		return self._navigate("nextQuestion", "next")
+
+	def goto_next_or_previous_question(self, context, random_dir=False):
+		self.protocol.append((time.time(), "test", "goto next or previous question."))
+
+		options = ('next', 'previous')
+		if random_dir and context.random.random() < 0.5:
+			options = reversed(options)
+
+		for command in options:
+			if self.page.find_navigation("%sQuestion" % command) is not None:
+				self.report("goto %s question." % command)
+				return self._navigate("%sQuestion" % command, command)
+
+		return False
+
+	def assert_error_on_save(self, invalid_answers, context):
+		if context.workarounds.dont_test_invalid_save:
+			return
+
+		sequence_id = self.get_sequence_id()
+
+		for retry in range(2):
+			self.goto_next_or_previous_question(context, random_dir=True)
+
+			err_text = None
+			if self.get_sequence_id() != sequence_id:
+				err_text = "save succeeded even though saved data was invalid."
+			elif not self.page.has_error():
+				err_text = "save presented no error though saved data was invalid."
+
+			if err_text:
+				self.protocol.append((time.time(), "test", err_text))
+				raise InvalidSaveException(err_text)
+
+	def has_next_question(self):
+		return self.page.find_navigation("nextQuestion") is not None
+
+	def has_previous_question(self):
+		return self.page.find_navigation("previousQuestion") is not None
+
+	def confirm_save(self):
+		pass  # there is no save-on-navigation modal without a browser.
+
+	def get_sequence_id(self, allow_reload=False):
+		sequence_id = self.page.sequence_id
+		if sequence_id is None:
+			raise InteractionException("no sequence id in url %s." % self.page.url)
+		return sequence_id
+
+	def _get_debug_info(self, question_title):
+		return dict()
+
+	def create_answer(self):
+		title = self.page.question_title
+		if title is None:
+			raise InteractionException("no question title found.")
+		if title not in self.questions:
+			raise InteractionException("no question content found for '%s'." % title)
+
+		self.report('entering question "' + title + '"')
+
+		answer = self.questions[title].create_answer(
+			None, AnswerProtocol(title, self._get_debug_info))
+		if answer.__class__.__name__ not in _forms:
+			raise InteractionException(
+				"question type %s is not supported by the http driver." % question_type_label(answer.question))
+
+		sequence_id = self.get_sequence_id()
+		assert sequence_id not in self.answers
+		self.answers[sequence_id] = answer
+
+		return answer
+
+	def _form(self, answer):
+		return _forms[answer.__class__.__name__]
+
+	def randomize_answer(self):
+		sequence_id = self.get_sequence_id()
+		if sequence_id not in self.answers:
+			self.create_answer()
+		answer = self.answers[sequence_id]
+		self.report('answering question "%s" [%d].' % (answer.question.title, sequence_id))
+
+		form = self._form(answer)
+		question_type = question_type_label(answer.question)
+		state_before = answer_state(answer)
+		with metrics.measure("tiltr_answer_seconds", question_type=question_type, operation="randomize"):
+			valid = form.randomize(answer, self.context, self.page, self.state)
+		self._record_answer(answer, state_before)
+		if valid.is_good():
+			# verify what ILIAS stored, not what we just put into the form.
+			self._save_and_reload(sequence_id)
+		with metrics.measure("tiltr_answer_seconds", question_type=question_type, operation="verify"):
+			form.verify(answer, self.context, self.page, self.state, False)
+		return valid
+
+	def _save_and_reload(self, sequence_id):
+		# posts the player form like a navigation, but back to the current question.
+		# this also takes the place of the browser's autosave.
+		form = self.page.player_form()
+		data = self.state.items()
+		data.extend([("nextcmd", "showQuestion"), ("nextseq", str(sequence_id))])
+		with metrics.measure("tiltr_navigation_seconds", operation="save"):
+			self._load(self.session.submit(form, data))
+		if self.get_sequence_id() != sequence_id:
+			raise InteractionException("saving question %d went to question %d." % (sequence_id, self.get_sequence_id()))
+
+	def verify_answer(self, after_crash=False):
+		sequence_id = self.get_sequence_id()
+		if sequence_id not in self.answers:
+			raise InteractionException("cannot verify unknown answer " + str(sequence_id))
+
+		answer = self.answers[sequence_id]
+		self.report('verifying question "%s" [%d].' % (answer.question.title, sequence_id))
+		self.steps.add("verify", question=answer.question.title, after_crash=after_crash)
+
+		with metrics.measure(
+			"tiltr_answer_seconds",
+			question_type=question_type_label(answer.question),
+			operation="verify_after_crash" if after_crash else "verify"):
+			self._form(answer).verify(answer, self.context, self.page, self.state, after_crash)
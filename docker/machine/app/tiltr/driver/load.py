@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+from typing import Dict, List
+
+import time
+
+
+# load generation for capacity planning. instead of looping runs with all
+# machines, a load test ramps the number of concurrent exam sessions (i.e. the
+# number of machines used per run) through stages. for each stage, we collect
+# the latencies of the saves our robots did and the share of sessions that
+# failed, and compare them with latency and error rate SLOs. the saturation
+# point is the highest number of concurrent sessions that still met the SLOs.
+
+
+def ramp(kind: str, min_sessions: int, max_sessions: int, steps: int) -> List[int]:
+	min_sessions = max(1, min(min_sessions, max_sessions))
+
+	if kind == "linear":
+		return list(range(min_sessions, max_sessions + 1))
+	elif kind == "step":
+		steps = max(1, steps)
+		if steps == 1:
+			return [max_sessions]
+		stages = []
+		for i in range(steps):
+			n = min_sessions + round(i * (max_sessions - min_sessions) / (steps - 1))
+			if not stages or stages[-1] != n:
+				stages.append(n)
+		return stages
+	else:
+		raise ValueError("unknown load profile %s" % kind)
+
+
+def _percentile(values: List[float], p: float) -> float:
+	if not values:
+		return 0
+	values = sorted(values)
+	return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+class LoadStage:
+	def __init__(self, sessions: int):
+		self.sessions = sessions
+		self.n_runs = 0
+		self.n_sessions = 0
+		self.n_failed = 0
+		self.latencies = []
+		self.elapsed = []
+
+	def record(self, n_sessions: int, results, elapsed: float):
+		self.n_runs += 1
+		self.n_sessions += n_sessions
+		self.elapsed.append(elapsed)
+
+		if results is None:
+			# the run failed before any results arrived.
+			self.n_failed += n_sessions
+			return
+
+		for result in results:
+			if result is None or result.errors:
+				self.n_failed += 1
+			if result is not None:
+				self.latencies.extend(result.performance)
+
+	@property
+	def error_rate(self) -> float:
+		return 100 * self.n_failed / self.n_sessions if self.n_sessions else 0
+
+	def to_json(self, slo_latency: float, slo_error_rate: float) -> Dict:
+		p95 = _percentile(self.latencies, 95)
+		return dict(
+			sessions=self.sessions,
+			runs=self.n_runs,
+			requests=len(self.latencies),
+			failed_sessions=self.n_failed,
+			error_rate=self.error_rate,
+			p50=_percentile(self.latencies, 50),
+			p95=p95,
+			p99=_percentile(self.latencies, 99),
+			max=max(self.latencies) if self.latencies else 0,
+			elapsed=sum(self.elapsed) / len(self.elapsed) if self.elapsed else 0,
+			slo_ok=p95 <= slo_latency and self.error_rate <= slo_error_rate)
+
+
+class LoadTest:
+	def __init__(self, settings, n_machines: int, ilias_version):
+		max_sessions = int(settings.load_max_sessions) or n_machines
+		max_sessions = min(max_sessions, n_machines)
+
+		self.stages = [LoadStage(n) for n in ramp(
+			settings.load_profile,
+			int(settings.load_min_sessions),
+			max_sessions,
+			int(settings.load_steps))]
+
+		self.runs_per_stage = max(1, int(settings.load_runs_per_stage))
+		self.slo_latency = float(settings.load_slo_latency)
+		self.slo_error_rate = float(settings.load_slo_error_rate)
+		self.ilias_version = ilias_version
+		self.browser = settings.browser
+		self.started = time.time()
+		self.index = 0
+
+	@staticmethod
+	def is_enabled(settings) -> bool:
+		return settings.load_profile in ("step", "linear")
+
+	def current_stage(self) -> LoadStage:
+		if self.index < len(self.stages):
+			return self.stages[self.index]
+		return None
+
+	def record(self, run):
+		stage = self.current_stage()
+		if stage is None:
+			return
+
+		elapsed = time.time() - run.t0 if run.t0 else 0
+		stage.record(stage.sessions, run.recorded_results, elapsed)
+
+		if stage.n_runs >= self.runs_per_stage:
+			self.index += 1
+
+	def is_done(self) -> bool:
+		return self.current_stage() is None
+
+	def report(self) -> Dict:
+		stages = [stage.to_json(self.slo_latency, self.slo_error_rate) for stage in self.stages if stage.n_runs > 0]
+
+		# highest number of sessions before the first SLO violation.
+		saturation = None
+		for stage in stages:
+			if not stage["slo_ok"]:
+				break
+			saturation = stage["sessions"]
+
+		return dict(
+			ilias_version=self.ilias_version.text,
+			browser=self.browser,
+			started=self.started,
+			slo=dict(p95_latency=self.slo_latency, error_rate=self.slo_error_rate),
+			saturation_sessions=saturation,
+			stages=stages)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+from typing import Dict, List
+
+import json
+import zlib
+import random as rnd
+
+from tiltr.data.exceptions import InteractionException
+
+
+# record and replay of exam sessions. every decision a robot makes (which
+# answers to give, where to navigate, when to crash) comes from its context's
+# random generator. python's Random derives everything from two primitives,
+# random() and getrandbits(), so recording the values these return is enough
+# to reproduce a session exactly; a replay feeds them back instead of drawing
+# new ones. in addition, we log the steps a session took, so that a replay can
+# detect when ILIAS behaves differently than during the recording.
+
+
+class RecordingRandom(rnd.Random):
+	def __init__(self, source: rnd.Random):
+		self.source = source
+		self.floats = []
+		self.bits = []
+		super().__init__()
+
+	def seed(self, *args, **kwargs):
+		pass
+
+	def random(self):
+		x = self.source.random()
+		self.floats.append(x)
+		return x
+
+	def getrandbits(self, k):
+		x = self.source.getrandbits(k)
+		self.bits.append(x)
+		return x
+
+	def getstate(self):
+		raise NotImplementedError()
+
+	def setstate(self, state):
+		raise NotImplementedError()
+
+
+class ReplayRandom(rnd.Random):
+	def __init__(self, floats: List[float], bits: List[int]):
+		self.floats = iter(floats)
+		self.bits = iter(bits)
+		super().__init__()
+
+	def seed(self, *args, **kwargs):
+		pass
+
+	def random(self):
+		try:
+			return next(self.floats)
+		except StopIteration:
+			raise InteractionException("replay diverged: session asked for more random values than recorded.")
+
+	def getrandbits(self, k):
+		try:
+			x = next(self.bits)
+		except StopIteration:
+			raise InteractionException("replay diverged: session asked for more random bits than recorded.")
+		if x >= (1 << k):
+			raise InteractionException("replay diverged: recorded random bits do not fit.")
+		return x
+
+	def getstate(self):
+		raise NotImplementedError()
+
+	def setstate(self, state):
+		raise NotImplementedError()
+
+
+class SessionTrace:
+	version = 1
+	filename = "trace.json.z"
+
+	def __init__(self, context_kind: str, floats: List[float], bits: List[int], steps: List[Dict], info: Dict):
+		self.context_kind = context_kind
+		self.floats = floats
+		self.bits = bits
+		self.steps = steps
+		self.info = info
+
+	def create_random(self) -> ReplayRandom:
+		return ReplayRandom(self.floats, self.bits)
+
+	def to_bytes(self) -> bytes:
+		return zlib.compress(json.dumps(dict(
+			version=SessionTrace.version,
+			context=self.context_kind,
+			floats=self.floats,
+			bits=self.bits,
+			steps=self.steps,
+			info=self.info)).encode("utf8"), 9)
+
+	@staticmethod
+	def from_bytes(data: bytes) -> 'SessionTrace':
+		data = json.loads(zlib.decompress(data).decode("utf8"))
+		if data["version"] != SessionTrace.version:
+			raise InteractionException("unsupported trace version %s." % data["version"])
+		return SessionTrace(data["context"], data["floats"], data["bits"], data["steps"], data["info"])
+
+
+class StepLog:
+	# the steps of a session (answers, verifications, navigation, crashes). when
+	# replaying, each new step is compared with the recorded one.
+
+	def __init__(self, recorded: List[Dict] = None):
+		self.steps = []
+		self.recorded = recorded
+
+	@property
+	def is_replay(self) -> bool:
+		return self.recorded is not None
+
+	def recorded_step(self) -> Dict:
+		# the recorded counterpart of the next step, if any.
+		if self.recorded is None or len(self.steps) >= len(self.recorded):
+			return None
+		return self.recorded[len(self.steps)]
+
+	def add(self, kind: str, **data):
+		step = dict(kind=kind, **data)
+
+		if self.recorded is not None:
+			expected = self.recorded_step()
+			if expected is None or any(expected.get(k) != v for k, v in step.items() if k not in ("wait", "changed")):
+				raise InteractionException("replay diverged at step %d: expected %s, got %s." % (
+					len(self.steps), json.dumps(expected), json.dumps(step)))
+
+		self.steps.append(step)
+		return step
+
+
+def answer_state(answer) -> str:
+	# a comparable snapshot of the answer a robot gave.
+	return repr((
+		getattr(answer, "current_answer", None),
+		getattr(answer, "current_answers", None),
+		answer.current_score))
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+from typing import Dict, List
+
+import time
+import random
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+
+# a central policy for retrying browser operations. instead of fixed sleeps, we
+# back off relative to the latencies we recently observed for an operation (a
+# slow ILIAS under load gets longer delays than a fast one) and add jitter, so
+# that many machines do not retry in lockstep. each operation has a time budget
+# after which we give up. every retry is recorded as telemetry and ends up in
+# the run's performance data.
+
+
+class RetryPolicy:
+	def __init__(self, operation: str, max_tries: int = 5, base_delay: float = 0.25,
+		max_delay: float = 8, budget: float = 120):
+
+		self.operation = operation
+		self.max_tries = max_tries
+		self.base_delay = base_delay
+		self.max_delay = max_delay
+		self.budget = budget
+
+	def derive(self, **kwargs) -> 'RetryPolicy':
+		args = dict(
+			operation=self.operation,
+			max_tries=self.max_tries,
+			base_delay=self.base_delay,
+			max_delay=self.max_delay,
+			budget=self.budget)
+		args.update(kwargs)
+		return RetryPolicy(**args)
+
+
+class RetryEngine:
+	def __init__(self, history: int = 20):
+		self.latencies = defaultdict(lambda: deque(maxlen=history))
+		self.events = []
+		self.mutex = threading.Lock()
+		self.random = random.Random()
+		self._local = threading.local()
+
+	@contextmanager
+	def scope(self, name: str):
+		# tags events recorded by this thread, e.g. with a batch id, so that
+		# concurrent runs on the master only drain their own events.
+		previous = getattr(self._local, "scope", None)
+		self._local.scope = name
+		try:
+			yield
+		finally:
+			self._local.scope = previous
+
+	def observe(self, operation: str, dt: float):
+		with self.mutex:
+			self.latencies[operation].append(dt)
+
+	def typical_latency(self, operation: str) -> float:
+		with self.mutex:
+			latencies = sorted(self.latencies[operation])
+		if not latencies:
+			return 0
+		return latencies[len(latencies) // 2]
+
+	def delay(self, policy: RetryPolicy, attempt: int) -> float:
+		base = max(policy.base_delay, self.typical_latency(policy.operation))
+		delay = min(policy.max_delay, base * (2 ** attempt))
+		# "equal jitter": keep at least half of the delay.
+		return delay / 2 + self.random.uniform(0, delay / 2)
+
+	def record(self, operation: str, attempt: int, reason: str, delay: float):
+		with self.mutex:
+			self.events.append(dict(
+				t=time.time(),
+				operation=operation,
+				attempt=attempt,
+				reason=reason,
+				delay=delay,
+				scope=getattr(self._local, "scope", None)))
+
+	def backoff(self, policy: RetryPolicy, reason, attempt: int = 0):
+		# a single adaptive wait outside of a retry loop.
+		if isinstance(reason, BaseException):
+			reason = reason.__class__.__name__
+		delay = self.delay(policy, attempt)
+		self.record(policy.operation, attempt, reason, delay)
+		time.sleep(delay)
+
+	def drain(self, scope: str = None) -> List[Dict]:
+		# all events, or only those of the given scope. draining a scope also
+		# drops events that were recorded outside of any scope.
+		with self.mutex:
+			if scope is None:
+				events = self.events
+				self.events = []
+			else:
+				events = [e for e in self.events if e["scope"] == scope]
+				self.events = [e for e in self.events if e["scope"] not in (scope, None)]
+		return events
+
+	def attempts(self, policy: RetryPolicy) -> 'Attempts':
+		return Attempts(self, policy)
+
+
+class Attempts:
+	# one retry loop. usage:
+	#
+	# for attempt in retries.attempts(policy):
+	#	try:
+	#		...
+	#		break
+	#	except SomeError as e:
+	#		attempt.failed(e)
+
+	def __init__(self, engine: RetryEngine, policy: RetryPolicy):
+		self.engine = engine
+		self.policy = policy
+		self.index = 0
+		self.t0 = time.time()
+		self.t_attempt = self.t0
+		self._exhausted = False
+
+	def __iter__(self):
+		while self.index < self.policy.max_tries and not self._exhausted:
+			self.t_attempt = time.time()
+			yield self
+			self.index += 1
+
+	@property
+	def is_last(self) -> bool:
+		return self.index >= self.policy.max_tries - 1
+
+	def succeeded(self):
+		self.engine.observe(self.policy.operation, time.time() - self.t_attempt)
+
+	def failed(self, reason, sleep: bool = True) -> bool:
+		# returns False if there is no attempt (or time) left.
+		if isinstance(reason, BaseException):
+			reason = reason.__class__.__name__
+
+		if self.is_last:
+			self.engine.record(self.policy.operation, self.index, reason + " (giving up)", 0)
+			return False
+
+		delay = self.engine.delay(self.policy, self.index) if sleep else 0
+		if time.time() - self.t0 + delay > self.policy.budget:
+			self._exhausted = True
+			self.engine.record(self.policy.operation, self.index, reason + " (budget exhausted)", 0)
+			return False
+
+		self.engine.record(self.policy.operation, self.index, reason, delay)
+		if delay > 0:
+			time.sleep(delay)
+		return True
+
+
+# one engine per process. machines fork one process per exam, so telemetry there
+# is per exam. on the master, runs record within their batch's scope and drain
+# only their own events.
+retries = RetryEngine()
+
+
+policies = dict(
+	interact=RetryPolicy("interact", max_tries=6, base_delay=0.1, max_delay=4, budget=60),
+	page_load=RetryPolicy("page_load", max_tries=5, base_delay=0.5, max_delay=3, budget=30),
+	page_settle=RetryPolicy("page_settle", max_tries=1, base_delay=1, max_delay=6, budget=30),
+	find_submit=RetryPolicy("find_submit", max_tries=7, base_delay=0.5, max_delay=8, budget=90),
+	submit=RetryPolicy("submit", max_tries=7, base_delay=0.5, max_delay=8, budget=90))
@@ -13,6 +13,8 @@ import itertools
 import http
 import urllib3
 import traceback
+import json
+from collections import defaultdict
 from contextlib import contextmanager
 
 import selenium
@@ -25,6 +27,8 @@ from selenium.webdriver.remote.command import Command
 
 from tiltr.data.exceptions import *
 
+from .retry import retries, policies
+
 
 @contextmanager
 def run_interaction():
@@ -36,63 +40,206 @@ def run_interaction():
 
 
 def interact(driver: selenium.webdriver.Remote, action: Callable[[], Any], refresh: bool = False) -> Any:
-	n_retries = 5
-	while True:
+	for attempt in retries.attempts(policies["interact"]):
 		try:
-			return action()
-		except (WebDriverException, SessionNotCreatedException):
-			if n_retries < 1:
+			result = action()
+			attempt.succeeded()
+			return result
+		except (WebDriverException, SessionNotCreatedException) as e:
+			if not attempt.failed(e):
 				raise
-			n_retries -= 1
 			if refresh:
 				with wait_for_page_load(driver):
 					driver.refresh()
 
 
+# polling interval (in seconds) for all condition waits below. set from the
+# wait_poll_frequency setting by each process driving a browser.
+_poll_frequency = 0.5
+
+
+def set_poll_frequency(poll_frequency: float):
+	global _poll_frequency
+	_poll_frequency = poll_frequency
+
+
+class WaitStats:
+	# records how long named waits took, so that timeouts and polling
+	# intervals can be tuned from observed data instead of constants.
+
+	def __init__(self):
+		self.durations = defaultdict(list)
+
+	def record(self, name: str, dt: float):
+		self.durations[name].append(dt)
+
+	def summary(self):
+		summary = dict()
+		for name, dts in self.durations.items():
+			summary[name] = dict(
+				n=len(dts),
+				total=sum(dts),
+				mean=sum(dts) / len(dts),
+				max=max(dts))
+		return summary
+
+	def to_json(self):
+		return json.dumps(self.summary(), indent=4, sort_keys=True)
+
+
+def wait_until(driver, condition, timeout=30, poll_frequency=None, name="wait", stats=None, ignored_exceptions=None):
+	t0 = time.time()
+	try:
+		return WebDriverWait(
+			driver, timeout,
+			poll_frequency=poll_frequency or _poll_frequency,
+			ignored_exceptions=ignored_exceptions).until(condition)
+	finally:
+		if stats is not None:
+			stats.record(name, time.time() - t0)
+
+
+def keep_alive_wait(driver, duration, poll_frequency=5, stats=None):
+	# wait for the given duration while pinging selenium, otherwise we'll get a
+	# closed pipe exception. WebDriverWait will not hammer the driver, as it only
+	# checks once per poll_frequency.
+	t1 = time.time() + duration
+
+	def is_over(driver):
+		is_driver_alive(driver)
+		return time.time() >= t1
+
+	try:
+		wait_until(
+			driver, is_over, timeout=duration + poll_frequency,
+			poll_frequency=min(poll_frequency, max(duration, 0.1)),
+			name="keep_alive", stats=stats)
+	except TimeoutException:
+		pass
+
+
+_save_on_navigation_modal_js = """
+	var timeout = arguments[0];
+	var done = arguments[arguments.length - 1];
+
+	function isShown() {
+		var button = document.getElementById('tst_save_on_navigation_button');
+		return button !== null && button.offsetParent !== null;
+	}
+
+	if (isShown()) {
+		done(true);
+		return;
+	}
+
+	var finished = false;
+	var observer = new MutationObserver(function() {
+		if (isShown()) {
+			finish(true);
+		}
+	});
+
+	function finish(shown) {
+		if (!finished) {
+			finished = true;
+			observer.disconnect();
+			done(shown);
+		}
+	}
+
+	observer.observe(document.documentElement, {attributes: true, childList: true, subtree: true});
+	window.addEventListener('beforeunload', function() { finish(false); });
+	setTimeout(function() { finish(false); }, timeout);
+"""
+
+
+_default_script_timeout = 30  # seconds, the WebDriver default.
+
+
+def _get_script_timeout(driver):
+	try:
+		return driver.timeouts.script  # only available in newer Selenium versions.
+	except AttributeError:
+		return _default_script_timeout
+
+
+def wait_for_save_on_navigation_modal(driver, timeout=1, stats=None):
+	# after clicking a navigation button, ILIAS either navigates away or shows a
+	# modal asking to save. instead of sleeping, we let a MutationObserver inside
+	# the page tell us which of both happened.
+	t0 = time.time()
+	script_timeout = _get_script_timeout(driver)
+	try:
+		driver.set_script_timeout(timeout + 5)
+		shown = driver.execute_async_script(_save_on_navigation_modal_js, int(timeout * 1000))
+	except WebDriverException:
+		# page unloaded while waiting, i.e. we navigated.
+		shown = False
+	finally:
+		try:
+			driver.set_script_timeout(script_timeout)
+		except WebDriverException:
+			pass
+		if stats is not None:
+			stats.record("save_on_navigation_modal", time.time() - t0)
+
+	if not shown:
+		return None
+
+	try:
+		return driver.find_element_by_id("tst_save_on_navigation_button")
+	except NoSuchElementException:
+		return None
+
+
 def is_loaded(driver):
 	return driver.execute_script("return document.readyState") == "complete"
 
 
 @contextmanager
-def wait_for_page_load(driver, timeout=30):
-	for i in range(5):
+def wait_for_page_load(driver, timeout=30, stats=None):
+	old_page = None
+	for attempt in retries.attempts(policies["page_load"]):
 		try:
 			old_page = driver.find_element_by_tag_name('html')
 			break
-		except SessionNotCreatedException:
-			time.sleep(1)
-		except NoSuchElementException:
-			time.sleep(1)
+		except (SessionNotCreatedException, NoSuchElementException) as e:
+			attempt.failed(e)
 
 	yield
 
 	def wait_for(event):
 		try:
-			WebDriverWait(driver, timeout).until(event)
-		except WebDriverException:
+			wait_until(driver, event, timeout, name="page_load", stats=stats)
+		except WebDriverException as e:
 			# sporadically, Selenium will fail with a strange error here:
 			# selenium.common.exceptions.WebDriverException: Message: TypeError: el is undefined
 			# if this happens, just wait some more and hope for the best (i.e. that the page did reload).
-			time.sleep(3)
+			retries.backoff(policies["page_settle"], e)
 
 	t0 = time.time()
 	while True:
 		try:
-			wait_for(staleness_of(old_page))
+			if old_page is not None:
+				wait_for(staleness_of(old_page))
 			wait_for(is_loaded)
 		except TimeoutException:
 			if time.time() - t0 > timeout:
 				raise
 
+		# page load latencies drive how long we back off when settling pages.
+		retries.observe("page_settle", time.time() - t0)
 		return
 
 
-def wait_for_css(driver, css, timeout=30):
-	interact(driver, lambda: WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.CSS_SELECTOR, css))))
+def wait_for_css(driver, css, timeout=30, stats=None):
+	interact(driver, lambda: wait_until(
+		driver, EC.presence_of_element_located((By.CSS_SELECTOR, css)), timeout, name="css", stats=stats))
 
 
-def wait_for_css_visible(driver, css, timeout=30):
-	interact(driver, lambda: WebDriverWait(driver, timeout).until(EC.visibility_of_element_located((By.CSS_SELECTOR, css))))
+def wait_for_css_visible(driver, css, timeout=30, stats=None):
+	interact(driver, lambda: wait_until(
+		driver, EC.visibility_of_element_located((By.CSS_SELECTOR, css)), timeout, name="css_visible", stats=stats))
 
 
 def set_element_value(driver, field, value):
@@ -183,18 +330,21 @@ def create_detailed_exception(driver):
 def try_submit(driver, css, f, allow_reload=True, allow_empty=True, n_tries=7, max_sleep_time=8):
 	button = None
 
-	for i in range(n_tries):
+	find_policy = policies["find_submit"].derive(max_tries=n_tries, max_delay=max_sleep_time)
+	for attempt in retries.attempts(find_policy):
 		try:
 			button = driver.find_element_by_css_selector(css)
+			attempt.succeeded()
 			break
-		except (TimeoutException, ElementClickInterceptedException, ElementNotInteractableException):
-			time.sleep(min(max_sleep_time, 2 ** i))
-		except NoSuchElementException:
+		except (TimeoutException, ElementClickInterceptedException, ElementNotInteractableException) as e:
+			attempt.failed(e)
+		except NoSuchElementException as e:
 			if allow_reload:
+				attempt.failed(e, sleep=False)
 				with wait_for_page_load(driver):
 					driver.refresh()
 			else:
-				time.sleep(min(max_sleep_time, 2 ** i))
+				attempt.failed(e)
 
 	if not button:
 		if allow_empty:
@@ -204,7 +354,8 @@ def try_submit(driver, css, f, allow_reload=True, allow_empty=True, n_tries=7, m
 	old_url = None
 	unknown_url = "[unknown url]"
 
-	for i in range(n_tries):
+	submit_policy = policies["submit"].derive(max_tries=n_tries, max_delay=max_sleep_time)
+	for attempt in retries.attempts(submit_policy):
 		try:
 			url = driver.current_url
 		except:
@@ -221,12 +372,12 @@ def try_submit(driver, css, f, allow_reload=True, allow_empty=True, n_tries=7, m
 		try:
 			with wait_for_page_load(driver):
 				f(button)
+			attempt.succeeded()
 			break
 		except (TimeoutException, ElementClickInterceptedException, ElementNotInteractableException) as e:
 			traceback.print_exc()
-			if i >= n_tries - 1:
+			if not attempt.failed(e):
 				raise create_detailed_exception(driver) from e
-			time.sleep(min(max_sleep_time, 2 ** i))
 		except NoSuchElementException:
 			traceback.print_exc()
 			# we've seen css before, and now it's gone. usually this means that
@@ -16,4 +16,6 @@ def parse_args():
 	parser.add_argument('--tiltr-port')
 	parser.add_argument('--embedded-ilias-port', nargs='?')
 
+	parser.add_argument('--machine-workers', type=int, default=1)
+
 	return parser.parse_args()
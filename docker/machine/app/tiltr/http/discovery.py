@@ -27,6 +27,38 @@ def verify_hello(machine):
 	return False
 
 
+def query_slots(machine):
+	# number of concurrent exam sessions a machine runs. machines without a
+	# /slots/ endpoint run a single session.
+	try:
+		r = requests.get("http://%s:8888/slots/" % machine)
+		if r.status_code == 200:
+			return max(1, int(json.loads(r.text)["slots"]))
+	except:
+		traceback.print_exc()
+	return 1
+
+
+def machine_url(address, endpoint, batch, *args):
+	# machine addresses are either "ip" (slot 0) or "ip/slot". ip may carry a port
+	# (e.g. for the fake machines used in benchmarks); the default is 8888.
+	host, _, slot = address.partition("/")
+	if ":" not in host:
+		host = "%s:8888" % host
+	parts = [endpoint, batch, slot or "0"] + [str(arg) for arg in args]
+	return "http://%s/%s" % (host, "/".join(parts))
+
+
+def expand_slots(machines):
+	# every worker slot is scheduled like a machine of its own.
+	slots = dict()
+	for name, ip in sorted(machines.items(), key=lambda item: int(item[0].split("_")[-1])):
+		for slot in range(query_slots(ip)):
+			address = ip if slot == 0 else "%s/%d" % (ip, slot)
+			slots['machine_%d' % (len(slots) + 1)] = address
+	return slots
+
+
 def detect_machines():
 	i = 1
 
@@ -83,7 +115,11 @@ class Machines:
 
 		print("%d machines are up and running." % len(responsive))
 
-		return responsive
+		slots = expand_slots(responsive)
+		if len(slots) > len(responsive):
+			print("%d worker slots available." % len(slots))
+
+		return slots
 
 	def __exit__(self, *args):
 		if not self.parallel:
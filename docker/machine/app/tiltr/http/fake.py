@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+from typing import Dict, List
+
+import io
+import os
+import json
+import time
+import random as rnd
+import zipfile
+import asyncio
+import threading
+from decimal import Decimal
+
+import openpyxl
+import tornado.ioloop
+import tornado.web
+
+from tiltr.data.result import Result, Origin
+from tiltr.question.synthetic import single_choice
+
+
+# a stand-in for ILIAS and for the machines, for benchmarking the master side
+# of TiltR (fan-out to machines, export downloads, XLS and PDF parsing, result
+# checks, database writes) without the dockerized ILIAS, MySQL and Selenium
+# stack. everything is derived from a synthetic exam: the answers each user
+# gave are known up front, so the fake machines can send back recorded results
+# that match what the fake ILIAS exports.
+
+ilias_version = (6, 0, 0)
+
+_pdf_path = os.path.join(os.path.dirname(__file__), "..", "pdf", "tests", "default_style_5.3.14.pdf")
+
+
+class FakeExam:
+	def __init__(self, n_users: int, n_questions: int = 10, n_choices: int = 4, seed: int = 0):
+		random = rnd.Random(seed)
+
+		self.usernames = ["bench%04d" % (i + 1) for i in range(n_users)]
+
+		self.questions = dict()
+		for i in range(n_questions):
+			title = "Question %d" % (i + 1)
+			self.questions[title] = single_choice(title, dict(
+				("Choice %d" % (j + 1), Decimal(random.randint(0, 4)) / Decimal(2)) for j in range(n_choices)))
+
+		self.maximum_score = sum(q.get_maximum_score(None) for q in self.questions.values())
+
+		self.answers = dict()
+		for username in self.usernames:
+			self.answers[username] = dict(
+				(title, random.choice(list(q.choices.keys()))) for title, q in self.questions.items())
+
+		self._xlsx = None
+		self._xmlres = None
+		with open(_pdf_path, "rb") as f:
+			self._pdf = f.read()
+
+	def _scores(self, username: str) -> Dict[str, Decimal]:
+		return dict(
+			(title, question.choices[self.answers[username][title]])
+			for title, question in self.questions.items())
+
+	def _mark(self, score: Decimal) -> str:
+		return "passed" if score * 2 >= self.maximum_score else "failed"
+
+	def recorded_result(self, username: str) -> Result:
+		# what a machine would have recorded for this user, restricted to what
+		# the XLS export contains.
+		result = Result(origin=Origin.recorded)
+		scores = self._scores(username)
+
+		for title, question in self.questions.items():
+			for choice in question.choices.keys():
+				checked = "1" if self.answers[username][title] == choice else "0"
+				result.add(Result.key("question", title, "answer", choice), checked)
+			result.add(
+				("xls", "question", Result.normalize_question_title(title), "score_reached"),
+				Decimal(str(scores[title])))
+
+		score = sum(scores.values())
+		result.add(("xls", "score_reached"), Decimal(str(score)))
+		result.add(("xls", "score_maximum"), Decimal(str(self.maximum_score)))
+		result.add(("xls", "short_mark"), self._mark(score))
+
+		result.attach_performance_measurements([0.1] * len(self.questions))
+		return result
+
+	def xlsx(self) -> bytes:
+		# the layout of ILIAS 6's results export, as read by workbook_to_result().
+		if self._xlsx is not None:
+			return self._xlsx
+
+		wb = openpyxl.Workbook()
+		main = wb.active
+		main.title = "Testergebnisse"
+		main.cell(row=1, column=1, value="Name")
+		main.cell(row=1, column=2, value="Reached")
+		main.cell(row=1, column=3, value="Maximum")
+		main.cell(row=1, column=4, value="Mark")
+		for i, title in enumerate(self.questions.keys()):
+			main.cell(row=1, column=20 + i, value=title)
+
+		for row, username in enumerate(self.usernames, 2):
+			scores = self._scores(username)
+			score = sum(scores.values())
+			name = "user, %s" % username
+
+			main.cell(row=row, column=1, value=name)
+			main.cell(row=row, column=2, value=str(score))
+			main.cell(row=row, column=3, value=str(self.maximum_score))
+			main.cell(row=row, column=4, value=self._mark(score))
+			for i, title in enumerate(self.questions.keys()):
+				main.cell(row=row, column=20 + i, value=str(scores[title]))
+
+			sheet = wb.create_sheet(name)
+			sheet.cell(row=1, column=1, value=name)
+			r = 3
+			for i, (title, question) in enumerate(self.questions.items()):
+				sheet.cell(row=r, column=1, value=str(i + 1))
+				sheet.cell(row=r, column=2, value=title)
+				r += 1
+				for choice in question.choices.keys():
+					sheet.cell(row=r, column=1, value=choice)
+					sheet.cell(row=r, column=2, value="1" if self.answers[username][title] == choice else "0")
+					r += 1
+				r += 1  # an empty row starts the next question.
+
+		out = io.BytesIO()
+		wb.save(out)
+		self._xlsx = out.getvalue()
+		return self._xlsx
+
+	def xmlres(self) -> bytes:
+		# a test export as accepted by _patch_exam_name().
+		if self._xmlres is not None:
+			return self._xmlres
+
+		name = "1500000000__0__tst_1"
+		items = "".join('<item title="%s"/>' % title for title in self.questions.keys())
+
+		out = io.BytesIO()
+		with zipfile.ZipFile(out, "w") as z:
+			z.writestr("%s/%s.xml" % (name, name), '<ContentObject><MetaData><General><Title>bench</Title></General></MetaData></ContentObject>')
+			z.writestr("%s/%s.xml" % (name, name.replace("_tst_", "_qti_")), '<questestinterop><assessment title="bench">%s</assessment></questestinterop>' % items)
+			z.writestr("%s/objects/results.xml" % name, "<results>%s</results>" % "".join(
+				'<user name="%s"/>' % username for username in self.usernames))
+		self._xmlres = out.getvalue()
+		return self._xmlres
+
+	def pdf(self, username: str) -> bytes:
+		# a canned export. the trailing comment makes each user's file distinct,
+		# so the PDF cache cannot short-cut parsing.
+		return self._pdf + ("\n%% %s\n" % username).encode("utf8")
+
+	def participants_html(self) -> str:
+		rows = "".join('<tr><td>%s</td><td>user, %s</td></tr>' % (u, u) for u in self.usernames)
+		return '<html><body><table id="tst_participants"><tbody>%s</tbody></table></body></html>' % rows
+
+	def statistics_html(self) -> str:
+		rows = []
+		for username in self.usernames:
+			score = sum(self._scores(username).values())
+			rows.append('<tr><td>%s</td><td>%s</td><td>%s</td><td>%s</td></tr>' % (
+				username, score, self.maximum_score, self._mark(score)))
+		return '<html><body><table id="tst_statistics"><tbody>%s</tbody></table></body></html>' % "".join(rows)
+
+
+class FakeState:
+	def __init__(self, exam: FakeExam, exam_seconds: float):
+		self.exam = exam
+		self.exam_seconds = exam_seconds
+		self.sessions = dict()  # by slot
+
+	def start(self, batch: str, slot: int, command: Dict):
+		self.sessions[slot] = (batch, command["username"], time.time())
+
+	def get_messages(self, batch: str, slot: int) -> List:
+		session = self.sessions.get(slot)
+		if session is None or session[0] != batch:
+			return []
+
+		_, username, t0 = session
+		messages = [("ECHO", "taking fake exam as %s." % username)]
+		if time.time() - t0 >= self.exam_seconds:
+			messages.append(("DONE", self.exam.recorded_result(username).to_json()))
+		return messages
+
+
+class _FakeHandler(tornado.web.RequestHandler):
+	def initialize(self, state):
+		self.state = state
+
+
+class FakeHelloHandler(tornado.web.RequestHandler):
+	def post(self):
+		self.write('HelloToo')
+		self.finish()
+
+
+class FakeSlotsHandler(_FakeHandler):
+	def get(self):
+		self.write(json.dumps(dict(slots=len(self.state.exam.usernames))))
+		self.finish()
+
+
+class FakeStartHandler(_FakeHandler):
+	def post(self, batch, slot):
+		self.state.start(batch, int(slot), json.loads(self.get_argument("command_json")))
+		self.finish()
+
+
+class FakeMonitorHandler(_FakeHandler):
+	def get(self, batch, slot, index):
+		# like real machines, return messages starting at index.
+		self.write(json.dumps(self.state.get_messages(batch, int(slot))[int(index):]))
+		self.finish()
+
+
+class FakeExportHandler(_FakeHandler):
+	def get(self, format):
+		exam = self.state.exam
+		if format == "xlsx":
+			self.set_header("Content-Type", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+			self.write(exam.xlsx())
+		elif format == "pdf":
+			self.set_header("Content-Type", "application/pdf")
+			self.write(exam.pdf(self.get_argument("user")))
+		elif format == "zip":
+			self.set_header("Content-Type", "application/zip")
+			self.write(exam.xmlres())
+		else:
+			raise tornado.web.HTTPError(404)
+		self.finish()
+
+
+class FakePageHandler(_FakeHandler):
+	def get(self, page):
+		if page == "participants":
+			self.write(self.state.exam.participants_html())
+		elif page == "statistics":
+			self.write(self.state.exam.statistics_html())
+		else:
+			raise tornado.web.HTTPError(404)
+		self.finish()
+
+
+def make_fake_app(state: FakeState):
+	# machine routes mirror tiltr.http.machine, each slot being one user.
+	return tornado.web.Application([
+		(r"/hello/", FakeHelloHandler),
+		(r"/slots/", FakeSlotsHandler, dict(state=state)),
+		(r"/start/(?P<batch>[^/]+)/(?P<slot>[0-9]+)", FakeStartHandler, dict(state=state)),
+		(r"/monitor/(?P<batch>[^/]+)/(?P<slot>[0-9]+)/(?P<index>[0-9]+)", FakeMonitorHandler, dict(state=state)),
+		(r"/ilias/export\.(?P<format>[a-z]+)", FakeExportHandler, dict(state=state)),
+		(r"/ilias/(?P<page>[a-z]+)\.html", FakePageHandler, dict(state=state))
+	])
+
+
+class FakeServer:
+	# runs the fake app on its own IOLoop in a background thread.
+
+	def __init__(self, exam: FakeExam, port: int = 8890, exam_seconds: float = 0):
+		self.state = FakeState(exam, exam_seconds)
+		self.port = port
+		self.loop = None
+		self.ready = threading.Event()
+		self.thread = threading.Thread(target=self._serve, daemon=True)
+
+	def _serve(self):
+		asyncio.set_event_loop(asyncio.new_event_loop())
+		make_fake_app(self.state).listen(self.port, address="127.0.0.1")
+		self.loop = tornado.ioloop.IOLoop.current()
+		self.ready.set()
+		self.loop.start()
+
+	def start(self):
+		self.thread.start()
+		self.ready.wait()
+
+	def stop(self):
+		if self.loop is not None:
+			self.loop.add_callback(self.loop.stop)
+		self.thread.join()
+
+	def set_exam(self, exam: FakeExam):
+		self.state.exam = exam
+		self.state.sessions = dict()
+
+	@property
+	def url(self) -> str:
+		return "http://127.0.0.1:%d" % self.port
+
+	def machine(self, slot: int) -> str:
+		# an address as understood by machine_url().
+		return "127.0.0.1:%d/%d" % (self.port, slot)
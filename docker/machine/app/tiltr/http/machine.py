@@ -11,6 +11,7 @@ import sys
 import json
 import time
 import os
+import contextlib
 
 import tornado.ioloop
 import tornado.web
@@ -24,21 +25,61 @@ from tiltr.data.result import Result, Origin
 from ..driver.commands import TakeExamCommand
 from .utils import clear_tmp
 from .args import parse_args
+from .profiling import ProfileHandler, ThreadsHandler, sample_stacks, prefix_stacks, dump_threads
 
 
 class GlobalState:
-	def __init__(self):
-		self.runner = None
+	def __init__(self, n_workers=1):
+		# each worker slot runs one forked exam session with its own browser.
+		self.n_workers = max(1, n_workers)
+		self.runners = dict()
+
+	def get_runner(self, slot):
+		return self.runners.get(slot)
+
+	def is_valid_slot(self, slot):
+		return 0 <= slot < self.n_workers
+
+	def get_active_runners(self):
+		return [runner for _, runner in sorted(self.runners.items()) if runner.is_alive()]
+
+	def sample_stacks(self, seconds, interval):
+		# exams run in forked processes, so we ask each of them to sample itself
+		# while we sample our own threads.
+		runners = self.get_active_runners()
+		for runner in runners:
+			runner.request_debug("PROFILE", seconds, interval)
+
+		samples = prefix_stacks(sample_stacks(seconds, interval), "machine")
+
+		for runner in runners:
+			child_samples = runner.wait_debug("PROFILE", seconds + 10)
+			if child_samples:
+				samples.update(prefix_stacks(child_samples, "slot %d" % runner.slot))
+
+		return samples
+
+	def dump_threads(self):
+		parts = ["## machine", dump_threads()]
+
+		runners = self.get_active_runners()
+		for runner in runners:
+			runner.request_debug("THREADS")
+		for runner in runners:
+			parts.append("## slot %d" % runner.slot)
+			parts.append(runner.wait_debug("THREADS", 10) or "(no response)")
+
+		return "\n".join(parts)
 
 
 class Runner(threading.Thread):
-	def __init__(self, state, batch, command):
+	def __init__(self, state, batch, slot, command):
 		threading.Thread.__init__(self)
-		clear_tmp()
 
 		self.state = state
 		self.wait_time = command.wait_time
 		self.batch = batch
+		self.slot = slot
 		self.command = command
 
 		self.messages = []
@@ -46,6 +87,12 @@ class Runner(threading.Thread):
 		self.screenshot_valid_time = time.time()
 		self.screenshot_refresh_time = float(command.settings.screenshot_refresh_time)
 
+		# a control pipe for debugging requests (profiles, thread dumps) to the forked child.
+		self.debug_pipe = None
+		self.debug_mutex = threading.Lock()
+		self.debug_responses = dict()
+		self.debug_events = dict(PROFILE=threading.Event(), THREADS=threading.Event())
+
 	def get_batch(self):
 		return self.batch
 
@@ -54,18 +101,25 @@ class Runner(threading.Thread):
 		# chrome zomie processes piling up inside the selenium chrome docker container.
 
 		pipein, pipeout = os.pipe()
+		debugin, debugout = os.pipe()
 		if os.fork() == 0:
 
 			os.close(pipein)
+			os.close(debugout)
+
+			write_mutex = threading.Lock()
 
 			def write(*args):
-				os.write(pipeout, (json.dumps(args) + "\n").encode('utf8'))
+				with write_mutex:
+					os.write(pipeout, (json.dumps(args) + "\n").encode('utf8'))
+
+			self._serve_debug_requests(debugin, write)
 
 			try:
 				try:
 					with self._create_browser() as browser:
 						def report(*args):
-							if time.time() > self.screenshot_valid_time:
+							if browser is not None and time.time() > self.screenshot_valid_time:
 								try:
 									screenshot = browser.driver.get_screenshot_as_base64()
 									self.screenshot_valid_time = time.time() + self.screenshot_refresh_time
@@ -75,8 +129,9 @@ class Runner(threading.Thread):
 
 							write("ECHO", " ".join("%s" % arg for arg in args))
 
-						report("machine browser has wait time %d." % self.wait_time)
-						report('running on user agent', browser.driver.execute_script('return navigator.userAgent'))
+						if browser is not None:
+							report("machine browser has wait time %d." % self.wait_time)
+							report('running on user agent', browser.driver.execute_script('return navigator.userAgent'))
 
 						expected_result = self.command.run(browser, report)
 				except WebDriverException as webdriver_error:
@@ -97,6 +152,8 @@ class Runner(threading.Thread):
 
 		else:
 			os.close(pipeout)
+			os.close(debugin)
+			self.debug_pipe = debugout
 
 			try:
 				with os.fdopen(pipein) as fdpipein:
@@ -107,12 +164,55 @@ class Runner(threading.Thread):
 						data = json.loads(line)
 						if data[0] == 'SCREENSHOT':
 							self.screenshot = data[1]
+						elif data[0] in self.debug_events:
+							self.debug_responses[data[0]] = data[1]
+							self.debug_events[data[0]].set()
 						else:
 							self.messages.append(data)
 			finally:
-				os.close(pipein)
+				with self.debug_mutex:
+					self.debug_pipe = None
+					os.close(debugout)
+				for event in self.debug_events.values():
+					event.set()
+
+	@staticmethod
+	def _serve_debug_requests(debugin, write):
+		# runs inside the forked child.
+		def serve():
+			with os.fdopen(debugin) as requests:
+				for line in requests:
+					try:
+						args = json.loads(line)
+						if args[0] == "PROFILE":
+							write("PROFILE", sample_stacks(*args[1:]))
+						elif args[0] == "THREADS":
+							write("THREADS", dump_threads())
+					except:
+						traceback.print_exc()
+
+		threading.Thread(target=serve, daemon=True).start()
+
+	def request_debug(self, command, *args):
+		with self.debug_mutex:
+			if self.debug_pipe is None:
+				return False
+			self.debug_events[command].clear()
+			self.debug_responses.pop(command, None)
+			try:
+				os.write(self.debug_pipe, (json.dumps([command] + list(args)) + "\n").encode('utf8'))
+				return True
+			except OSError:
+				return False
+
+	def wait_debug(self, command, timeout):
+		self.debug_events[command].wait(timeout)
+		return self.debug_responses.pop(command, None)
 
 	def _create_browser(self):
+		if not self.command.uses_browser():
+			return contextlib.nullcontext()
+
 		return pandora.Browser(
 			browser=self.command.settings.browser,
 			wait_time=self.command.wait_time,
@@ -131,19 +231,38 @@ class HelloHandler(tornado.web.RequestHandler):
 		self.finish()
 
 
+class SlotsHandler(tornado.web.RequestHandler):
+	def initialize(self, state):
+		self.state = state
+
+	def get(self):
+		self.write(json.dumps(dict(slots=self.state.n_workers)))
+		self.finish()
+
+
 class StartHandler(tornado.web.RequestHandler):
 	def initialize(self, state):
 		self.state = state	
 
-	def post(self, batch):
-		if self.state.runner and not self.state.runner.is_alive():
-			self.state.runner = None
+	def post(self, batch, slot=None):
+		slot = int(slot or 0)
+		if not self.state.is_valid_slot(slot):
+			raise tornado.web.HTTPError(404)
+
+		runner = self.state.get_runner(slot)
+		if runner and not runner.is_alive():
+			runner = None
+
+		if runner is None:
+			if not self.state.get_active_runners():
+				# other slots' browsers keep their files in /tmp, only clear it when idle.
+				clear_tmp()
 
-		if self.state.runner is None:
 			command_json = self.get_argument("command_json")
 			command = TakeExamCommand(from_json=command_json)
-			self.state.runner = Runner(self.state, batch, command)
-			self.state.runner.start()
+			runner = Runner(self.state, batch, slot, command)
+			self.state.runners[slot] = runner
+			runner.start()
 
 		self.finish()
 
@@ -160,8 +279,8 @@ class MonitorHandler(tornado.web.RequestHandler):
 	def initialize(self, state):
 		self.state = state	
 
-	def get(self, batch, index):
-		runner = self.state.runner
+	def get(self, batch, index, slot=None):
+		runner = self.state.get_runner(int(slot or 0))
 
 		if runner and runner.get_batch() == batch:
 			self.write(json.dumps(runner.get_messages(int(index))))
@@ -175,8 +294,8 @@ class ScreenshotHandler(tornado.web.RequestHandler):
 	def initialize(self, state):
 		self.state = state	
 
-	def get(self, batch):
-		runner = self.state.runner
+	def get(self, batch, slot=None):
+		runner = self.state.get_runner(int(slot or 0))
 
 		if runner and runner.get_batch() == batch and runner.get_screenshot():
 			self.write(runner.get_screenshot())
@@ -184,23 +303,30 @@ class ScreenshotHandler(tornado.web.RequestHandler):
 		self.finish()
 
 
-def make_app():
-	state = GlobalState()
+def make_app(n_workers=1):
+	state = GlobalState(n_workers)
 
+	# routes without a slot address slot 0, i.e. machines with a single worker.
 	return tornado.web.Application([
 		(r"/hello/", HelloHandler),
+		(r"/slots/", SlotsHandler, dict(state=state)),
+		(r"/start/(?P<batch>[^/]+)/(?P<slot>[0-9]+)", StartHandler, dict(state=state)),
 		(r"/start/(?P<batch>[^/]+)", StartHandler, dict(state=state)),
 		(r"/abort/", AbortHandler, dict(state=state)),
+		(r"/monitor/(?P<batch>[^/]+)/(?P<slot>[0-9]+)/(?P<index>[0-9]+)", MonitorHandler, dict(state=state)),
 		(r"/monitor/(?P<batch>[^/]+)/(?P<index>[0-9]+)", MonitorHandler, dict(state=state)),
-		(r"/screenshot/(?P<batch>[^/]+)", ScreenshotHandler, dict(state=state))
+		(r"/screenshot/(?P<batch>[^/]+)/(?P<slot>[0-9]+)", ScreenshotHandler, dict(state=state)),
+		(r"/screenshot/(?P<batch>[^/]+)", ScreenshotHandler, dict(state=state)),
+		(r"/debug/profile", ProfileHandler, dict(name="machine", sample=state.sample_stacks)),
+		(r"/debug/threads", ThreadsHandler, dict(dump=state.dump_threads))
 	])
 
 
 def run_machine():
-	print("starting machine.")
-	parse_args()  # ignored right now
+	args = parse_args()
+	print("starting machine with %d worker(s)." % args.machine_workers)
 
-	app = make_app()
+	app = make_app(args.machine_workers)
 	app.listen(8888)
 
 	print("HELLO.")
@@ -22,14 +22,20 @@ import tornado.ioloop
 import tornado.web
 import tornado.websocket
 
-from .discovery import connect_machines
+from .discovery import connect_machines, machine_url
 from .utils import clear_tmp
 from .args import parse_args
+from .profiling import ProfileHandler, ThreadsHandler
 from tiltr.driver.batch import Batch
+from tiltr.driver.checkpoint import Checkpoints, collect_orphans
+from tiltr.driver.load import LoadTest
 from tiltr.driver.drivers import PackagedTest, ILIASVersion
+from tiltr.driver.catalog import catalog
 from tiltr.data.result import open_results
 from tiltr.data.settings import Settings, Workarounds
 from tiltr.data.database import DB
+from tiltr.data.tracing import waterfall
+from tiltr.data.metrics import metrics
 
 def _uses_embedded_ilias(args):
 	return args.embedded_ilias_port is not None and int(args.embedded_ilias_port) > 0
@@ -109,6 +115,67 @@ class FetchILIASVersion(threading.Thread):
 					n_tries += 1
 
 
+class ResumeInterruptedRuns(threading.Thread):
+	# on startup, resume the interrupted run that got furthest, and clean up after
+	# all other interrupted runs (see tiltr.driver.checkpoint).
+
+	def __init__(self, state):
+		super().__init__()
+		self.state = state
+
+	def _create_batch(self, run):
+		return self.state.create_batch(
+			PackagedTest(run["test_id"]),
+			Settings(from_dict=run["settings"]),
+			Workarounds(from_dict=run["workarounds"]),
+			run["wait_time"])
+
+	def _can_resume(self, checkpoints):
+		run = checkpoints.get("run")
+		return run is not None and \
+			run["ilias_version"] == self.state.get_ilias_version().text and \
+			run["n_machines"] == len(self.state.machines) and \
+			os.path.exists(os.path.join("/tiltr/tests", run["test_id"] + ".zip"))
+
+	def _collect_orphans(self, checkpoints):
+		print("cleaning up after interrupted batch %s." % checkpoints.batch_id)
+		try:
+			run = checkpoints.get("run")
+			if run is not None and os.path.exists(os.path.join("/tiltr/tests", run["test_id"] + ".zip")):
+				collect_orphans(self._create_batch(run), checkpoints)
+			else:
+				checkpoints.clear()
+		except:
+			traceback.print_exc()
+
+	def run(self):
+		while self.state.get_ilias_version() is None:
+			time.sleep(1)
+
+		try:
+			interrupted = Checkpoints.unfinished()
+		except:
+			traceback.print_exc()
+			return
+
+		resumable = [c for c in interrupted if self._can_resume(c)]
+		resumed = max(resumable, key=lambda c: c.progress) if resumable else None
+
+		if resumed is not None:
+			if self.state.batch is None:
+				print("resuming interrupted batch %s." % resumed.batch_id)
+				batch = self._create_batch(resumed.get("run"))
+				batch.resume(resumed.batch_id)
+				self.state.batch = batch
+				batch.start()
+			else:
+				resumed = None
+
+		for checkpoints in interrupted:
+			if checkpoints is not resumed:
+				self._collect_orphans(checkpoints)
+
+
 class Looper(threading.Thread):
 	def __init__(self, state, test, settings, workarounds, wait_time):
 		super().__init__()
@@ -120,8 +187,40 @@ class Looper(threading.Thread):
 		self.done = False
 		self.consecutive_interaction_fails = 0
 
-	def _check_success(self):
-		success = self.state.batch.get_success()
+		# pipelined looping: the batch being prepared ahead and the batches
+		# that are still being verified after their machines were released.
+		self.next_batch = None
+		self.draining = []
+
+	def stop_recycling(self):
+		# batches still owned by the looper must not put their users back into the pool.
+		for batch in [self.next_batch] + self.draining:
+			if batch:
+				batch.set_recycle_users(False)
+
+	def _destroy_recycled_users(self):
+		for batch in self.draining:
+			batch.join()
+		self.draining = []
+
+		if self.test.cache.recycled_users:
+			print("destroying recycled users.")
+			try:
+				# not via create_batch(), which would clear /tmp under a running batch.
+				batch = Batch(
+					self.state.machines, self.state.get_ilias_version(),
+					self.test, self.settings, self.workarounds, self.wait_time)
+				batch.configure(self.state.args)
+				batch.destroy_recycled_users()
+			except:
+				traceback.print_exc()
+
+	def _is_pipelined(self):
+		# load tests measure one stage at a time, so runs must not overlap.
+		return int(self.settings.pipelined_looping) > 0 and not LoadTest.is_enabled(self.settings)
+
+	def _check_success(self, batch):
+		success = batch.get_success()
 		if success == ('FAIL', 'interaction'):
 			self.consecutive_interaction_fails += 1
 		else:
@@ -137,23 +236,59 @@ class Looper(threading.Thread):
 			# container. shut down in this case.
 			sys.exit(1)
 
+	def _pipeline(self, batch):
+		if self.next_batch is None:
+			if batch.machines_released():
+				# the current batch is now being verified on the master. start
+				# preparing the next one on a second master browser.
+				self.next_batch = self.state.create_batch(
+					self.test, self.settings, self.workarounds, self.wait_time)
+				if self.next_batch:
+					self.next_batch.prepare_ahead()
+		elif self.next_batch.is_prepared():
+			# dispatch the next exams right away, finish verification in the background.
+			self.draining.append(batch)
+			self.state.batch = self.next_batch
+			self.next_batch = None
+			self.state.batch.start()
+
 	def run(self):
 		while self.state.is_looping:
 			try:
+				for batch in [b for b in self.draining if b.is_done()]:
+					self._check_success(batch)
+					self.draining.remove(batch)
+
 				if self.state.batch and self.state.batch.is_done():
-					self._check_success()
+					self._check_success(self.state.batch)
+					self.state.record_load(self.state.batch)
 					self.state.batch = None
 
 				if not self.state.is_looping:
 					break
 
 				if self.state.batch is None:
-					self.state.start_batch(self.test, self.settings, self.workarounds, self.wait_time)
+					if self.next_batch and self.next_batch.is_prepared():
+						self.state.batch = self.next_batch
+						self.next_batch = None
+						self.state.batch.start()
+					elif self.next_batch is None:
+						self.state.start_batch(self.test, self.settings, self.workarounds, self.wait_time)
+				elif self._is_pipelined():
+					self._pipeline(self.state.batch)
 			except:
 				traceback.print_exc()
 
 			time.sleep(1)
 
+		if self.next_batch:
+			print("discarding prepared batch.")
+			self.next_batch.discard()
+			self.next_batch = None
+
+		self.stop_recycling()
+		self._destroy_recycled_users()
+
 		self.state.looper = None
 
 		print("looper has exited.")
@@ -169,8 +304,10 @@ class GlobalState:
 		self.ilias_url = args.ilias_url
 
 		self.ilias_version = None
+		self.load_test = None
 
 		FetchILIASVersion(self).start()
+		ResumeInterruptedRuns(self).start()
 
 	def get_ilias_url(self):
 		return self.ilias_url
@@ -190,6 +327,8 @@ class GlobalState:
 
 		if self.batch:
 			self.batch.set_recycle_users(is_looping)
+		if self.looper and not is_looping:
+			self.looper.stop_recycling()
 
 		if self.batch and self.is_looping and self.looper is None:
 			batch = self.batch
@@ -198,21 +337,71 @@ class GlobalState:
 			self.looper.start()
 		if not self.is_looping:
 			self.looper = None
+			self.finish_load_test()
 
-	def start_batch(self, test, settings, workarounds, wait_time):
-		if self.batch and self.batch.is_done():
-			self.batch = None
+	def _get_load_sessions(self, settings):
+		# number of concurrent sessions for the next run of a load test, or None.
+		if not (self.is_looping and LoadTest.is_enabled(settings)):
+			return None
+
+		if self.load_test is None:
+			self.load_test = LoadTest(settings, len(self.machines), self.get_ilias_version())
+
+		stage = self.load_test.current_stage()
+		return stage.sessions if stage else None
 
+	def record_load(self, batch):
+		if self.load_test is None or not batch.is_load_test:
+			return
+
+		self.load_test.record(batch.current_run)
+
+		if self.load_test.is_done():
+			self.is_looping = False
+
+	def finish_load_test(self):
+		load_test = self.load_test
+		self.load_test = None
+
+		if load_test is not None:
+			report = load_test.report()
+			print("load test finished, saturation at %s sessions." % report["saturation_sessions"])
+
+			with open_results() as db:
+				db.put_load_report(report)
+
+	def create_batch(self, test, settings, workarounds, wait_time):
 		ilias_version = self.get_ilias_version()  # available?
 		if ilias_version is None:
 			return None
 
+		clear_tmp()
+
+		machines = self.machines
+		n_sessions = self._get_load_sessions(settings)
+		if n_sessions is not None:
+			machines = dict(list(machines.items())[:n_sessions])
+
+		batch = Batch(machines, ilias_version, test, settings, workarounds, wait_time)
+		batch.configure(self.args)
+		batch.set_recycle_users(self.is_looping)
+		batch.is_load_test = n_sessions is not None
+
+		return batch
+
+	def start_batch(self, test, settings, workarounds, wait_time):
+		if self.batch and self.batch.is_done():
+			self.batch = None
+
 		if self.batch is None:
-			clear_tmp()
+			if LoadTest.is_enabled(settings) and not self.is_looping:
+				# load tests run as a loop of stages. set up looping before creating
+				# the first batch, so that it already runs as the first stage.
+				self._is_looping = True
 
-			self.batch = Batch(self.machines, ilias_version, test, settings, workarounds, wait_time)
-			self.batch.configure(self.args)
-			self.batch.set_recycle_users(self.is_looping)
+			self.batch = self.create_batch(test, settings, workarounds, wait_time)
+			if self.batch is None:
+				return None
 
 			self.batch.start()
 
@@ -283,8 +472,11 @@ class TestsHandler(tornado.web.RequestHandler):
 	def initialize(self, state):
 		self.state = state
 
-	def get(self):
-		self.write(json.dumps(PackagedTest.list()))
+	def get(self, details=None):
+		if details:
+			self.write(json.dumps(catalog.details()))
+		else:
+			self.write(json.dumps(PackagedTest.list()))
 		self.flush()
 
 
@@ -346,10 +538,10 @@ class ScreenshotHandler(tornado.web.RequestHandler):
 				except:
 					print("screenshot on master failed.")
 			else:
-				machine_ip = self.state.machines[machine]
+				machine_address = self.state.machines[machine]
 
-				r = requests.get("http://%s:8888/screenshot/%s" %
-					(machine_ip, self.state.batch.get_id()), data={})
+				r = requests.get(machine_url(
+					machine_address, "screenshot", self.state.batch.get_id()), data={})
 				self.write(r.text)
 
 		self.finish()
@@ -388,6 +580,10 @@ class ResultsJsonHandler(tornado.web.RequestHandler):
 				data = db.get_coverage()
 			elif what == "performance":
 				data = db.get_performance_data()
+			elif what == "retries":
+				data = db.get_retry_data()
+			elif what == "load":
+				data = db.get_load_reports()
 			elif what == "longterm":
 				data = db.get_longterm_data()
 
@@ -413,6 +609,39 @@ class ResultsHandler(tornado.web.RequestHandler):
 		self.finish()
 
 
+class TraceHandler(tornado.web.RequestHandler):
+	def get(self, batch):
+		with open_results() as db:
+			spans = db.get_spans(batch)
+
+		if spans is None:
+			raise tornado.web.HTTPError(404)
+
+		self.set_header('Content-Type', 'application/json')
+		self.write(json.dumps(waterfall(spans)))
+		self.finish()
+
+
+class VerificationHandler(tornado.web.RequestHandler):
+	def get(self, batch):
+		with open_results() as db:
+			files = db.get_batch_files(batch)
+
+		if 'verification.json' not in files:
+			raise tornado.web.HTTPError(404)
+
+		self.set_header('Content-Type', 'application/json')
+		self.write(files['verification.json'])
+		self.finish()
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+	def get(self):
+		self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+		self.write(metrics.render())
+		self.finish()
+
+
 class DeleteResultsHandler(tornado.web.RequestHandler):
 	def get(self):
 		with open_results() as db:
@@ -483,11 +712,17 @@ def make_app(machines, args):
 		(r"/preferences.json", PreferencesHandler, dict(state=state)),
 
 		(r"/tests.json", TestsHandler, dict(state=state)),
+		(r"/tests-(?P<details>details).json", TestsHandler, dict(state=state)),
 		(r"/status.json", StatusHandler, dict(state=state)),
 		(r"/results-(.*?).json", ResultsJsonHandler),
 		(r"/result/(?P<batch>[^/]+)", ResultsHandler),
+		(r"/trace/(?P<batch>[^/]+).json", TraceHandler),
+		(r"/verification/(?P<batch>[^/]+).json", VerificationHandler),
 		(r"/delete-results", DeleteResultsHandler),
 		(r"/settings.json", SettingsHandler, dict(state=state)),
+		(r"/metrics", MetricsHandler),
+		(r"/debug/profile", ProfileHandler, dict(name="master")),
+		(r"/debug/threads", ThreadsHandler),
 
 		(r"/static/jquery/(.*)", tornado.web.StaticFileHandler, {
 			"path": node_modules + "jquery"}),
@@ -514,6 +749,7 @@ def run_master():
 			print('%s: %s' % (k, v))
 		else:
 			print('%s: ***' % k)
+	metrics.set_labels(machine="master")
 	with connect_machines() as machines:
 		expose_port = 8080
 		print("found %d machines." % len(machines))
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+from typing import Dict
+
+import sys
+import json
+import time
+import threading
+import traceback
+from collections import Counter
+
+import tornado.ioloop
+import tornado.web
+
+
+# a stack sampling profiler for diagnosing slow masters and machines while they
+# run. instead of tracing every call (like cProfile), we look at the stacks of
+# all threads every few milliseconds through sys._current_frames(), which keeps
+# the overhead low enough to use during production loops. stacks are collapsed
+# into "thread;frame;frame" lines (as consumed by flamegraph.pl) and can also be
+# rendered in speedscope's file format.
+
+max_seconds = 60
+min_interval = 0.001
+
+_busy = threading.Lock()
+
+
+def _describe_frame(frame):
+	code = frame.f_code
+	return "%s (%s:%d)" % (code.co_name, code.co_filename, code.co_firstlineno)
+
+
+def _thread_names():
+	return dict((t.ident, t.name) for t in threading.enumerate())
+
+
+def sample_stacks(seconds: float, interval: float = 0.01) -> Counter:
+	# samples all threads of this process except the sampling thread itself.
+	samples = Counter()
+	own_ident = threading.get_ident()
+	names = _thread_names()
+	t_end = time.time() + seconds
+
+	while time.time() < t_end:
+		for ident, frame in sys._current_frames().items():
+			if ident == own_ident:
+				continue
+
+			stack = []
+			while frame is not None:
+				stack.append(_describe_frame(frame))
+				frame = frame.f_back
+
+			if ident not in names:
+				names = _thread_names()
+			stack.append(names.get(ident, "thread %d" % ident))
+
+			samples[";".join(reversed(stack))] += 1
+
+		time.sleep(interval)
+
+	return samples
+
+
+def prefix_stacks(samples: Dict[str, int], prefix: str) -> Counter:
+	return Counter(dict(("%s;%s" % (prefix, stack), n) for stack, n in samples.items()))
+
+
+def collapsed(samples: Dict[str, int]) -> str:
+	return "\n".join("%s %d" % (stack, n) for stack, n in sorted(samples.items()))
+
+
+def speedscope(samples: Dict[str, int], name: str, interval: float) -> Dict:
+	frames = []
+	frame_index = dict()
+
+	def index(frame):
+		if frame not in frame_index:
+			frame_index[frame] = len(frames)
+			frames.append(dict(name=frame))
+		return frame_index[frame]
+
+	stacks = []
+	weights = []
+	for stack, n in sorted(samples.items()):
+		stacks.append([index(frame) for frame in stack.split(";")])
+		weights.append(n * interval)
+
+	return {
+		"$schema": "https://www.speedscope.app/file-format-schema.json",
+		"shared": dict(frames=frames),
+		"profiles": [dict(
+			type="sampled",
+			name=name,
+			unit="seconds",
+			startValue=0,
+			endValue=sum(weights),
+			samples=stacks,
+			weights=weights)],
+		"name": name,
+		"exporter": "tiltr"}
+
+
+def dump_threads() -> str:
+	names = _thread_names()
+	lines = []
+	for ident, frame in sys._current_frames().items():
+		lines.append("# %s (%d)" % (names.get(ident, "unknown"), ident))
+		lines.extend(line.rstrip() for line in traceback.format_stack(frame))
+		lines.append("")
+	return "\n".join(lines)
+
+
+class ProfileHandler(tornado.web.RequestHandler):
+	# GET /debug/profile?seconds=N[&interval=S][&format=collapsed|speedscope]
+
+	def initialize(self, name, sample=None):
+		self.name = name
+		# a function (seconds, interval) -> samples; defaults to this process.
+		self.sample = sample or sample_stacks
+
+	async def get(self):
+		seconds = min(max_seconds, max(0, float(self.get_argument("seconds", "5"))))
+		interval = max(min_interval, float(self.get_argument("interval", "0.01")))
+		format = self.get_argument("format", "collapsed")
+
+		if format not in ("collapsed", "speedscope"):
+			raise tornado.web.HTTPError(400)
+
+		# only one profile at a time, so that a stray reload cannot pile up samplers.
+		if not _busy.acquire(blocking=False):
+			raise tornado.web.HTTPError(409)
+
+		try:
+			samples = await tornado.ioloop.IOLoop.current().run_in_executor(
+				None, self.sample, seconds, interval)
+		finally:
+			_busy.release()
+
+		if format == "speedscope":
+			self.set_header("Content-Type", "application/json")
+			self.set_header("Content-Disposition", "attachment; filename=%s.speedscope.json" % self.name)
+			self.write(json.dumps(speedscope(samples, self.name, interval)))
+		else:
+			self.set_header("Content-Type", "text/plain; charset=utf-8")
+			self.write(collapsed(samples))
+
+		self.finish()
+
+
+class ThreadsHandler(tornado.web.RequestHandler):
+	def initialize(self, dump=None):
+		self.dump = dump or dump_threads
+
+	async def get(self):
+		# dumping may wait for runners, don't block the IOLoop (and monitor polls) meanwhile.
+		text = await tornado.ioloop.IOLoop.current().run_in_executor(None, self.dump)
+		self.set_header("Content-Type", "text/plain; charset=utf-8")
+		self.write(text)
+		self.finish()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+from typing import Callable, Dict, List
+
+import sys
+import json
+import time
+import argparse
+import random as rnd
+from decimal import Decimal
+
+from texttable import Texttable
+
+from tiltr.data.context import RegressionContext
+from tiltr.data.result import Result, Origin, MaybeDecimal
+from tiltr.data.settings import Settings, Workarounds
+from tiltr.driver.drivers import Marks, Mark
+
+from .questions.single_choice import SingleChoiceQuestion
+from .questions.multiple_choice import MultipleChoiceQuestion, MultipleChoiceItem
+from .questions.kprim import KPrimQuestion, KPrimScoring
+from .questions.cloze import ClozeQuestion, ClozeType
+from .questions.matching import MatchingQuestion, MatchingMultiplicity
+from . import synthetic
+
+
+# an offline benchmark of the scoring model, i.e. everything that decides what
+# score TiltR expects, without ILIAS or a browser. for synthetic questions of
+# increasing size, we time random answer generation, score computation, score
+# recomputation after a (simulated) readjustment and maximum scores; and we
+# time Result.check_against and Marks.lookup. timings can be saved as a JSON
+# baseline, and later runs compared against it to catch regressions early.
+
+language = "en"
+ilias_version = (6, 0, 0)
+
+
+def _score(question, answer, context) -> Decimal:
+	# the score for an answer as returned by get_random_answer().
+	if isinstance(question, SingleChoiceQuestion):
+		choice, _ = answer
+		return question.compute_score(dict((c, 1 if c == choice else 0) for c in question.choices.keys()), context)
+	elif isinstance(question, KPrimQuestion):
+		return question.compute_score_by_indices(answer[0])
+	elif isinstance(question, ClozeQuestion):
+		return question.compute_score_by_indices(answer[0], context)
+	else:
+		return question.compute_score(answer[0], context)
+
+
+def _readjust(question, random):
+	# what readjust_scores() does to a question's scoring, without the UI.
+	if isinstance(question, SingleChoiceQuestion):
+		for key, score in list(question.choices.items()):
+			question.choices[key] = max(Decimal(0), score + Decimal(random.randint(-8, 8)) / Decimal(4))
+	elif isinstance(question, MultipleChoiceQuestion):
+		for key, item in list(question.choices.items()):
+			question.choices[key] = MultipleChoiceItem(
+				item.checked_score + Decimal(random.randint(-4, 4)) / Decimal(4),
+				item.unchecked_score + Decimal(random.randint(-4, 4)) / Decimal(4))
+	elif isinstance(question, KPrimQuestion):
+		question.scoring = KPrimScoring(
+			halfpoints=not question.scoring.halfpoints,
+			score=Decimal(random.randint(1, 8)) / Decimal(4),
+			choices=question.scoring.choices)
+	elif isinstance(question, ClozeQuestion):
+		gaps = []
+		for gap in question.scoring.gaps:
+			if gap.cloze_type == ClozeType.numeric:
+				gaps.append(gap._replace(score=Decimal(random.randint(1, 8)) / Decimal(4)))
+			else:
+				gaps.append(gap._replace(options=dict(
+					(k, v + Decimal(random.randint(0, 4)) / Decimal(4)) for k, v in gap.options.items())))
+		question.scoring = question.scoring._replace(gaps=gaps)
+		question._create_gaps()
+	elif isinstance(question, MatchingQuestion):
+		for key, score in list(question.scores.items()):
+			question.scores[key] = score + Decimal(random.randint(-4, 4)) / Decimal(4)
+	question.invalidate_maximum_score()
+
+
+def _question_cases(random, scale: int) -> List:
+	n = 4 * scale
+	return [
+		("single_choice[%d]" % n, synthetic.random_single_choice("SC", random, n)),
+		("multiple_choice[%d]" % n, synthetic.random_multiple_choice("MC", random, n)),
+		("kprim", synthetic.random_kprim("KP", random)),
+		("cloze[%d]" % n, synthetic.random_cloze("CL", random, n)),
+		("matching_1:1[%d]" % n, synthetic.random_matching("MA", random, n, n, MatchingMultiplicity.ONE_TO_ONE)),
+		("matching_n:n[%d]" % n, synthetic.random_matching("MN", random, n, n, MatchingMultiplicity.MANY_TO_MANY))]
+
+
+def _synthetic_result(random, n_keys: int, origin: Origin) -> Result:
+	result = Result(origin=origin)
+	for i in range(n_keys):
+		result.add(Result.key("question", "Q%d" % (i // 8), "answer", "dimension %d" % (i % 8)), str(random.randint(0, 1)))
+	return result
+
+
+class Benchmark:
+	def __init__(self, n_answers: int, scales: List[int], seed: int = 0):
+		self.n_answers = n_answers
+		self.scales = scales
+		self.seed = seed
+		self.timings = dict()
+
+		self.settings = Settings()
+		self.workarounds = Workarounds()
+
+	def _context(self):
+		return RegressionContext(
+			self.seed, None, self.settings, self.workarounds, language, ilias_version)
+
+	def _time(self, name: str, n: int, f: Callable):
+		t0 = time.perf_counter()
+		f()
+		seconds = time.perf_counter() - t0
+		self.timings[name] = dict(n=n, seconds=seconds, per_second=n / seconds if seconds > 0 else 0)
+		print("%s: %d in %.3f s." % (name, n, seconds))
+		sys.stdout.flush()
+
+	def _run_question(self, name: str, question, context):
+		n = self.n_answers
+		answers = []
+
+		def generate():
+			for _ in range(n):
+				answers.append(question.get_random_answer(context))
+
+		def score():
+			for answer in answers:
+				_score(question, answer, context)
+
+		def readjust():
+			# like Run._apply_readjustment: new scores, new maximum, all users rescored.
+			_readjust(question, context.random)
+			question.get_maximum_score(context)
+			for answer in answers:
+				_score(question, answer, context)
+
+		def maximum_score():
+			for _ in range(max(1, n // 100)):
+				question.get_maximum_score(context)
+
+		self._time("%s/random_answer" % name, n, generate)
+		self._time("%s/score" % name, n, score)
+		self._time("%s/readjust" % name, n, readjust)
+		self._time("%s/maximum_score" % name, max(1, n // 100), maximum_score)
+
+	def _run_check_against(self, scale: int):
+		random = rnd.Random(self.seed)
+		n_keys = 100 * scale
+		recorded = _synthetic_result(random, n_keys, Origin.recorded)
+		exported = _synthetic_result(random, n_keys, Origin.exported)
+		n = max(1, self.n_answers // 1000)
+
+		def check():
+			for _ in range(n):
+				recorded.check_against(exported, lambda s: None, self.workarounds)
+
+		self._time("check_against[%d keys]" % n_keys, n, check)
+
+	def _run_marks(self):
+		random = rnd.Random(self.seed)
+		marks = Marks([Mark(level=Decimal(level), short=str(i), official=str(i)) for i, level in enumerate(range(0, 100, 5))])
+		percentages = [MaybeDecimal(Decimal(random.randint(0, 10000)) / Decimal(100)) for _ in range(self.n_answers)]
+
+		def lookup():
+			for p in percentages:
+				marks.lookup(p)
+
+		self._time("marks/lookup", len(percentages), lookup)
+
+	def run(self) -> Dict:
+		for scale in self.scales:
+			context = self._context()
+			for name, question in _question_cases(rnd.Random(self.seed), scale):
+				self._run_question(name, question, context)
+			self._run_check_against(scale)
+		self._run_marks()
+		return self.timings
+
+
+def compare(timings: Dict, baseline: Dict, tolerance: float) -> List[str]:
+	# cases that got slower than the baseline by more than tolerance (e.g. 0.2 = 20%).
+	regressions = []
+	for name, timing in sorted(timings.items()):
+		base = baseline.get(name)
+		if base is None or base["per_second"] <= 0:
+			continue
+		if timing["per_second"] < base["per_second"] * (1 - tolerance):
+			regressions.append("%s: %.1f/s, baseline %.1f/s" % (name, timing["per_second"], base["per_second"]))
+	return regressions
+
+
+def print_timings(timings: Dict, baseline: Dict = None):
+	table = Texttable()
+	table.set_deco(Texttable.HEADER)
+	table.set_cols_dtype(['t', 'i', 'f', 'f', 't'])
+	table.set_cols_width([40, 10, 10, 14, 10])
+	table.add_row(['case', 'n', 'seconds', 'per second', 'baseline'])
+	for name, timing in sorted(timings.items()):
+		base = (baseline or dict()).get(name)
+		table.add_row([
+			name, timing["n"], timing["seconds"], timing["per_second"],
+			"%+.0f%%" % (100 * (timing["per_second"] / base["per_second"] - 1)) if base and base["per_second"] > 0 else ""])
+	print(table.draw())
+
+
+def run_scoring_benchmark_cli():
+	parser = argparse.ArgumentParser(description="benchmark TiltR's scoring model offline.")
+	parser.add_argument('--benchmark-scoring', action='store_true')
+	parser.add_argument('--answers', type=int, default=10000, help="random answers per question case")
+	parser.add_argument('--scales', default="1,4,16", help="comma separated question size multipliers")
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--baseline', help="JSON file to compare against")
+	parser.add_argument('--save-baseline', help="write timings as new JSON baseline")
+	parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slow down before failing")
+	args = parser.parse_args()
+
+	timings = Benchmark(args.answers, [int(s) for s in args.scales.split(",")], args.seed).run()
+
+	baseline = None
+	if args.baseline:
+		with open(args.baseline, "r") as f:
+			baseline = json.loads(f.read())["timings"]
+
+	print_timings(timings, baseline)
+
+	if args.save_baseline:
+		with open(args.save_baseline, "w") as f:
+			f.write(json.dumps(dict(
+				answers=args.answers, scales=args.scales, seed=args.seed, timings=timings), indent=2))
+
+	if baseline is not None:
+		regressions = compare(timings, baseline, args.tolerance)
+		if regressions:
+			print("performance regressions:")
+			for regression in regressions:
+				print("  " + regression)
+			sys.exit(1)
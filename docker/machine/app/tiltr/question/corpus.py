@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+from typing import Dict, List, Tuple
+
+import json
+import zlib
+import base64
+import pickle
+
+from tiltr.data.context import RegressionContext
+from tiltr.data.exceptions import IntegrityException
+from tiltr.data.result import Result
+from tiltr.data.settings import Settings, Workarounds
+
+
+# a scoring corpus holds what machines answered in a run, together with the
+# score ILIAS exported for each of these answers (before any readjustments),
+# and everything needed to recompute these scores offline: the question
+# definitions, the exam configuration, settings, workarounds, language and
+# ILIAS version. runs store one in their files; see tiltr.question.fuzz.
+
+
+def _pickle(x) -> str:
+	return base64.b64encode(pickle.dumps(x, pickle.HIGHEST_PROTOCOL)).decode("utf-8")
+
+
+def _unpickle(data: str):
+	return pickle.loads(base64.b64decode(data.encode("utf-8")))
+
+
+class CaseResult:
+	# just enough of a Result for Question.compute_score_from_result().
+
+	def __init__(self, title: str, answers: Dict[Tuple, object]):
+		self.title = title
+		self.answers = answers
+
+	def get_question_answers(self, question_title: str) -> Dict[Tuple, object]:
+		return self.answers if question_title == self.title else dict()
+
+
+class ScoreCorpus:
+	version = 1
+	filename = "scoring_corpus.json.z"
+
+	def __init__(
+			self, questions: str, exam_configuration: str, settings: Dict, workarounds: Dict,
+			language: str, ilias_version: List[int], cases: List = None):
+
+		self.questions_data = questions
+		self.exam_configuration_data = exam_configuration
+		self.settings = settings
+		self.workarounds = workarounds
+		self.language = language
+		self.ilias_version = tuple(ilias_version)
+		self.cases = cases or []  # (question title, [[dimensions, value], ...], ILIAS score)
+
+		self._questions = None
+		self._exam_configuration = None
+
+	@staticmethod
+	def create(questions, exam_configuration, settings, workarounds, language, ilias_version) -> 'ScoreCorpus':
+		# questions are pickled right away, since readjustments modify them later on.
+		return ScoreCorpus(
+			_pickle(questions), _pickle(exam_configuration), settings.to_dict(), workarounds.to_dict(),
+			language, list(ilias_version))
+
+	@property
+	def questions(self) -> Dict:
+		if self._questions is None:
+			self._questions = _unpickle(self.questions_data)
+		return self._questions
+
+	@property
+	def exam_configuration(self):
+		if self._exam_configuration is None:
+			self._exam_configuration = _unpickle(self.exam_configuration_data)
+		return self._exam_configuration
+
+	def create_context(self, seed) -> RegressionContext:
+		return RegressionContext(
+			seed, None, Settings(from_dict=self.settings), Workarounds(from_dict=self.workarounds),
+			self.language, self.ilias_version)
+
+	def add_result(self, recorded_result: Result, ilias_result: Result):
+		for title in self.questions.keys():
+			score = ilias_result.properties.get(next(Result.reached_score_keys(title)))
+			if score is None:
+				continue
+			answers = recorded_result.get_question_answers(title)
+			self.cases.append((title, [[list(d), v] for d, v in answers.items()], str(score)))
+
+	def get_case(self, index: int) -> Tuple[str, Dict[Tuple, object], str]:
+		title, answers, score = self.cases[index]
+		return title, dict((tuple(d), v) for d, v in answers), score
+
+	def expected_score(self, title: str, answers: Dict[Tuple, object], context):
+		# the score TiltR expects for the given answers, as after a readjustment.
+		score = self.questions[title].compute_score_from_result(CaseResult(title, answers), context)
+		if self.exam_configuration is not None:
+			score = self.exam_configuration.clip_answer_score(score)
+		return score
+
+	def to_bytes(self) -> bytes:
+		return zlib.compress(json.dumps(dict(
+			version=ScoreCorpus.version,
+			questions=self.questions_data,
+			exam_configuration=self.exam_configuration_data,
+			settings=self.settings,
+			workarounds=self.workarounds,
+			language=self.language,
+			ilias_version=list(self.ilias_version),
+			cases=self.cases)).encode("utf8"), 9)
+
+	@staticmethod
+	def from_bytes(data: bytes) -> 'ScoreCorpus':
+		data = json.loads(zlib.decompress(data).decode("utf8"))
+		if data["version"] != ScoreCorpus.version:
+			raise IntegrityException("unsupported scoring corpus version %s." % data["version"])
+		return ScoreCorpus(
+			data["questions"], data["exam_configuration"], data["settings"], data["workarounds"],
+			data["language"], data["ilias_version"], data["cases"])
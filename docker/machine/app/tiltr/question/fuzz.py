@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+from typing import Dict, List
+
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import traceback
+import random as rnd
+from decimal import Decimal
+from multiprocessing import Pool
+
+from tiltr.data.result import MaybeDecimal, open_results
+from tiltr.question.coverage import Coverage
+
+from .corpus import ScoreCorpus
+from .benchmark import _score
+
+
+# offline fuzzing of TiltR's scoring model. checking scores against ILIAS
+# takes a full Selenium exam, i.e. about one data point per user and minute.
+# here we check thousands of cases per second, without ILIAS or a browser:
+#
+# corpus: every run stores a scoring corpus (see tiltr.question.corpus) with
+# the answers its machines gave and the scores ILIAS exported for them. we
+# recompute all these scores with the current scoring model.
+#
+# random: for answers from get_random_answer() there is no ILIAS score, so we
+# check what must hold regardless: scoring does not fail, the score matches
+# the one get_random_answer() expects, it does not exceed the maximum score,
+# cached maximum scores match recomputed ones, and a pickled copy of the
+# question (as sent to machines) scores the same. failing answers are shrunk
+# to minimal ones.
+#
+# all checks run in worker processes, each with its own copy of the corpus.
+
+_eps = Decimal("0.01")
+_max_shrink_steps = 1000
+
+_worker = None
+
+
+def _is_close(a, b) -> bool:
+	a = MaybeDecimal(a)
+	b = MaybeDecimal(b)
+	return a.valid() and b.valid() and abs(a.to_decimal() - b.to_decimal()) <= _eps
+
+
+def _smaller(answer):
+	# candidates for a smaller version of an answer as returned by get_random_answer().
+	if isinstance(answer, str):
+		if len(answer) > 1:
+			yield answer[:len(answer) // 2]
+			yield answer[len(answer) // 2:]
+		for i in range(len(answer)):
+			yield answer[:i] + answer[i + 1:]
+	elif isinstance(answer, dict):
+		for k in list(answer.keys()):
+			smaller = dict(answer)
+			del smaller[k]
+			yield smaller
+		for k, v in list(answer.items()):
+			for w in _smaller(v):
+				smaller = dict(answer)
+				smaller[k] = w
+				yield smaller
+	elif isinstance(answer, (set, frozenset)):
+		for x in answer:
+			yield answer - set([x])
+	elif isinstance(answer, bool):
+		if answer:
+			yield False
+
+
+def _describe(answer):
+	# a JSON friendly version of an answer.
+	if isinstance(answer, dict):
+		return dict((str(k), _describe(v)) for k, v in answer.items())
+	elif isinstance(answer, (set, frozenset)):
+		return sorted(_describe(x) for x in answer)
+	elif isinstance(answer, (str, bool, int)) or answer is None:
+		return answer
+	else:
+		return str(answer)
+
+
+def _answer_size(answers: Dict) -> tuple:
+	return (sum(1 for v in answers.values() if v), sum(len(str(v)) for v in answers.values()))
+
+
+class _Worker:
+	def __init__(self, corpus: ScoreCorpus):
+		self.corpus = corpus
+		self.questions = corpus.questions
+		self.context = corpus.create_context(0)
+		# what machines get: a pickled copy of each question.
+		self.copies = pickle.loads(pickle.dumps(self.questions, pickle.HIGHEST_PROTOCOL))
+
+	def check_cases(self, indices: List[int]) -> List[Dict]:
+		mismatches = []
+		for index in indices:
+			title, answers, ilias_score = self.corpus.get_case(index)
+			try:
+				expected = self.corpus.expected_score(title, answers, self.context)
+			except Exception:
+				mismatches.append(dict(case=index, question=title, error=traceback.format_exc()))
+				continue
+			if not _is_close(expected, ilias_score):
+				mismatches.append(dict(case=index, question=title, expected=str(expected), ilias=ilias_score))
+		return mismatches
+
+	def violations(self, title: str, answer, expected=None) -> List[tuple]:
+		question = self.questions[title]
+		try:
+			score = _score(question, (answer, None), self.context)
+			copy_score = _score(self.copies[title], (answer, None), self.context)
+		except Exception as e:
+			return [("error", "scoring failed: %s" % repr(e))]
+
+		found = []
+		if expected is not None and score != expected:
+			found.append(("expected", "score %s differs from expected score %s" % (score, expected)))
+		maximum_score = question.get_maximum_score(self.context)
+		if score > maximum_score:
+			found.append(("maximum", "score %s exceeds maximum score %s" % (score, maximum_score)))
+		if copy_score != score:
+			found.append(("pickled", "pickled question scores %s instead of %s" % (copy_score, score)))
+		return found
+
+	def shrink(self, title: str, answer, kind: str):
+		steps = 0
+		progress = True
+		while progress and steps < _max_shrink_steps:
+			progress = False
+			for candidate in _smaller(answer):
+				steps += 1
+				if any(k == kind for k, _ in self.violations(title, candidate)):
+					answer = candidate
+					progress = True
+					break
+		return answer
+
+	def fuzz(self, title: str, seed: int, n: int) -> Dict:
+		context = self.corpus.create_context(seed)
+		question = self.questions[title]
+		failures = []
+		errors = []
+		checked = 0
+
+		if question.get_maximum_score(context) != question.compute_maximum_score(context):
+			failures.append(dict(
+				question=title, kind="maximum", message="cached maximum score differs from recomputed one"))
+
+		for _ in range(n):
+			try:
+				answer = question.get_random_answer(context)
+			except Exception:
+				errors.append(dict(question=title, error=traceback.format_exc()))
+				break  # no point in trying again.
+
+			checked += 1
+			found = self.violations(title, answer[0], answer[-1])
+			if found:
+				kind, message = found[0]
+				failures.append(dict(
+					question=title, kind=kind, message=message,
+					answer=_describe(answer[0]),
+					shrunk=_describe(self.shrink(title, answer[0], kind))))
+
+		return dict(question=title, checked=checked, failures=failures, errors=errors)
+
+
+def _init_worker(corpus_data: bytes):
+	global _worker
+	_worker = _Worker(ScoreCorpus.from_bytes(corpus_data))
+
+
+def _check_cases(indices: List[int]) -> List[Dict]:
+	return _worker.check_cases(indices)
+
+
+def _fuzz_question(args) -> Dict:
+	return _worker.fuzz(*args)
+
+
+def corpus_coverage(corpus: ScoreCorpus) -> Coverage:
+	coverage = Coverage(corpus.questions, corpus.create_context(0))
+	for index in range(len(corpus.cases)):
+		title, answers, _ = corpus.get_case(index)
+		corpus.questions[title].add_export_coverage(
+			coverage, dict((d[0], v) for d, v in answers.items()), corpus.language)
+	return coverage
+
+
+def fuzz(corpus: ScoreCorpus, workers: int, n_random: int, seed: int = 0, chunk_size: int = 1000) -> Dict:
+	random = rnd.Random(seed)
+	n_cases = len(corpus.cases)
+
+	with Pool(workers, initializer=_init_worker, initargs=(corpus.to_bytes(), )) as pool:
+		t0 = time.time()
+		chunks = [list(range(i, min(i + chunk_size, n_cases))) for i in range(0, n_cases, chunk_size)]
+		mismatches = [m for chunk in pool.imap_unordered(_check_cases, chunks) for m in chunk]
+		corpus_seconds = time.time() - t0
+
+		t0 = time.time()
+		tasks = []
+		for title in sorted(corpus.questions.keys()):
+			for i in range(0, n_random, chunk_size):
+				tasks.append((title, random.getrandbits(32), min(chunk_size, n_random - i)))
+		fuzzed = pool.map(_fuzz_question, tasks)
+		random_seconds = time.time() - t0
+
+	# keep the smallest failing case for each question and kind of failure.
+	minimal = dict()
+	for mismatch in mismatches:
+		key = (mismatch["question"], "error" if "error" in mismatch else "mismatch")
+		title, answers, _ = corpus.get_case(mismatch["case"])
+		if key not in minimal or _answer_size(answers) < minimal[key][0]:
+			minimal[key] = (_answer_size(answers), dict(mismatch, answers=[
+				[list(d), _describe(v)] for d, v in answers.items()]))
+
+	failures = dict()
+	for f in (f for r in fuzzed for f in r["failures"]):
+		key = (f["question"], f["kind"])
+		size = len(json.dumps(f.get("shrunk")))
+		if key not in failures or size < failures[key][0]:
+			failures[key] = (size, f)
+
+	n_random_checked = sum(r["checked"] for r in fuzzed)
+	coverage = corpus_coverage(corpus)
+
+	return dict(
+		cases=n_cases,
+		cases_per_second=n_cases / corpus_seconds if corpus_seconds > 0 else 0,
+		mismatches=len(mismatches),
+		minimal_mismatches=[v for _, v in sorted(minimal.values(), key=lambda x: x[1]["question"])],
+		random=n_random_checked,
+		random_per_second=n_random_checked / random_seconds if random_seconds > 0 else 0,
+		failures=sum(len(r["failures"]) for r in fuzzed),
+		minimal_failures=[v for _, v in sorted(failures.values(), key=lambda x: x[1]["question"])],
+		errors=[e for r in fuzzed for e in r["errors"]],
+		coverage=coverage.get_percentage())
+
+
+def print_report(name: str, report: Dict):
+	print("%s: %d corpus cases (%.0f/s), %d mismatches; %d random answers (%.0f/s), %d failures; coverage %.1f%%." % (
+		name, report["cases"], report["cases_per_second"], report["mismatches"],
+		report["random"], report["random_per_second"], report["failures"], report["coverage"]))
+
+	for mismatch in report["minimal_mismatches"]:
+		if "error" in mismatch:
+			print("  [%s] scoring failed for %s:" % (mismatch["question"], json.dumps(mismatch["answers"])))
+			print(mismatch["error"])
+		else:
+			print("  [%s] TiltR expects %s, ILIAS gave %s for %s" % (
+				mismatch["question"], mismatch["expected"], mismatch["ilias"], json.dumps(mismatch["answers"])))
+
+	for failure in report["minimal_failures"]:
+		print("  [%s] %s" % (failure["question"], failure["message"]))
+		if "shrunk" in failure:
+			print("    minimal answer: %s" % json.dumps(failure["shrunk"]))
+
+	for error in report["errors"]:
+		print("  [%s] random answer generation failed:" % error["question"])
+		print(error["error"])
+
+
+def _load_corpora(batches: List[str], paths: List[str]) -> List:
+	corpora = []
+	if batches:
+		with open_results() as db:
+			for batch_id in batches:
+				data = db.get_batch_files(batch_id).get(ScoreCorpus.filename)
+				if data is None:
+					print("batch %s has no scoring corpus, skipping." % batch_id)
+					continue
+				corpora.append((batch_id, ScoreCorpus.from_bytes(data)))
+	for path in paths:
+		with open(path, "rb") as f:
+			corpora.append((path, ScoreCorpus.from_bytes(f.read())))
+	return corpora
+
+
+def run_fuzz_cli():
+	parser = argparse.ArgumentParser(description="fuzz TiltR's scoring model offline.")
+	parser.add_argument('--fuzz-scoring', action='store_true')
+	parser.add_argument('--batch', action='append', default=[], help="batch in the results database to take the corpus from")
+	parser.add_argument('--corpus', action='append', default=[], help="scoring corpus file")
+	parser.add_argument('--workers', type=int, default=os.cpu_count())
+	parser.add_argument('--random', type=int, default=10000, help="random answers per question")
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--output', help="write the reports as JSON to this file")
+	args = parser.parse_args()
+
+	corpora = _load_corpora(args.batch, args.corpus)
+	if not corpora:
+		print("no scoring corpus given.")
+		sys.exit(1)
+
+	reports = dict()
+	for name, corpus in corpora:
+		reports[name] = fuzz(corpus, args.workers, args.random, args.seed)
+		print_report(name, reports[name])
+
+	if args.output:
+		with open(args.output, "w") as f:
+			f.write(json.dumps(reports, indent=2))
+
+	if any(r["mismatches"] or r["failures"] or r["errors"] for r in reports.values()):
+		sys.exit(1)
@@ -942,7 +942,7 @@ class ClozeQuestion(Question):
 		self.scoring = self._get_ui(driver)
 		self._create_gaps()
 
-	def get_maximum_score(self, context: 'TestContext'):
+	def compute_maximum_score(self, context: 'TestContext'):
 		return sum([gap.get_maximum_score() for gap in self.gaps.values()])
 
 	def create_answer(self, driver, *args):
@@ -1013,7 +1013,7 @@ class ClozeQuestion(Question):
 			else:
 				return answers, valid, self.compute_score_by_indices(answers, context)
 
-	def readjust_scores(self, driver, actual_answers: Dict[str, str], context: 'TestContext', report):
+	def _readjust_scores(self, driver, actual_answers: Dict[str, str], context: 'TestContext', report):
 		def random_flip_scoring(f):
 			if context.ilias_version >= (5, 4):
 				return f  # never flip
@@ -17,7 +17,7 @@ class CodeQuestion(Question):
 		super().__init__(title)
 		self.length = int(settings.max_long_text_length)
 
-	def get_maximum_score(self, context):
+	def compute_maximum_score(self, context):
 		return Decimal(0)
 
 	def create_answer(self, driver, *args):
@@ -34,7 +34,7 @@ class CodeQuestion(Question):
 		text = context.produce_text(self.length, context.long_text_random_chars)
 		return text, self.compute_score(text, context)
 
-	def readjust_scores(self, driver, actual_answers, context, report):
+	def _readjust_scores(self, driver, actual_answers, context, report):
 		return False, list()
 
 	def compute_score(self, answers: Dict[str, Decimal], context: 'TestContext'):
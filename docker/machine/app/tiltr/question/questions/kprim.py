@@ -106,7 +106,7 @@ class KPrimQuestion(Question):
 		super().__init__(title)
 		self.scoring = KPrimQuestion._get_ui(driver)
 
-	def get_maximum_score(self, context):
+	def compute_maximum_score(self, context):
 		return self.scoring.score
 
 	def create_answer(self, driver, *args):
@@ -159,7 +159,7 @@ class KPrimQuestion(Question):
 		answers = [context.random.random() < 0.5 for _ in range(4)]
 		return answers, self.compute_score_by_indices(answers)
 
-	def readjust_scores(self, driver, actual_answers, context, report):
+	def _readjust_scores(self, driver, actual_answers, context, report):
 		random = context.random
 
 		def random_flip(f):
@@ -35,7 +35,7 @@ class LongTextQuestion(Question):
 		self.length = int(settings.max_long_text_length)
 		self._maximum_score = LongTextQuestion._get_ui(driver)
 
-	def get_maximum_score(self, context):
+	def compute_maximum_score(self, context):
 		return self._maximum_score
 
 	def create_answer(self, driver, *args):
@@ -61,7 +61,7 @@ class LongTextQuestion(Question):
 		text = context.produce_text(self.length, context.long_text_random_chars)
 		return text, self.compute_score(text, context)
 
-	def readjust_scores(self, driver, actual_answers, context, report):
+	def _readjust_scores(self, driver, actual_answers, context, report):
 		maximum_score = Decimal(context.random.randint(1, 100)) / Decimal(10)
 		self._set_ui(driver, maximum_score)
 		self._maximum_score = maximum_score
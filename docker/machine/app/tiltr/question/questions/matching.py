@@ -234,9 +234,14 @@ class MatchingQuestion(Question):
 		self.terms = self._ui_get_items(driver, 'terms')
 		self.scores = self._ui_get_scores(driver)
 
-	def get_maximum_score(self, context):
+	def compute_maximum_score(self, context):
 		return _compute_maximum_score(self.scores, self.multiplicity, context)
 
+	def _maximum_score_key(self, context):
+		if self.scores and self.multiplicity == MatchingMultiplicity.ONE_TO_ONE:
+			return bool(context.workarounds.allow_unreachable_max_scores)
+		return None
+
 	def explain_maximum_score(self, context, report):
 		def explain(d, t, score):
 			report('(%s, %s) -> %s' % (self.definitions[d], self.terms[t], score))
@@ -286,7 +291,7 @@ class MatchingQuestion(Question):
 
 		return answers, self.compute_score(answers, context)
 
-	def readjust_scores(self, driver, actual_answers, context: 'TestContext', report):
+	def _readjust_scores(self, driver, actual_answers, context: 'TestContext', report):
 		if context.workarounds.dont_readjust_matching:
 			return False, list()
 
@@ -390,11 +395,8 @@ class MatchingQuestion(Question):
 		term_ids = dict((label, i) for i, label in self.terms.items())
 
 		answers = defaultdict(set)
-		for key, value in result.properties.items():
-			if key[0] == "question" and key[1] == self.title and key[2] == "answer":
-				definition_label = key[3]
-				term_label = key[4]
-				answers[definition_ids[definition_label]].add(term_ids[term_label])
+		for (definition_label, term_label), value in result.get_question_answers(self.title).items():
+			answers[definition_ids[definition_label]].add(term_ids[term_label])
 
 		return self.compute_score(answers, context)
 
@@ -110,7 +110,7 @@ class MultipleChoiceQuestion(Question):
 		super().__init__(title)
 		self.choices = self._get_ui(driver)
 
-	def get_maximum_score(self, context: 'TestContext') -> Decimal:
+	def compute_maximum_score(self, context: 'TestContext') -> Decimal:
 		def max_values():
 			for item in self.choices.values():
 				yield max(item.checked_score, item.unchecked_score)
@@ -175,7 +175,7 @@ class MultipleChoiceQuestion(Question):
 
 		return answers, self.compute_score(answers, context)
 
-	def readjust_scores(self, driver, actual_answers, context: 'TestContext', report) -> Tuple[bool, List]:
+	def _readjust_scores(self, driver, actual_answers, context: 'TestContext', report) -> Tuple[bool, List]:
 		choices = self.choices
 
 		if False:
@@ -22,7 +22,7 @@ class PaintQuestion(Question):
 		self._maximum_score = Decimal(
 			driver.find_element_by_css_selector('input[name="points"]').get_attribute('value'))
 
-	def get_maximum_score(self, context):
+	def compute_maximum_score(self, context):
 		return self._maximum_score
 
 	def create_answer(self, driver, *args):
@@ -38,7 +38,7 @@ class PaintQuestion(Question):
 	def get_random_answer(self, context):
 		return context.random.randint(1, 255), Decimal(0)
 
-	def readjust_scores(self, driver, actual_answers, context, report):
+	def _readjust_scores(self, driver, actual_answers, context, report):
 		return False, list()
 
 	def compute_score(self, answers: Dict[str, Decimal], context: 'TestContext'):
@@ -12,8 +12,22 @@ import selenium
 
 
 class Question:
+	# maximum scores are cached per question (they are asked for per answer, per
+	# user and per question, and e.g. matching questions need to solve an
+	# assignment problem for them). bump this whenever the way maximum scores are
+	# computed changes, so that caches pickled by older versions get dropped.
+	score_model_version = 1
+
 	def __init__(self, title: str):
 		self.title = title
+		self._maximum_scores = dict()
+		self._score_model_version = Question.score_model_version
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		if state.get("_score_model_version") != Question.score_model_version:
+			self._maximum_scores = dict()
+			self._score_model_version = Question.score_model_version
 
 	def create_answer(self, driver: selenium.webdriver.Remote, *args) -> 'Answer':
 		raise NotImplementedError()
@@ -28,23 +42,43 @@ class Question:
 		raise NotImplementedError()
 
 	def readjust_scores(self, driver, actual_answers, context: 'TestContext', report):
+		try:
+			return self._readjust_scores(driver, actual_answers, context, report)
+		finally:
+			self.invalidate_maximum_score()
+
+	def _readjust_scores(self, driver, actual_answers, context: 'TestContext', report):
 		raise NotImplementedError()
 
 	def compute_score(self, answers, context: 'TestContext'):
 		raise NotImplementedError()
 
-	def get_maximum_score(self, context: 'TestContext'):
+	def compute_maximum_score(self, context: 'TestContext'):
 		return Decimal(0)
 
+	def _maximum_score_key(self, context: 'TestContext'):
+		# everything besides the question's own scores the maximum score depends on.
+		return None
+
+	def get_maximum_score(self, context: 'TestContext'):
+		key = self._maximum_score_key(context)
+		score = self._maximum_scores.get(key)
+		if score is None:
+			score = self.compute_maximum_score(context)
+			self._maximum_scores[key] = score
+		return score
+
+	def invalidate_maximum_score(self):
+		# needs to be called whenever scores change.
+		self._maximum_scores = dict()
+
 	def explain_maximum_score(self, context: 'TestContext', report):
 		pass
 
 	def compute_score_from_result(self, result, context: 'TestContext'):
 		answers = dict()
-		for key, value in result.properties.items():
-			if key[0] == "question" and key[1] == self.title and key[2] == "answer":
-				dimension = key[3]
-				answers[dimension] = value
+		for dimension, value in result.get_question_answers(self.title).items():
+			answers[dimension[0]] = value
 		return self.compute_score(answers, context)
 
 	def has_xls_score(self):
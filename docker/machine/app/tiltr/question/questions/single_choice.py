@@ -70,7 +70,7 @@ class SingleChoiceQuestion(Question):
 		super().__init__(title)
 		self.choices = self._get_ui(driver)
 
-	def get_maximum_score(self, context: 'TestContext') -> Decimal:
+	def compute_maximum_score(self, context: 'TestContext') -> Decimal:
 		return max(self.choices.values())
 
 	def create_answer(self, driver, *args) -> 'Answer':
@@ -92,7 +92,7 @@ class SingleChoiceQuestion(Question):
 		choice = context.random.choice(list(self.choices.keys()))
 		return choice, self.choices[choice]
 
-	def readjust_scores(self, driver, actual_answers, context: 'TestContext', report) -> Tuple[bool, List]:
+	def _readjust_scores(self, driver, actual_answers, context: 'TestContext', report) -> Tuple[bool, List]:
 		choices = self.choices
 
 		if False:
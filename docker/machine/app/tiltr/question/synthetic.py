@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+from typing import Dict
+from decimal import Decimal
+
+from .questions.question import Question
+from .questions.single_choice import SingleChoiceQuestion
+from .questions.multiple_choice import MultipleChoiceQuestion, MultipleChoiceItem
+from .questions.kprim import KPrimQuestion, KPrimScoring, KPrimChoice
+from .questions.cloze import ClozeQuestion, ClozeScoring, ClozeType, ClozeComparator
+from .questions.cloze import TextualGapScoring, NumericGapScoring
+from .questions.matching import MatchingQuestion, MatchingMultiplicity
+
+
+# synthetic questions for benchmarks and fake servers. real questions read
+# their definitions from the ILIAS UI in their constructors; these are built
+# from given (usually random) definitions instead, without any driver.
+
+
+def _create(cls, title: str, **fields) -> Question:
+	question = cls.__new__(cls)
+	Question.__init__(question, title)
+	for k, v in fields.items():
+		setattr(question, k, v)
+	return question
+
+
+def _random_score(random) -> Decimal:
+	return Decimal(random.randint(0, 8)) / Decimal(4)
+
+
+def single_choice(title: str, choices: Dict[str, Decimal]) -> SingleChoiceQuestion:
+	return _create(SingleChoiceQuestion, title, choices=choices)
+
+
+def random_single_choice(title: str, random, n_choices: int = 4) -> SingleChoiceQuestion:
+	return single_choice(title, dict(
+		("Choice %d" % (i + 1), _random_score(random)) for i in range(n_choices)))
+
+
+def random_multiple_choice(title: str, random, n_choices: int = 4) -> MultipleChoiceQuestion:
+	return _create(MultipleChoiceQuestion, title, choices=dict(
+		("Choice %d" % (i + 1), MultipleChoiceItem(_random_score(random), -_random_score(random)))
+		for i in range(n_choices)))
+
+
+def random_kprim(title: str, random) -> KPrimQuestion:
+	return _create(KPrimQuestion, title, scoring=KPrimScoring(
+		halfpoints=random.random() < 0.5,
+		score=Decimal(random.randint(1, 8)) / Decimal(4),
+		choices=[KPrimChoice("Statement %d" % (i + 1), random.random() < 0.5) for i in range(4)]))
+
+
+def random_cloze(title: str, random, n_gaps: int = 4, n_options: int = 3) -> ClozeQuestion:
+	gaps = []
+	for i in range(n_gaps):
+		cloze_type = random.choice(list(ClozeType))
+		if cloze_type == ClozeType.numeric:
+			value = Decimal(random.randint(-100, 100))
+			gaps.append(NumericGapScoring(
+				cloze_type=cloze_type, value=value, lower=value - 1, upper=value + 1,
+				score=Decimal(random.randint(1, 8)) / Decimal(4)))
+		else:
+			options = dict(("option%d%d" % (i, j), _random_score(random) + Decimal(1) / Decimal(4)) for j in range(n_options))
+			gaps.append(TextualGapScoring(
+				cloze_type=cloze_type, size=None if cloze_type == ClozeType.select else 12, options=options))
+
+	question = _create(ClozeQuestion, title, scoring=ClozeScoring(
+		identical_scoring=random.random() < 0.5,
+		comparator=random.choice(list(ClozeComparator)),
+		gaps=gaps))
+	question._create_gaps()
+	return question
+
+
+def random_matching(
+		title: str, random, n_definitions: int = 4, n_terms: int = 4,
+		multiplicity: MatchingMultiplicity = MatchingMultiplicity.ONE_TO_ONE) -> MatchingQuestion:
+
+	definitions = dict((i, "Definition %d" % (i + 1)) for i in range(n_definitions))
+	terms = dict((i, "Term %d" % (i + 1)) for i in range(n_terms))
+
+	scores = dict()
+	for d in definitions.keys():
+		for t in random.sample(list(terms.keys()), random.randint(1, n_terms)):
+			scores[(d, t)] = Decimal(random.randint(-4, 8)) / Decimal(4)
+
+	return _create(
+		MatchingQuestion, title,
+		multiplicity=multiplicity, definitions=definitions, terms=terms, scores=scores)